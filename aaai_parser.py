@@ -1,49 +1,167 @@
-import pdfplumber
+import hashlib
 import logging
+import os
 import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
 
-logging.basicConfig(level=logging.DEBUG, filename='parser.log', filemode='w',
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Page header ("AAAI-24: Main Track" / "ID Title Authors") and the page number footer
+HEADER_RE = re.compile(r'^(AAAI-\d+:.*|ID Title Authors)$')
+PAGE_NUMBER_RE = re.compile(r'^\d+$')
+ENTRY_START_RE = re.compile(r'^\d+\s')  # New entry starts
+ID_RE = re.compile(r'^(\d+)')
+
+# Pages extracted per worker task; small enough that pages stream out early
+PAGES_PER_TASK = 4
+
+def enable_debug_log(path='parser.log'):
+    '''Opt-in detailed file logging of the parse (off by default, as it slows large PDFs down).'''
+    handler = logging.FileHandler(path, mode='w')
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+
+def extract_page_texts(pdf_path, page_numbers):
+    '''Extracts the text of the given pages. Runs in worker processes, so it opens the PDF itself.'''
+    import pdfplumber
+
+    with pdfplumber.open(pdf_path) as pdf:
+        texts = []
+        for page_number in page_numbers:
+            logger.debug('Processing page %d', page_number + 1)
+            texts.append(pdf.pages[page_number].extract_text())
+        return texts
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class PageTextCache:
+    '''SQLite cache of extracted page text keyed by (PDF hash, page number).
+
+    Text extraction is the expensive step, so caching it lets re-runs and
+    changes to the entry parsing skip pdfplumber for unchanged pages.
+    '''
+    def __init__(self, path='aaai_page_cache.sqlite'):
+        self.db = sqlite3.connect(path)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS pages (
+            pdf_hash TEXT, page INTEGER, text TEXT, PRIMARY KEY (pdf_hash, page))''')
+        self.db.commit()
+
+    def get(self, pdf_hash):
+        rows = self.db.execute('SELECT page, text FROM pages WHERE pdf_hash = ?', (pdf_hash,))
+        return dict(rows.fetchall())
+
+    def put(self, pdf_hash, texts):
+        self.db.executemany('INSERT OR REPLACE INTO pages VALUES (?, ?, ?)',
+                            ((pdf_hash, page, text) for page, text in texts.items()))
+        self.db.commit()
 
 class AAAIParser:
-    def __init__(self):
-        pass
+    def __init__(self, workers=None, cache=None):
+        # Number of processes used for text extraction (all cores by default)
+        self.workers = workers or os.cpu_count() or 1
+        self.cache = cache
 
-    def get_publications(self, pdf_path):
-        publications = []
+    def iter_page_texts(self, pdf_path):
+        '''Yields the text of every page in order, extracting uncached pages in parallel.'''
+        # pdfplumber (and pdfminer) take a while to import; only load them to read a PDF
+        import pdfplumber
+
+        pdf_hash = file_hash(pdf_path) if self.cache is not None else None
+        texts = self.cache.get(pdf_hash) if self.cache is not None else {}
         with pdfplumber.open(pdf_path) as pdf:
-            for page_number, page in enumerate(pdf.pages):
-                logging.info(f'Processing page {page_number + 1}')
-                text = page.extract_text()
-                if text:
-                    page_publications = self.extract_publications_from_page(text)
-                    publications.extend(page_publications)
-        logging.info('Completed parsing PDF')
-        return publications
+            num_pages = len(pdf.pages)
+        missing = [page for page in range(num_pages) if page not in texts]
+        logger.info('Extracting %d pages (%d from cache)', num_pages, num_pages - len(missing))
+        metrics.counter('pdf_pages_total', source='cache').inc(num_pages - len(missing))
+        metrics.counter('pdf_pages_total', source='extracted').inc(len(missing))
 
-    def extract_publications_from_page(self, text):
-        # Parse the page to get entries
-        return self.parse_entries(text)
+        # Small contiguous page ranges, each extracted by a worker that opens the PDF once
+        tasks = [missing[start:start + PAGES_PER_TASK] for start in range(0, len(missing), PAGES_PER_TASK)]
+        executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 and len(tasks) > 1 else None
+        try:
+            if executor is not None:
+                extracted = executor.map(extract_page_texts, [pdf_path] * len(tasks), tasks)
+            else:
+                extracted = (extract_page_texts(pdf_path, pages) for pages in tasks)
+            extracted = iter(zip(tasks, extracted))
 
-    def parse_entries(self, text):
-        entries = []
+            for page in range(num_pages):
+                # Results arrive in page order, so wait for the task holding this page only when needed
+                while page not in texts:
+                    # Extraction runs in worker processes; this is how long the parse waits for it
+                    with metrics.timer('stage_seconds', stage='pdf_extract_wait'):
+                        pages, page_texts = next(extracted)
+                    new_texts = dict(zip(pages, page_texts))
+                    texts.update(new_texts)
+                    if self.cache is not None:
+                        self.cache.put(pdf_hash, new_texts)
+                yield texts.pop(page)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+    def get_page_texts(self, pdf_path):
+        return list(self.iter_page_texts(pdf_path))
+
+    def iter_publications(self, pdf_path):
+        '''Yields entries as soon as their pages have been extracted.'''
+        count = 0
+        for entry in self.iter_entries(self.iter_page_texts(pdf_path)):
+            count += 1
+            yield entry
+        logger.info('Completed parsing PDF: %d entries', count)
+
+    def get_publications(self, pdf_path):
+        return list(self.iter_publications(pdf_path))
+
+    def iter_entries(self, page_texts):
+        '''Parses a stream of page texts into entries.
+
+        An entry cut by a page break is carried over and completed with the
+        continuation lines at the top of the next page.
+        '''
         entry_lines = []
-        lines = text.split('\n')
-        for line in lines[2:]:  # Skip the header lines
-            if re.match(r'^\d+\s', line):  # New entry starts
-                if entry_lines:  # Previous entry exists
-                    entries.append(self.process_entry_lines(entry_lines))
+        for text in page_texts:
+            if not text:
+                continue
+            lines = text.split('\n')
+            if lines and PAGE_NUMBER_RE.match(lines[-1]):
+                lines.pop()
+            for line in lines:
+                if HEADER_RE.match(line):
+                    continue
+                if ENTRY_START_RE.match(line) and entry_lines:  # Previous entry exists
+                    entry = self.process_entry_lines(entry_lines)
+                    if entry is not None:
+                        yield entry
                     entry_lines = []  # Reset for the next entry
-            entry_lines.append(line)
+                entry_lines.append(line)
         if entry_lines:  # Add the last entry if there is one
-            entries.append(self.process_entry_lines(entry_lines))
-        return entries
+            entry = self.process_entry_lines(entry_lines)
+            if entry is not None:
+                yield entry
+
+    def extract_publications_from_page(self, text):
+        # Parse a single page to get entries
+        return self.parse_entries(text)
+
+    def parse_entries(self, text):
+        return list(self.iter_entries([text]))
 
     def process_entry_lines(self, entry_lines):
         entry_text = ' '.join(entry_lines)  # Combine lines to handle multi-line entries
-        id_match = re.match(r'^(\d+)', entry_text)
+        id_match = ID_RE.match(entry_text)
         if not id_match:
-            logging.warning('No ID found in entry: ' + ' '.join(entry_lines))
+            logger.warning('No ID found in entry: %s', entry_text)
             return None
         id_ = id_match.group(1)
         title_authors = entry_text[len(id_):].strip()  # Remove ID from the start
@@ -54,10 +172,12 @@ class AAAIParser:
         return {'id': id_, 'title': title, 'authors': authors}
 
 # Usage example
-pdf_path = 'AAAI_Main-Track_2024-01-04.pdf'  # Update this path to the actual location of your PDF
-parser = AAAIParser()
-publications = parser.get_publications(pdf_path)
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    pdf_path = 'AAAI_Main-Track_2024-01-04.pdf'  # Update this path to the actual location of your PDF
+    parser = AAAIParser(cache=PageTextCache())
+    publications = parser.get_publications(pdf_path)
 
-# Print the first few entries to verify the parsing
-for publication in publications[:10]:
-    print(publication)
+    # Print the first few entries to verify the parsing
+    for publication in publications[:10]:
+        print(publication)
@@ -1,6 +1,11 @@
+import os
 import streamlit as st
 import pandas as pd
 import json
+import requests
+from paper_store import PaperStore, is_paper_store, read_legacy_papers
+from related import RelatedPapers, related_directory
+import search_index
 
 # Set page config
 st.set_page_config(page_title="Accepted conference papers", layout="wide")
@@ -14,16 +19,66 @@ def read_parsed_publications(filepath):
     except FileNotFoundError:
         return []
 
+# Read only the columns the explorer shows from the columnar paper store
+@st.cache_data
+def read_paper_store(directory):
+    return PaperStore(directory).records(['title', 'authors', 'url'])
+
+# Build the full-text index once and keep it across reruns and sessions
+@st.cache_resource
+def load_search_index(source):
+    if is_paper_store(source):
+        return search_index.load_or_build(
+            source, lambda: PaperStore(source).records(['title', 'authors', 'abstract']))
+    return search_index.load_or_build(source, lambda: read_legacy_papers(source))
+
+# Row of every paper of the store, to look up its neighbours
+@st.cache_data
+def read_paper_rows(directory):
+    return {paper['url']: row for row, paper in enumerate(read_paper_store(directory))}
+
+# Neighbour lists and topics precomputed with `python related.py papers_store`
+@st.cache_resource
+def load_related_papers(directory):
+    return RelatedPapers.load(directory)
+
 # Function to filter publications by search query
+# (substring fallback for queries that have no indexable words, e.g. "C++")
 def filter_publications(publications, query):
     query = query.lower()
     return [pub for pub in publications if query in pub['title'].lower() or any(query in author.lower() for author in pub['authors'])]
 
+# Ask the query service (python service.py) instead of searching in this process
+def query_service(service_url, mode, query):
+    response = requests.get(f"{service_url.rstrip('/')}/{mode}", params={'q': query, 'k': 50}, timeout=10)
+    response.raise_for_status()
+    return response.json()['results']
+
+# Set to e.g. http://127.0.0.1:8080 to use the app as a thin client of service.py
+SEARCH_SERVICE_URL = os.environ.get('SEARCH_SERVICE_URL')
+
 # Path to the JSON file containing the publications
 PUBLICATIONS_FILE = 'papers_repository.json'
+# Columnar store created with `python paper_store.py papers_repository.json papers_store`
+PUBLICATIONS_STORE = 'papers_store'
+
+# Load existing papers, preferring the columnar store when it exists
+# (as a thin client, the service holds the corpus and nothing is loaded here)
+if SEARCH_SERVICE_URL:
+    publications_source = None
+    existing_papers = []
+elif os.path.isdir(PUBLICATIONS_STORE):
+    publications_source = PUBLICATIONS_STORE
+    existing_papers = read_paper_store(PUBLICATIONS_STORE)
+else:
+    publications_source = PUBLICATIONS_FILE
+    existing_papers = read_parsed_publications(PUBLICATIONS_FILE)
 
-# Load existing papers
-existing_papers = read_parsed_publications(PUBLICATIONS_FILE)
+related_papers = None
+if publications_source == PUBLICATIONS_STORE and os.path.isdir(related_directory(PUBLICATIONS_STORE)):
+    related_papers = load_related_papers(related_directory(PUBLICATIONS_STORE))
+    if len(related_papers) != len(existing_papers):
+        related_papers = None  # Built before the last append; rerun related.py
 
 # Display only the first 10 papers if no search query is made
 initial_display_papers = existing_papers[:10]
@@ -31,18 +86,60 @@ initial_display_papers = existing_papers[:10]
 # User input for search
 search_query = st.text_input("Search for papers (by title or author):")
 
+# Browse by topic: the members of a topic are a precomputed array slice
+topic = None
+if related_papers is not None:
+    topic_sizes = related_papers.topic_sizes()
+    topic = st.sidebar.selectbox("Browse by topic", [None, *range(len(related_papers.labels))],
+                                 format_func=lambda t: 'All papers' if t is None
+                                 else f"{related_papers.labels[t]} ({topic_sizes[t]})")
+
 if search_query:
-    # Filter publications based on the search query
-    filtered_papers = filter_publications(existing_papers, search_query)
+    if SEARCH_SERVICE_URL:
+        search_mode = st.radio("Search mode", ['search', 'semantic'], horizontal=True,
+                               format_func=lambda mode: 'Keyword' if mode == 'search' else 'Semantic')
+        try:
+            filtered_papers = query_service(SEARCH_SERVICE_URL, search_mode, search_query)
+        except requests.RequestException as e:
+            # Timeouts, refused connections and error replies (raise_for_status)
+            st.error(f"The search service at {SEARCH_SERVICE_URL} could not answer: {e}")
+            filtered_papers = None
+    # Ranked lookup in the inverted index over titles, abstracts and authors
+    elif existing_papers and search_index.tokenize(search_query):
+        doc_ids, _ = load_search_index(publications_source).search(search_query)
+        filtered_papers = [existing_papers[doc_id] for doc_id in doc_ids]
+    else:
+        filtered_papers = filter_publications(existing_papers, search_query)
     if filtered_papers:
         st.markdown("### Search Results")
         st.write(pd.DataFrame(filtered_papers))
-    else:
+    elif filtered_papers is not None:
         st.markdown("No matching papers found.")
+    displayed_papers = filtered_papers or []
+elif topic is not None:
+    displayed_papers = [existing_papers[row] for row in related_papers.members(topic)]
+    st.markdown(f"### Topic: {related_papers.labels[topic]}")
+    st.write(pd.DataFrame(displayed_papers))
+elif SEARCH_SERVICE_URL:
+    st.markdown(f"Search the papers served by {SEARCH_SERVICE_URL}.")
+    displayed_papers = []
 else:
     # If no search query, display the first 10 papers
     st.markdown("### Existing Papers (showing first 10)")
     st.write(pd.DataFrame(initial_display_papers))
+    displayed_papers = initial_display_papers
+
+# Related papers of any displayed paper: one row of the precomputed neighbour lists
+if related_papers is not None and displayed_papers:
+    row_by_url = read_paper_rows(PUBLICATIONS_STORE)
+    titles = {paper['url']: paper['title'] for paper in displayed_papers if paper['url'] in row_by_url}
+    selected = st.selectbox("Show papers related to", [None, *titles],
+                            format_func=lambda url: '-' if url is None else titles[url])
+    if selected is not None:
+        rows, scores = related_papers.related(row_by_url[selected])
+        st.markdown("### Related Papers")
+        st.write(pd.DataFrame([dict(existing_papers[row], similarity=float(score))
+                               for row, score in zip(rows, scores)]))
 
 # Additional notes or footer
 st.markdown("---")
@@ -0,0 +1,40 @@
+'''AAAIParser wall-clock time on the bundled PDF for several worker counts.
+
+Each run starts with an empty page cache, so every page is extracted.
+A final run reuses a warm cache to show the cost of a re-parse.
+
+Run from the repository root: python -m benchmarks.bench_aaai_parser
+'''
+import argparse
+import os
+import tempfile
+import time
+
+from aaai_parser import AAAIParser, PageTextCache
+
+PDF_PATH = 'AAAI_Main-Track_2024-01-04.pdf'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs='+', default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        reference = None
+        for workers in args.workers:
+            cache = PageTextCache(os.path.join(directory, f'pages-{workers}.sqlite'))
+            start = time.perf_counter()
+            publications = AAAIParser(workers=workers, cache=cache).get_publications(PDF_PATH)
+            elapsed = time.perf_counter() - start
+            reference = reference or publications
+            same = 'identical' if publications == reference else 'DIFFERENT'
+            print(f"workers={workers:<3d} {elapsed:6.2f} s, {len(publications)} entries ({same})")
+
+        start = time.perf_counter()
+        AAAIParser(cache=cache).get_publications(PDF_PATH)
+        print(f"warm cache  {time.perf_counter() - start:6.2f} s")
+
+
+if __name__ == '__main__':
+    main()
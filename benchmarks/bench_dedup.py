@@ -0,0 +1,45 @@
+'''Deduplication throughput and recall as the corpus grows.
+
+Papers are synthetic (see bench_search); a tenth of them are re-listed as
+near-duplicate copies with a lowercased title and a few abstract words
+changed. Time per paper should stay flat if the LSH stage is
+sub-quadratic.
+
+Run from the repository root: python -m benchmarks.bench_dedup
+'''
+import argparse
+import random
+import time
+
+from benchmarks.bench_search import synthetic_papers
+from dedup import Deduplicator
+
+
+def with_copies(papers, fraction=0.1, seed=0):
+    rng = random.Random(seed)
+    copies = []
+    for paper in rng.sample(papers, int(len(papers) * fraction)):
+        words = paper['abstract'].split()
+        for position in rng.sample(range(len(words)), 5):
+            words[position] = 'changed'
+        copies.append(dict(paper, title=paper['title'].lower(), abstract=' '.join(words)))
+    return papers + copies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--papers", type=int, nargs='+', default=[10000, 30000, 100000])
+    args = parser.parse_args()
+
+    for n in args.papers:
+        papers = with_copies(synthetic_papers(n))
+        start = time.perf_counter()
+        merged = Deduplicator().dedup(papers)
+        elapsed = time.perf_counter() - start
+        found = len(papers) - len(merged)
+        print(f"{len(papers):>7} papers: {elapsed:6.1f} s ({elapsed / len(papers) * 1e6:5.0f} us/paper), "
+              f"{found}/{len(papers) - n} copies merged")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+'''Throughput of FetchScheduler against a local mock server.
+
+Every mock request takes LATENCY seconds, so throughput should scale with
+concurrency until it reaches the configured per-host rate cap.
+
+Run from the repository root: python -m benchmarks.bench_scheduler
+'''
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from scheduler import FetchScheduler
+
+LATENCY = 0.05
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(LATENCY)
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run(concurrency, rate, url, num_requests):
+    scheduler = FetchScheduler(concurrency=concurrency, rate=rate, host_rates={})
+    start = time.monotonic()
+    scheduler.map(scheduler.get, [f'{url}/{n}' for n in range(num_requests)])
+    return num_requests / (time.monotonic() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rate", type=float, default=100, help="Per-host rate cap in requests per second")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SlowHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}'
+
+    print(f"rate cap: {args.rate:.0f} req/s, server latency: {LATENCY * 1000:.0f} ms")
+    for concurrency in (1, 2, 4, 8, 16, 32):
+        throughput = run(concurrency, args.rate, url, args.requests)
+        print(f"concurrency={concurrency:<3d} {throughput:7.1f} req/s")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+'''CVF listing parsing: the old BeautifulSoup find_previous walk vs the lxml sweep.
+
+The page is synthetic, repeating the entry layout of the saved fixture
+fixtures/cvf_iccv2023.html.
+
+Run from the repository root: python -m benchmarks.bench_scrapers
+'''
+import argparse
+import time
+
+from bs4 import BeautifulSoup
+
+from scrapers import parse_cvf_listing
+
+ENTRY = '''<dt class="ptitle"><br><a href="/content/ICCV2023/html/Paper_{n}_ICCV_2023_paper.html">Paper number {n}</a></dt>
+<dd>
+<form id="form-{n}" action="/ICCV2023" method="post" class="authsearch">
+<a href="#">First Author{n}</a>,
+<a href="#">Second Author{n}</a>
+</form>
+</dd>
+<dd>
+[<a href="/content/ICCV2023/papers/Paper_{n}_ICCV_2023_paper.pdf">pdf</a>]
+[<a href="/content/ICCV2023/supplemental/Paper_{n}_supplemental.pdf">supp</a>]
+[<a href="http://arxiv.org/abs/2308.{n:05d}">arXiv</a>]
+<div class="link2">[<a class="fakelink">bibtex</a>]</div>
+</dd>
+'''
+
+
+def synthetic_page(n):
+    return ('<html><body><dl>' + ''.join(ENTRY.format(n=i) for i in range(n)) + '</dl></body></html>').encode()
+
+
+def parse_with_find_previous(content):
+    # The parsing previously done in ICCVScraper.list_publications
+    soup = BeautifulSoup(content, 'html.parser')
+    listings = []
+    for anchor in [anchor for anchor in soup.find_all('a') if 'arXiv' in anchor.text]:
+        title = anchor.find_previous('dt').text.strip()
+        link = anchor['href']
+        listings.append((title, link, link.split('/')[-1]))
+    return listings
+
+
+def best_ms(function, content, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(content)
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--papers", type=int, nargs='+', default=[500, 2000])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    for n in args.papers:
+        content = synthetic_page(n)
+        expected = parse_with_find_previous(content)
+        listings = [(item['title'], item['url'], item['arxiv_id']) for item in parse_cvf_listing(content)]
+        assert listings == expected
+        old = best_ms(parse_with_find_previous, content, args.repeats)
+        new = best_ms(parse_cvf_listing, content, args.repeats)
+        print(f"{n:>6} papers ({len(content) / 1e6:.1f} MB): find_previous {old:8.1f} ms   "
+              f"lxml sweep {new:6.1f} ms   ({old / new:.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+'''Keyword search latency: SearchIndex vs the linear scan in app.py.
+
+Papers are synthetic, built from the title/abstract vocabulary of the
+bundled papers_repository.json so that term statistics look realistic.
+
+Run from the repository root: python -m benchmarks.bench_search
+'''
+import argparse
+import json
+import random
+import time
+
+from search_index import SearchIndex, tokenize
+
+QUERIES = ['learning', 'neural radiance', 'diffusion model', '"object detection"', 'transfo', 'smith']
+
+
+def linear_scan(publications, query):
+    # Same work as app.filter_publications
+    query = query.lower()
+    return [pub for pub in publications if query in pub['title'].lower() or any(query in author.lower() for author in pub['authors'])]
+
+
+def synthetic_papers(n, seed=0):
+    with open('papers_repository.json') as f:
+        seed_papers = json.load(f)
+    vocabulary = sorted({token for paper in seed_papers for token in tokenize(paper['title'] + ' ' + paper['abstract'])})
+    surnames = ['Smith', 'Chen', 'Wang', 'Müller', 'Kim', 'Garcia', 'Rossi', 'Nguyen']
+    rng = random.Random(seed)
+    return [{'title': ' '.join(rng.choices(vocabulary, k=10)),
+             'abstract': ' '.join(rng.choices(vocabulary, k=150)),
+             'authors': [f'{rng.choice("ABCDEFG")}. {rng.choice(surnames)}' for _ in range(4)]}
+            for _ in range(n)]
+
+
+def per_query_ms(function, repeats=5):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for query in QUERIES:
+            function(query)
+    return (time.perf_counter() - start) * 1000 / (repeats * len(QUERIES))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--papers", type=int, nargs='+', default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    for n in args.papers:
+        papers = synthetic_papers(n)
+        start = time.perf_counter()
+        index = SearchIndex.build(papers)
+        build_s = time.perf_counter() - start
+        scan_ms = per_query_ms(lambda query: linear_scan(papers, query))
+        index_ms = per_query_ms(lambda query: index.search(query))
+        print(f"{n:>7d} papers: scan {scan_ms:8.2f} ms/query, index {index_ms:6.2f} ms/query "
+              f"(build {build_s:.1f} s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+'''Load test of the query service with the offline HashingEmbedder.
+
+The service and the load generator share one event loop and process, so
+the numbers are a lower bound for a standalone server. Queries are drawn
+from the corpus vocabulary; a Zipf-like mix makes some of them repeat, as
+real query logs do.
+
+Run from the repository root: python -m benchmarks.bench_service
+'''
+import argparse
+import asyncio
+import random
+import time
+
+import aiohttp
+import numpy as np
+from aiohttp.test_utils import TestServer
+
+from benchmarks.bench_search import synthetic_papers
+from embeddings import HashingEmbedder
+from search_index import SearchIndex
+from service import QueryService, create_app
+
+
+def make_queries(papers, n, seed=0):
+    rng = random.Random(seed)
+    words = [word for paper in papers[:200] for word in paper['title'].split()]
+    distinct = [' '.join(rng.sample(words, 2)) for _ in range(n // 4)]
+    # Repeats follow a power law over the distinct queries
+    return [distinct[min(int(rng.paretovariate(1.2)) - 1, len(distinct) - 1)] for _ in range(n)]
+
+
+async def load_test(service, queries, concurrency):
+    server = TestServer(create_app(service))
+    await server.start_server()
+    latencies = []
+    arxiv_ids = list(service.rows)
+    work = iter(enumerate(queries))
+
+    async def worker(session):
+        for i, query in work:
+            endpoint = ('/search', '/semantic', '/similar')[i % 3]
+            url = (server.make_url(f'/similar/{arxiv_ids[hash(query) % len(arxiv_ids)]}') if endpoint == '/similar'
+                   else server.make_url(endpoint).with_query(q=query))
+            start = time.perf_counter()
+            async with session.get(url) as response:
+                await response.read()
+                assert response.status == 200, await response.text()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    async with aiohttp.ClientSession() as session:
+        async with session.get(server.make_url('/metrics')) as response:
+            metrics = await response.json()
+    await server.close()
+    return elapsed, np.array(latencies), metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--papers", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    papers = synthetic_papers(args.papers)
+    for n, paper in enumerate(papers):
+        paper['arxiv_id'] = f'2401.{n:05d}'
+    embedder = HashingEmbedder()
+    vectors = embedder.embed_documents([f"{paper['title']}\n{paper['abstract']}" for paper in papers])
+    service = QueryService(papers, SearchIndex.build(papers), vectors, embedder)
+
+    elapsed, latencies, metrics = asyncio.run(load_test(service, make_queries(papers, args.requests),
+                                                        args.concurrency))
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    print(f"{args.requests} requests over {args.papers} papers, {args.concurrency} concurrent: "
+          f"{args.requests / elapsed:.0f} QPS, client p50 {p50:.1f} ms, p99 {p99:.1f} ms")
+    for endpoint, summary in sorted(metrics['latency'].items()):
+        print(f"  {endpoint:<22} {summary['count']:>6} requests  server p50 {summary['p50_ms']:.2f} ms  "
+              f"p99 {summary['p99_ms']:.2f} ms")
+    print(f"  result cache {metrics['result_cache']}, embedding batches {metrics['embedding_batches']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+'''Latency and recall@k of LocalVectorDAL exact and IVF search.
+
+Builds a synthetic clustered corpus in a temporary directory, then times
+exact and approximate queries and reports the approximate recall@k
+against exact search.
+
+Run from the repository root: python -m benchmarks.bench_vector_search
+'''
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from storage import LocalVectorDAL
+
+
+def synthetic_corpus(n, dim, n_topics=200, seed=0):
+    '''Vectors scattered around random topic centres, like real embeddings.'''
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((n_topics, dim)).astype(np.float32)
+    vectors = centres[rng.integers(0, n_topics, n)] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors
+
+
+def timed(dal, queries, k, **kwargs):
+    start = time.perf_counter()
+    results = [[r['arxiv_id'] for r in dal.search_vector(query, k, **kwargs)] for query in queries]
+    return results, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--papers", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--n_probe", type=int, default=8)
+    args = parser.parse_args()
+
+    vectors = synthetic_corpus(args.papers, args.dim)
+    queries = vectors[:args.queries] + 0.1
+    with tempfile.TemporaryDirectory() as directory:
+        dal = LocalVectorDAL(directory, n_probe=args.n_probe)
+        dal.store_papers([{'arxiv_id': str(i)} for i in range(args.papers)])
+        dal.store_embeddings(vectors)
+        start = time.perf_counter()
+        dal.build_index()
+        print(f"{args.papers} papers x {args.dim} dims, IVF build {time.perf_counter() - start:.1f} s "
+              f"({len(dal.index.centroids)} lists, n_probe={args.n_probe})")
+
+        exact, exact_ms = timed(dal, queries, args.k)
+        approx, approx_ms = timed(dal, queries, args.k, approximate=True)
+        recall = np.mean([len(set(e) & set(a)) / args.k for e, a in zip(exact, approx)])
+        print(f"exact:  {exact_ms:6.2f} ms/query")
+        print(f"IVF:    {approx_ms:6.2f} ms/query, recall@{args.k} = {recall:.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+'''Offline evaluation of keyword, vector and hybrid retrieval.
+
+Queries are generated from papers_repository.json and each has a single
+relevant paper, the one it was generated from:
+
+    title     a few content words of the title, lowercased and shuffled
+    abstract  a handful of content words from the abstract
+    noisy     the abstract query plus one word from another paper, which
+              the all-terms-must-match keyword search cannot satisfy (the
+              disjunctive mode used by hybrid retrieval can)
+
+Vectors come from the offline HashingEmbedder, so absolute recall says
+little about a real embedding model; the comparison between stages and
+their latency is what this harness is for.
+
+Run from the repository root: python -m benchmarks.eval_hybrid
+'''
+import argparse
+import json
+import random
+import time
+
+import numpy as np
+
+from embeddings import HashingEmbedder
+from hybrid import HybridSearcher, TitleReranker
+from resolver import STOPWORDS
+from search_index import SearchIndex, tokenize
+from vector_index import normalize
+
+
+def make_queries(papers, n, seed=0):
+    rng = random.Random(seed)
+    queries = []
+    for doc_id in rng.sample(range(len(papers)), n):
+        title = [word for word in tokenize(papers[doc_id]['title']) if word not in STOPWORDS]
+        abstract = [word for word in tokenize(papers[doc_id]['abstract']) if word not in STOPWORDS and len(word) > 3]
+        queries.append(('title', ' '.join(rng.sample(title, min(3, len(title)))), doc_id))
+        abstract_query = ' '.join(rng.sample(abstract, min(6, len(abstract))))
+        queries.append(('abstract', abstract_query, doc_id))
+        other = tokenize(papers[rng.randrange(len(papers))]['title'])
+        queries.append(('noisy', f'{abstract_query} {rng.choice(other)}', doc_id))
+    return queries
+
+
+def evaluate(name, search, queries, k):
+    found, reciprocal_ranks, latencies = {}, [], []
+    for kind, query, doc_id in queries:
+        start = time.perf_counter()
+        ids = list(search(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+        rank = ids.index(doc_id) + 1 if doc_id in ids else None
+        found.setdefault(kind, []).append(rank is not None)
+        reciprocal_ranks.append(1 / rank if rank else 0)
+    recall = '  '.join(f"recall@{k} {kind} {np.mean(hits):.3f}" for kind, hits in sorted(found.items()))
+    p50, p99 = np.percentile(latencies, [50, 99])
+    print(f"{name:<16} {recall}  MRR {np.mean(reciprocal_ranks):.3f}  p50 {p50:.2f} ms  p99 {p99:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=300, help="Papers to generate queries from")
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    with open('papers_repository.json') as f:
+        papers = json.load(f)
+    embedder = HashingEmbedder()
+    vectors = normalize(embedder.embed_documents([f"{paper['title']}\n{paper['abstract']}" for paper in papers]))
+    searcher = HybridSearcher(SearchIndex.build(papers), vectors, embedder.embed_query,
+                              reranker=TitleReranker(papers))
+    queries = make_queries(papers, args.queries)
+    k = args.k
+
+    evaluate('keyword', lambda query: searcher.keyword_index.search(query, k)[0], queries, k)
+    evaluate('keyword (any)', lambda query: searcher.keyword_index.search(query, k, 'any')[0], queries, k)
+    evaluate('vector', lambda query: searcher.vector_ranking(query, None, {})[:k], queries, k)
+    evaluate('hybrid', lambda query: searcher.search(query, k, rerank=False)[0], queries, k)
+    evaluate('hybrid+rerank', lambda query: searcher.search(query, k)[0], queries, k)
+
+    stages = {}
+    for _, query, _ in queries:
+        for stage, ms in searcher.search(query, k)[2].items():
+            stages.setdefault(stage, []).append(ms)
+    print('stage p50 (ms): ' + '  '.join(f"{stage[:-3]} {np.median(ms):.3f}" for stage, ms in stages.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+'''Offline benchmark suite for every pipeline stage, with stored baselines.
+
+Cases run against saved fixtures, synthetic data and a local stub of the
+arXiv API, so no network access is needed:
+
+    cvf_listing          CVFScraper (ICCVScraper) on the saved ICCV page
+                         and on a synthetic 2000-paper page
+    arxiv_feed           ArxivFetcher.fetch_many against a local Atom
+                         feed server, and parse_feed alone
+    aaai_parser          AAAIParser on the bundled PDF, cold and with a
+                         warm page cache
+    filter_publications  the app's substring filter at 1k/10k/100k papers
+    json_load            json.load of papers_repository.json
+    vector_top_k         exact top-k over 1k/10k/100k 384-d embeddings
+
+Every case is timed over several rounds after a warm-up call and reported
+as median and minimum milliseconds. Results are written as JSON (the
+committed baseline is benchmarks/baseline.json), and --compare exits
+non-zero when a case got slower than the baseline by more than
+--threshold, so regressions show up as a diff of that file.
+
+Run from the repository root:
+
+    python -m benchmarks.suite --compare benchmarks/baseline.json
+    python -m benchmarks.suite --save benchmarks/baseline.json
+    python -m benchmarks.suite --filter vector_top_k
+'''
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from aaai_parser import AAAIParser, PageTextCache
+from benchmarks.bench_scrapers import synthetic_page
+from benchmarks.bench_search import linear_scan, synthetic_papers
+from fetchers import ArxivFetcher
+from scheduler import FetchScheduler
+from scrapers import CVFScraper
+from vector_index import normalize, top_k
+
+PDF_PATH = 'AAAI_Main-Track_2024-01-04.pdf'
+CVF_FIXTURE = os.path.join('fixtures', 'cvf_iccv2023.html')
+FILTER_QUERIES = ['learning', 'neural radiance', 'smith', 'transfo']
+
+# name -> (setup, rounds); setup() returns the function to time and optionally a cleanup
+CASES = {}
+
+
+def case(name, rounds=10):
+    def decorator(setup):
+        CASES[name] = (setup, rounds)
+        return setup
+    return decorator
+
+
+class PageResponse:
+    def __init__(self, content):
+        self.content = content
+
+
+class PageScheduler:
+    '''Serves one saved page for every URL, like a fully cached FetchScheduler.'''
+
+    def __init__(self, content):
+        self.content = content
+
+    def get(self, url, **kwargs):
+        return PageResponse(self.content)
+
+    def map(self, func, items):
+        return [func(item) for item in items]
+
+
+class PageFetcher:
+    def __init__(self, content):
+        self.scheduler = PageScheduler(content)
+
+
+def cvf_case(content):
+    scraper = CVFScraper(PageFetcher(content))
+    return lambda: scraper.list_publications('https://openaccess.thecvf.com/ICCV2023')
+
+
+@case('cvf_listing[fixture]', rounds=50)
+def cvf_fixture():
+    with open(CVF_FIXTURE, 'rb') as f:
+        return cvf_case(f.read())
+
+
+@case('cvf_listing[2000]')
+def cvf_synthetic():
+    return cvf_case(synthetic_page(2000))
+
+
+def atom_feed(ids):
+    entries = ''.join(
+        f'<entry><id>http://arxiv.org/abs/{arxiv_id}v1</id>'
+        f'<summary>\n  Abstract of paper {arxiv_id}. {"We propose a method. " * 40}\n</summary>'
+        f'<author><name>Author One</name></author><author><name>Author Two</name></author></entry>'
+        for arxiv_id in ids)
+    return ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<feed xmlns="http://www.w3.org/2005/Atom">' + entries + '</feed>').encode()
+
+
+class AtomHandler(BaseHTTPRequestHandler):
+    '''Answers ``id_list`` queries like export.arxiv.org/api/query.'''
+
+    def do_GET(self):
+        body = atom_feed(parse_qs(urlparse(self.path).query)['id_list'][0].split(','))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/atom+xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+ARXIV_IDS = [f'2308.{n:05d}' for n in range(500)]
+
+
+@case('arxiv_feed[fetch_many 500]')
+def arxiv_fetch_many():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), AtomHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    fetcher = ArxivFetcher(api_url=f'http://127.0.0.1:{server.server_port}/api/query',
+                           scheduler=FetchScheduler(concurrency=4, host_rates={}))
+
+    def cleanup():
+        server.shutdown()
+        server.server_close()
+    return (lambda: fetcher.fetch_many(ARXIV_IDS)), cleanup
+
+
+@case('arxiv_feed[parse 100]')
+def arxiv_parse():
+    feed = atom_feed(ARXIV_IDS[:100])
+    return lambda: ArxivFetcher.parse_feed(feed)
+
+
+@case('aaai_parser[cold]', rounds=1)
+def aaai_cold():
+    directory = tempfile.TemporaryDirectory()
+    caches = iter(range(1000))
+
+    def run():
+        # A new, empty page cache per round: every page is extracted
+        cache = PageTextCache(os.path.join(directory.name, f'pages-{next(caches)}.sqlite'))
+        return AAAIParser(cache=cache).get_publications(PDF_PATH)
+    return run, directory.cleanup
+
+
+@case('aaai_parser[warm cache]', rounds=5)
+def aaai_warm():
+    directory = tempfile.TemporaryDirectory()
+    cache = PageTextCache(os.path.join(directory.name, 'pages.sqlite'))
+    AAAIParser(cache=cache).get_publications(PDF_PATH)
+    return (lambda: AAAIParser(cache=cache).get_publications(PDF_PATH)), directory.cleanup
+
+
+def filter_case(n):
+    papers = synthetic_papers(n)
+    return lambda: [linear_scan(papers, query) for query in FILTER_QUERIES]
+
+
+for size in (1000, 10000, 100000):
+    case(f'filter_publications[{size}]', rounds=5)(lambda size=size: filter_case(size))
+
+
+@case('json_load[papers_repository.json]', rounds=20)
+def json_load():
+    def load():
+        with open('papers_repository.json') as f:
+            return json.load(f)
+    return load
+
+
+def vector_case(n, dim=384, k=10):
+    rng = np.random.default_rng(0)
+    matrix = normalize(rng.standard_normal((n, dim), dtype=np.float32))
+    queries = normalize(rng.standard_normal((16, dim), dtype=np.float32))
+    return lambda: [top_k(matrix, query, k) for query in queries]
+
+
+for size in (1000, 10000, 100000):
+    case(f'vector_top_k[{size}]', rounds=10)(lambda size=size: vector_case(size))
+
+
+def run_case(setup, rounds):
+    prepared = setup()
+    function, cleanup = prepared if isinstance(prepared, tuple) else (prepared, None)
+    try:
+        if rounds > 1:
+            function()  # Warm-up: imports, caches, worker pools
+        samples = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            function()
+            samples.append((time.perf_counter() - start) * 1000)
+    finally:
+        if cleanup is not None:
+            cleanup()
+    return {'median_ms': round(statistics.median(samples), 3), 'min_ms': round(min(samples), 3), 'rounds': rounds}
+
+
+def machine():
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+            'processor': platform.machine(), 'cpus': os.cpu_count()}
+
+
+def compare(results, baseline, threshold):
+    '''Prints the change of every case against the baseline; returns the names of the regressions.'''
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get('results', {}).get(name)
+        if before is None:
+            print(f"{name:<36} {result['median_ms']:>10.3f} ms   (new)")
+            continue
+        ratio = result['median_ms'] / before['median_ms'] if before['median_ms'] else float('inf')
+        flag = ''
+        if ratio > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<36} {result['median_ms']:>10.3f} ms   baseline {before['median_ms']:>10.3f} ms   "
+              f"x{ratio:.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", type=str, default=None, help="Only run cases whose name contains this text")
+    parser.add_argument("--save", type=str, default=None, help="Write the results as JSON to this path")
+    parser.add_argument("--compare", type=str, default=None, help="Baseline JSON to compare the results with")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="Slowdown ratio of the median above which a case counts as a regression")
+    args = parser.parse_args()
+    # The scrapers and the parser log progress at INFO, which would interleave with the table
+    logging.disable(logging.INFO)
+
+    results = {}
+    for name, (setup, rounds) in CASES.items():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = run_case(setup, rounds)
+        if not args.compare:
+            print(f"{name:<36} {results[name]['median_ms']:>10.3f} ms (min {results[name]['min_ms']:.3f})")
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'machine': machine(), 'results': results}, f, indent=4)
+            f.write('\n')
+    if regressions:
+        print(f"{len(regressions)} case(s) slower than the baseline by more than x{args.threshold}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+'''Persistent on-disk cache for HTTP responses.
+
+Responses are stored zlib-compressed in a single SQLite file, keyed by the
+full request URL. Each host gets its own time-to-live; once an entry is
+stale it is revalidated with ETag/Last-Modified instead of re-downloaded.
+The total size of stored bodies is capped and the least recently used
+entries are evicted first. The running size is kept in memory and access
+times are written in batches, so a cache hit costs one indexed read
+rather than a commit. When the network fails, a stale entry is served
+rather than nothing.
+
+Besides whole responses, callers can store and look up bodies of their own
+under a URL with ``put``/``lookup``; ArxivFetcher uses this to cache one
+feed per arXiv id, whatever batch the id was fetched in.
+'''
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import urlparse
+
+import requests
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+
+# Seconds a cached response is served without revalidation, per host.
+# Conference listings and arXiv metadata change rarely once published.
+DEFAULT_TTLS = {
+    'export.arxiv.org': 30 * DAY,
+    'openaccess.thecvf.com': 7 * DAY,
+}
+# Access times of this many hits are written to the database in one commit
+ACCESS_FLUSH_SIZE = 256
+
+
+class ResponseCache:
+    '''SQLite-backed HTTP response cache with per-host TTLs and LRU eviction.'''
+
+    def __init__(self, path='http_cache.sqlite', max_bytes=512 * 1024 * 1024, default_ttl=DAY, ttls=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.ttls = DEFAULT_TTLS if ttls is None else ttls
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS responses (
+            url TEXT PRIMARY KEY,
+            body BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            content_type TEXT,
+            etag TEXT,
+            last_modified TEXT,
+            stored_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        )''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)')
+        self.db.commit()
+        # Sum of the stored body sizes, kept up to date by _store and _evict
+        self.stored_bytes = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        # url -> access time of hits not yet written to the database
+        self.accessed = {}
+
+    def ttl(self, url):
+        return self.ttls.get(urlparse(url).netloc, self.default_ttl)
+
+    def get(self, url, send, params=None, headers=None):
+        '''GETs ``url`` through the cache.
+
+        Fresh entries are returned without touching the network; otherwise
+        ``send(url, headers)`` performs the request, conditionally when a
+        stale entry can be revalidated. If ``send`` returns None, the stale
+        entry is returned (marked ``X-Cache: STALE``) when there is one.
+        '''
+        url = requests.Request('GET', url, params=params).prepare().url
+        entry = self._load(url)
+        if entry is not None and time.time() - entry['stored_at'] < self.ttl(url):
+            self._record_hit(url, entry)
+            return self._response(url, entry)
+
+        headers = dict(headers or {})
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        response = send(url, headers)
+
+        if entry is not None and response is not None and response.status_code == 304:
+            metrics.counter('http_cache_revalidations_total').inc()
+            with self.lock:
+                self.revalidations += 1
+                self.db.execute('UPDATE responses SET stored_at = ? WHERE url = ?', (time.time(), url))
+                self.db.commit()
+            self._record_hit(url, entry)
+            return self._response(url, entry)
+
+        if entry is not None and response is None:
+            logger.warning("Serving a stale cached response for %s", url)
+            metrics.counter('http_cache_stale_total').inc()
+            self._record_hit(url, entry)
+            return self._response(url, entry, 'STALE')
+
+        self._record_miss()
+        if response is not None and response.status_code == 200:
+            self._store(url, response.content, response.headers.get('Content-Type'),
+                        response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return response
+
+    def lookup(self, url, params=None, stale=False):
+        '''The cached body of ``url``, or None when it is missing or, unless ``stale``, expired.'''
+        url = requests.Request('GET', url, params=params).prepare().url
+        entry = self._load(url)
+        if entry is None or (not stale and time.time() - entry['stored_at'] >= self.ttl(url)):
+            if not stale:
+                self._record_miss()
+            return None
+        self._record_hit(url, entry)
+        return entry['body']
+
+    def put(self, url, body, params=None, content_type=None):
+        '''Stores ``body`` as the response of ``url``, as if it had just been fetched.'''
+        self._store(requests.Request('GET', url, params=params).prepare().url, body, content_type)
+
+    def _load(self, url):
+        with self.lock:
+            row = self.db.execute(
+                'SELECT body, content_type, etag, last_modified, stored_at FROM responses WHERE url = ?',
+                (url,)).fetchone()
+        if row is None:
+            return None
+        body, content_type, etag, last_modified, stored_at = row
+        return {'body': zlib.decompress(body), 'content_type': content_type, 'etag': etag,
+                'last_modified': last_modified, 'stored_at': stored_at}
+
+    def _record_hit(self, url, entry):
+        metrics.counter('http_cache_hits_total').inc()
+        metrics.counter('http_cache_bytes_read_total').inc(len(entry['body']))
+        with self.lock:
+            self.hits += 1
+            self.bytes_read += len(entry['body'])
+            self.accessed[url] = time.time()
+            if len(self.accessed) >= ACCESS_FLUSH_SIZE:
+                self._flush_accessed()
+                self.db.commit()
+
+    def _flush_accessed(self):
+        '''Writes the pending access times; the caller holds the lock and commits.'''
+        if self.accessed:
+            self.db.executemany('UPDATE responses SET accessed_at = ? WHERE url = ?',
+                                [(accessed_at, url) for url, accessed_at in self.accessed.items()])
+            self.accessed.clear()
+
+    def _record_miss(self):
+        metrics.counter('http_cache_misses_total').inc()
+        with self.lock:
+            self.misses += 1
+
+    @staticmethod
+    def _response(url, entry, status='HIT'):
+        '''Rebuilds a requests.Response from a cache entry.'''
+        response = requests.Response()
+        response.url = url
+        response.status_code = 200
+        response._content = entry['body']
+        if entry['content_type']:
+            response.headers['Content-Type'] = entry['content_type']
+        response.headers['X-Cache'] = status
+        return response
+
+    def _store(self, url, content, content_type=None, etag=None, last_modified=None):
+        body = zlib.compress(content)
+        now = time.time()
+        with self.lock:
+            self.bytes_written += len(content)
+            replaced = self.db.execute('SELECT size FROM responses WHERE url = ?', (url,)).fetchone()
+            self.db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                            (url, body, len(body), content_type, etag, last_modified, now, now))
+            self.accessed.pop(url, None)
+            self.stored_bytes += len(body) - (replaced[0] if replaced else 0)
+            self._evict()
+            self.db.commit()
+
+    def _evict(self):
+        '''Drops least recently used entries until the cache fits in max_bytes.'''
+        if self.stored_bytes <= self.max_bytes:
+            return
+        # Pending access times decide what is least recently used
+        self._flush_accessed()
+        evicted = 0
+        while self.stored_bytes > self.max_bytes:
+            rows = self.db.execute('SELECT url, size FROM responses ORDER BY accessed_at LIMIT 64').fetchall()
+            if not rows:
+                break
+            for url, size in rows:
+                if self.stored_bytes <= self.max_bytes:
+                    break
+                self.db.execute('DELETE FROM responses WHERE url = ?', (url,))
+                self.stored_bytes -= size
+                evicted += 1
+        logger.debug("Evicted %d cached responses", evicted)
+
+    def stats(self):
+        '''Returns hit/miss counters and the current on-disk size.'''
+        with self.lock:
+            entries = self.db.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidations': self.revalidations,
+                'bytes_read': self.bytes_read,
+                'bytes_written': self.bytes_written,
+                'entries': entries,
+                'stored_bytes': self.stored_bytes,
+            }
+
+    def close(self):
+        with self.lock:
+            self._flush_accessed()
+            self.db.commit()
+            self.db.close()
@@ -1,27 +1,120 @@
 import argparse
-import json
+import contextlib
+import os
+
+import metrics
+from crawl import CrawlManifest, crawl_incremental
 from fetchers import ArxivFetcher
-from scrapers import ICCVScraper
+from scrapers import SCRAPERS, get_scraper
+from shards import SUFFIXES, ShardedSink
+from sinks import JSONLSink, JSONSink
+
+def scrape_and_save(url, num_papers, output_format, concurrency=4, rate=None, cache_path=None,
+                    incremental=False, batch_size=100, conference='iccv', output_dir=None, shard_size=1000,
+                    compression='gzip', dedup=False):
+    # The HTTP stack (requests, urllib3) is only loaded once there is something to fetch,
+    # so that `cli.py --help` starts quickly
+    from cache import ResponseCache
+    from scheduler import FetchScheduler
 
-def scrape_and_save(url, num_papers, output_format):
-    fetcher = ArxivFetcher()
+    cache = ResponseCache(cache_path) if cache_path else None
+    # An explicit rate replaces the built-in per-host limits for every host
+    scheduler = FetchScheduler(concurrency=concurrency, rate=rate, host_rates={} if rate else None, cache=cache)
+    fetcher = ArxivFetcher(scheduler=scheduler)
     num_papers_to_scrape = None if num_papers == -1 else num_papers
-    scraper = ICCVScraper(fetcher, num_papers_to_scrape=num_papers_to_scrape)
-    papers = scraper.get_publications(url)
+    scraper = get_scraper(conference, fetcher, num_papers_to_scrape=num_papers_to_scrape, chunk_size=batch_size)
+    if incremental and not scraper.arxiv_linked:
+        raise SystemExit(f"--incremental needs a listing with arXiv links, which '{conference}' pages do not have")
+    if dedup and output_dir:
+        # Shards are append-only and consumers sync them by sequence number, so they are never rewritten
+        raise SystemExit(f"--dedup rewrites the repository file; for shards run: python dedup.py {output_dir} <output>")
+
+    # With an output directory, papers go to compressed shards listed in its manifest.json (see shards.py)
+    shard_sink = (ShardedSink(output_dir, conference, shard_size, compression, chunk_size=batch_size)
+                  if output_dir else None)
+    if incremental:
+        # Appends new papers to the JSONL repository (or as new shards) and resumes from the manifest
+        if shard_sink is not None:
+            manifest = CrawlManifest(os.path.join(output_dir, f'{conference}.crawl.jsonl'))
+            written = crawl_incremental(scraper, url, shard_sink, manifest, batch_size)
+        else:
+            manifest = CrawlManifest('papers_repository.manifest.jsonl')
+            repository = 'papers_repository.jsonl'
+            written = crawl_incremental(scraper, url, repository, manifest, batch_size)
+        counts = manifest.counts()
+        print(f"Added {written} papers ({counts['ok']} ok, {counts['missing']} missing, "
+              f"{counts['failed']} failed in manifest)")
+    else:
+        # Papers are written chunk by chunk while the rest are still being fetched
+        if shard_sink is not None:
+            sink = shard_sink
+        elif output_format.lower() == 'json':
+            repository = 'papers_repository.json'
+            sink = JSONSink(repository, chunk_size=batch_size)
+        else:
+            repository = 'papers_repository.jsonl'
+            sink = JSONLSink(repository, chunk_size=batch_size)
+        written = sink.write(scraper.iter_publications(url))
+        print(f"Saved {written} papers")
+    if dedup:
+        # Needs the whole repository at once, so it runs once every paper is written
+        from dedup import dedup_file
+        before, after = dedup_file(repository)
+        print(f"Deduplicated {repository}: {before} papers merged into {after} distinct works")
+    if shard_sink is not None and shard_sink.written_shards:
+        print(f"Wrote shards {shard_sink.written_shards[0]['sequence']}-{shard_sink.written_shards[-1]['sequence']} "
+              f"to {output_dir}; consumers pick them up with: python shards.py {output_dir} --since <last seen>")
 
-    if output_format.lower() == 'json':
-        with open('papers_repository.json', 'w') as f:
-            json.dump(papers, f, indent=4)
-    elif output_format.lower() == 'jsonl':
-        with open('papers_repository.jsonl', 'w') as f:
-            for paper in papers:
-                f.write(json.dumps(paper) + '\n')
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Cache: {stats['hits']} hits, {stats['misses']} misses, {stats['revalidations']} revalidated, "
+              f"{stats['bytes_read']} bytes served, {stats['entries']} entries ({stats['stored_bytes']} bytes on disk)")
+        cache.close()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="CLI for scraping ML conference papers")
     parser.add_argument("--url", type=str, required=True, help="Conference URL to scrape")
+    parser.add_argument("--conference", type=str.lower, choices=sorted(SCRAPERS), default="iccv",
+                        help="Which site layout the URL uses (CVF, OpenReview or PMLR conferences)")
     parser.add_argument("--num_papers", type=int, default=5, help="Number of papers to scrape")
     parser.add_argument("--format", type=str, choices=['json', 'jsonl'], default="json", help="Output format (json or jsonl)")
-    
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum number of requests in flight")
+    parser.add_argument("--rate", type=float, default=None,
+                        help="Requests per second allowed per host (defaults to each source's published limit)")
+    parser.add_argument("--cache", type=str, default="http_cache.sqlite", help="Path of the on-disk HTTP response cache")
+    parser.add_argument("--no-cache", action="store_true", help="Always go to the network")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Append only new papers to papers_repository.jsonl, resuming from the last checkpoint")
+    parser.add_argument("--batch_size", type=int, default=100, help="Papers fetched and written per chunk")
+    parser.add_argument("--output_dir", type=str, default=None,
+                        help="Write compressed JSONL shards with a manifest to this directory instead of one file")
+    parser.add_argument("--shard_size", type=int, default=1000, help="Papers per shard with --output_dir")
+    parser.add_argument("--compression", choices=sorted(SUFFIXES), default="gzip",
+                        help="Shard compression with --output_dir (zstd needs the zstandard package)")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Merge duplicate papers (arXiv versions, copies at other venues) of the repository after scraping")
+    parser.add_argument("--metrics", type=str, default="papers_repository.metrics.json",
+                        help="Where to write the JSON run report (stage latencies, request and cache counters)")
+    parser.add_argument("--prometheus", type=str, default=None,
+                        help="Also write the metrics in the Prometheus text format to this file")
+    parser.add_argument("--profile", choices=['cprofile', 'sample'], default=None,
+                        help="Profile the run with cProfile or with a sampling profiler covering all threads")
+    parser.add_argument("--profile_output", type=str, default=None,
+                        help="Where to write the profile (default papers_repository.prof or .stacks)")
+
     args = parser.parse_args()
-    scrape_and_save(args.url, args.num_papers, args.format)
+    if args.profile:
+        profile_output = args.profile_output or ('papers_repository.prof' if args.profile == 'cprofile'
+                                                 else 'papers_repository.stacks')
+        profiler = metrics.profile(args.profile, profile_output)
+    else:
+        profiler = contextlib.nullcontext()
+    with profiler:
+        scrape_and_save(args.url, args.num_papers, args.format, args.concurrency, args.rate,
+                        None if args.no_cache else args.cache, args.incremental, args.batch_size, args.conference,
+                        args.output_dir, args.shard_size, args.compression, args.dedup)
+
+    metrics.REGISTRY.write_report(args.metrics, run={'url': args.url, 'conference': args.conference})
+    if args.prometheus:
+        metrics.REGISTRY.write_prometheus(args.prometheus)
+    print(f"Run report written to {args.metrics}")
@@ -0,0 +1,128 @@
+'''Incremental, resumable crawling.
+
+A CrawlManifest is an append-only JSONL log of every arXiv id a crawl has
+processed together with its status:
+
+    ok       the paper was fetched and written to the output file
+    missing  arXiv answered but has no record for the id
+    failed   the request failed; the id is retried on the next run
+
+The latest line for an id wins, so retrying a failure just appends a new
+line. Papers are appended to the output in batches, and each batch is
+recorded in the manifest only after it is safely on disk: a crash loses
+at most the batch in flight and a resumed crawl only fetches what is new
+or previously failed. A crash between writing a batch and recording it
+leaves papers in the output that the manifest does not know about; a
+resumed crawl finds them in the output, records them as done and does
+not write them again. Each line also records the output's position (for
+shards, the latest sequence number) so that this check reads only what
+was written after the last recorded batch. A crash in the middle of a
+write leaves a truncated last line, which is cut off before the next run
+appends.
+'''
+import json
+import logging
+import os
+import time
+
+from sinks import JSONLSink, Sink
+
+logger = logging.getLogger(__name__)
+
+OK = 'ok'
+MISSING = 'missing'
+FAILED = 'failed'
+
+
+class CrawlManifest:
+    '''Append-only record of processed ids and their latest status.'''
+
+    def __init__(self, path):
+        self.path = path
+        self.statuses = {}
+        # Output position (Sink.position()) after the last recorded batch, if the sink reports one
+        self.position = None
+        self.truncated = False
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    self.truncated = not line.endswith('\n')
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A crash can leave a truncated last line behind
+                        logger.warning("Skipping unreadable manifest line in '%s'", path)
+                        continue
+                    self.statuses[record['arxiv_id']] = record['status']
+                    self.position = record.get('position', self.position)
+            logger.info("Loaded %d manifest entries from '%s'", len(self.statuses), path)
+
+    def is_done(self, arxiv_id):
+        '''True for ids that need no further fetching.'''
+        return self.statuses.get(arxiv_id) in (OK, MISSING)
+
+    def record(self, statuses, position=None):
+        '''Appends ``{arxiv_id: status}`` (and the output's ``position``) to the manifest and syncs it to disk.'''
+        now = time.time()
+        extra = {'position': position} if position is not None else {}
+        with open(self.path, 'a') as f:
+            if self.truncated:
+                f.write('\n')
+                self.truncated = False
+            for arxiv_id, status in statuses.items():
+                f.write(json.dumps({'arxiv_id': arxiv_id, 'status': status, 'ts': now, **extra}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.statuses.update(statuses)
+        if position is not None:
+            self.position = position
+
+    def counts(self):
+        counts = {OK: 0, MISSING: 0, FAILED: 0}
+        for status in self.statuses.values():
+            counts[status] += 1
+        return counts
+
+
+def crawl_incremental(scraper, url, output, manifest, batch_size=100):
+    '''Fetches the papers listed at ``url`` that ``manifest`` has not completed.
+
+    Papers are written ``batch_size`` at a time to ``output``: a JSONL
+    file to append to, or a Sink (e.g. a shards.ShardedSink, which then
+    gets one shard per batch). Returns the number of papers written by
+    this run.
+    '''
+    sink = output if isinstance(output, Sink) else JSONLSink(output, append=True)
+    listings = scraper.list_publications(url)
+    venue = scraper.venue(url)
+    pending = [listing for listing in listings if not manifest.is_done(listing[2])]
+    if pending:
+        existing = sink.existing_urls(manifest.position)
+        recovered = {arxiv_id: OK for _, link, arxiv_id in pending if link in existing}
+        if recovered:
+            logger.warning("%d papers are in the output but not in the manifest; recording them as done",
+                           len(recovered))
+            manifest.record(recovered, sink.position())
+            pending = [listing for listing in pending if listing[2] not in recovered]
+    logger.info("%d of %d listed papers still need fetching", len(pending), len(listings))
+
+    written = 0
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        fetched, missing, failed = scraper.fetcher.fetch_many([arxiv_id for _, _, arxiv_id in batch])
+
+        papers = [{'title': title, 'url': link, 'abstract': fetched[arxiv_id][0], 'authors': fetched[arxiv_id][1],
+                   'arxiv_id': arxiv_id, **venue} for title, link, arxiv_id in batch if arxiv_id in fetched]
+        if papers:
+            sink.write_chunk(papers)
+        sink.checkpoint()
+
+        statuses = {arxiv_id: OK for arxiv_id in fetched}
+        statuses.update({arxiv_id: MISSING for arxiv_id in missing})
+        statuses.update({arxiv_id: FAILED for arxiv_id in failed})
+        manifest.record(statuses, sink.position())
+        written += len(fetched)
+        logger.info("Checkpointed %d/%d pending papers", start + len(batch), len(pending))
+
+    sink.close()
+    return written
@@ -0,0 +1,202 @@
+'''Deduplication of the paper corpus.
+
+The same work is often listed more than once: as several arXiv versions
+(2308.09318v2), as workshop and main-track copies, or at two venues.
+Deduplicator finds these groups in two passes:
+
+1. exact: papers with the same canonical arXiv id (version suffix
+   stripped, taken from 'arxiv_id' or an arXiv url);
+2. near-duplicate: MinHash signatures of title and abstract word
+   bigrams are banded for locality-sensitive hashing, and papers sharing
+   a band are confirmed by their Jaccard similarity. Each paper is
+   compared with a few members of its buckets only, so the cost grows
+   linearly with the corpus rather than with its square.
+
+Papers with different canonical arXiv ids are never merged, however
+similar their text. Every group is merged into one record that keeps the
+most complete fields and lists all the venues it appeared at under
+'venues'.
+
+cli.py --dedup runs dedup_file on the repository after scraping; it can
+also be run on its own:
+
+    python dedup.py papers_repository.jsonl papers_dedup.jsonl
+'''
+import argparse
+import json
+import logging
+import os
+
+import metrics
+from fetchers import canonical_arxiv_id
+from paper_store import read_legacy_papers
+from resolver import MinHasher
+from search_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+SHINGLE_SIZE = 2
+# Members of an LSH bucket a new paper is compared with
+MAX_BUCKET_COMPARISONS = 4
+
+
+def shingles(paper, size=SHINGLE_SIZE):
+    '''Word n-grams of the title and abstract.'''
+    words = tokenize(paper.get('title')) + tokenize(paper.get('abstract'))
+    if len(words) < size:
+        return set(words)
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def venues(paper):
+    '''Where a paper was listed: its merged 'venues', or "<conference> <year>".'''
+    if paper.get('venues'):
+        return list(paper['venues'])
+    if paper.get('conference'):
+        return [' '.join(str(part) for part in (paper['conference'], paper.get('year')) if part)]
+    return []
+
+
+def is_empty(value):
+    return value is None or value == '' or value == []
+
+
+def merge(papers):
+    '''Merges a group of duplicates into one record.
+
+    The first paper's fields win, gaps are filled from the others, the
+    longest abstract is kept and every distinct venue is listed.
+    '''
+    merged = dict(papers[0])
+    for paper in papers[1:]:
+        for key, value in paper.items():
+            if is_empty(merged.get(key)) and not is_empty(value):
+                merged[key] = value
+    abstracts = [paper['abstract'] for paper in papers if paper.get('abstract')]
+    if abstracts:
+        merged['abstract'] = max(abstracts, key=len)
+    arxiv_ids = [arxiv_id for arxiv_id in map(canonical_arxiv_id, papers) if arxiv_id]
+    if arxiv_ids:
+        merged['arxiv_id'] = arxiv_ids[0]
+    merged['venues'] = list(dict.fromkeys(venue for paper in papers for venue in venues(paper)))
+    return merged
+
+
+class DisjointSet:
+    '''Union-find over paper indices; every component carries the arXiv id of its members, if any.'''
+
+    def __init__(self, size):
+        self.parent = list(range(size))
+        self.arxiv_ids = {}
+
+    def find(self, item):
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[item] != root:  # Path compression
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            # The earlier paper stays the root, so merged records keep its fields
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+            arxiv_id = self.arxiv_ids.pop(max(root_a, root_b), None)
+            if arxiv_id is not None:
+                self.arxiv_ids.setdefault(min(root_a, root_b), arxiv_id)
+
+    def conflict(self, a, b):
+        '''True when the components of ``a`` and ``b`` hold two different arXiv ids.'''
+        id_a, id_b = self.arxiv_ids.get(self.find(a)), self.arxiv_ids.get(self.find(b))
+        return id_a is not None and id_b is not None and id_a != id_b
+
+
+class Deduplicator:
+    '''Groups and merges duplicate papers; see the module docstring.'''
+
+    def __init__(self, threshold=0.7, hasher=None):
+        self.threshold = threshold
+        self.hasher = hasher or MinHasher()
+
+    def groups(self, papers):
+        '''Lists of indices into ``papers``, one per distinct work, in order of first appearance.'''
+        components = DisjointSet(len(papers))
+
+        first_with_id = {}
+        for i, paper in enumerate(papers):
+            arxiv_id = canonical_arxiv_id(paper)
+            if arxiv_id:
+                components.arxiv_ids.setdefault(i, arxiv_id)
+                components.union(first_with_id.setdefault(arxiv_id, i), i)
+
+        paper_shingles = [shingles(paper) for paper in papers]
+        buckets = {}
+        for i, words in enumerate(paper_shingles):
+            if not words:
+                continue
+            for band, key in enumerate(self.hasher.band_keys(list(words))):
+                bucket = buckets.setdefault((band, int(key)), [])
+                for other in bucket:
+                    if components.find(other) == components.find(i):
+                        break
+                    # Two different arXiv ids are two works, e.g. a paper and its follow-up
+                    if components.conflict(other, i):
+                        continue
+                    if jaccard(paper_shingles[other], words) >= self.threshold:
+                        components.union(other, i)
+                        break
+                else:
+                    if len(bucket) < MAX_BUCKET_COMPARISONS:
+                        bucket.append(i)
+
+        groups = {}
+        for i in range(len(papers)):
+            groups.setdefault(components.find(i), []).append(i)
+        return list(groups.values())
+
+    def dedup(self, papers):
+        '''Returns the papers with every group of duplicates merged into one record.'''
+        papers = list(papers)
+        with metrics.timer('stage_seconds', stage='dedup'):
+            merged = [merge([papers[i] for i in group]) for group in self.groups(papers)]
+        metrics.counter('papers_deduplicated_total').inc(len(papers) - len(merged))
+        logger.info("Merged %d papers into %d distinct works", len(papers), len(merged))
+        return merged
+
+
+def dedup_file(source, output=None, threshold=0.7):
+    '''Deduplicates a repository into ``output`` (.json or .jsonl, default: ``source`` itself).
+
+    The output is written under a temporary name and renamed, so an
+    interrupted run leaves the repository as it was. Returns the number of
+    papers before and after.
+    '''
+    output = output or source
+    papers = read_legacy_papers(source)
+    deduplicated = Deduplicator(threshold).dedup(papers)
+    partial = output + '.part'
+    with open(partial, 'w') as f:
+        if output.endswith('.jsonl'):
+            f.writelines(json.dumps(paper) + '\n' for paper in deduplicated)
+        else:
+            json.dump(deduplicated, f, indent=4)
+    os.replace(partial, output)
+    return len(papers), len(deduplicated)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Merge duplicate papers of a JSON/JSONL/CSV repository")
+    parser.add_argument("source", help="papers_repository.json, .jsonl or a scraper CSV")
+    parser.add_argument("output", help="Where to write the deduplicated papers (.json or .jsonl)")
+    parser.add_argument("--threshold", type=float, default=0.7,
+                        help="Jaccard similarity of title/abstract bigrams above which papers are duplicates")
+    args = parser.parse_args()
+
+    before, after = dedup_file(args.source, args.output, args.threshold)
+    print(f"Merged {before} papers into {after} distinct works")
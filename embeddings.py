@@ -0,0 +1,157 @@
+'''Embedding generation with a persistent content-hash cache.
+
+EmbeddingPipeline wraps any provider with ``embed_documents(texts)`` (for
+example langchain's OpenAIEmbeddings, or the offline HashingEmbedder
+below). Texts are normalised and deduplicated, looked up in an on-disk
+cache keyed by a hash of (model name, normalised text), and only the
+misses are sent to the provider, in token-budgeted batches with bounded
+concurrency. Re-embedding an unchanged corpus therefore costs nothing.
+'''
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE_RE = re.compile(r'\s+')
+TOKEN_RE = re.compile(r'\w+')
+
+
+def normalize_text(text):
+    '''Collapses whitespace so that re-wrapped abstracts hash the same.'''
+    return WHITESPACE_RE.sub(' ', text).strip()
+
+
+def estimate_tokens(text):
+    '''Rough token count (about four characters per token for English).'''
+    return len(text) // 4 + 1
+
+
+def model_name(provider):
+    '''Best-effort model identifier of an embedding provider, used in cache keys.'''
+    return getattr(provider, 'model_name', None) or getattr(provider, 'model', None) or type(provider).__name__
+
+
+class HashingEmbedder:
+    '''Deterministic offline embedder: signed feature hashing of word tokens.
+
+    Useful for tests and for running the pipeline without an API key. It
+    captures lexical overlap only, not meaning.
+    '''
+
+    def __init__(self, dim=384):
+        self.dim = dim
+        self.model_name = f'hashing-{dim}'
+
+    def _embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in TOKEN_RE.findall(text.lower()):
+            digest = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), 'little')
+            vector[digest % self.dim] += 1 if digest >> 63 else -1
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class EmbeddingCache:
+    '''SQLite store of float32 vectors keyed by content hash.'''
+
+    def __init__(self, path='embeddings_cache.sqlite'):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)')
+        self.db.commit()
+
+    @staticmethod
+    def key(model, text):
+        return hashlib.sha256(f'{model}\0{text}'.encode()).hexdigest()
+
+    def get_many(self, keys):
+        '''Returns ``{key: vector}`` for the keys that are cached.'''
+        found = {}
+        with self.lock:
+            # Stay well below SQLite's limit on bound parameters
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self.db.execute(f'SELECT key, vector FROM embeddings WHERE key IN ({",".join("?" * len(chunk))})',
+                                       chunk).fetchall()
+                found.update((key, np.frombuffer(vector, dtype=np.float32)) for key, vector in rows)
+        return found
+
+    def put_many(self, items):
+        with self.lock:
+            self.db.executemany('INSERT OR REPLACE INTO embeddings VALUES (?, ?)',
+                                ((key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items))
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+class EmbeddingPipeline:
+    '''Embeds texts through a cache, sending only misses to the provider.'''
+
+    def __init__(self, provider, cache=None, max_batch_tokens=8000, max_batch_size=256, concurrency=4):
+        self.provider = provider
+        self.cache = cache
+        self.model = model_name(provider)
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.concurrency = concurrency
+        self.hits = 0
+        self.misses = 0
+
+    def batches(self, texts):
+        '''Splits texts into batches under the token budget and batch size.'''
+        batch, tokens = [], 0
+        for text in texts:
+            cost = estimate_tokens(text)
+            if batch and (tokens + cost > self.max_batch_tokens or len(batch) == self.max_batch_size):
+                yield batch
+                batch, tokens = [], 0
+            batch.append(text)
+            tokens += cost
+        if batch:
+            yield batch
+
+    def embed(self, texts):
+        '''Returns one embedding (a list of floats) per input text, in order.'''
+        normalized = [normalize_text(text) for text in texts]
+        keys = {text: EmbeddingCache.key(self.model, text) for text in normalized}
+        cached = self.cache.get_many(list(set(keys.values()))) if self.cache is not None else {}
+        vectors = {text: cached[key] for text, key in keys.items() if key in cached}
+        todo = [text for text in keys if text not in vectors]
+        self.hits += len(keys) - len(todo)
+        self.misses += len(todo)
+        metrics.counter('embedding_cache_hits_total').inc(len(keys) - len(todo))
+        metrics.counter('embedding_cache_misses_total').inc(len(todo))
+        logger.info("Embedding %d texts: %d unique, %d cached", len(texts), len(keys), len(keys) - len(todo))
+
+        batches = list(self.batches(todo))
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for batch, embedded in zip(batches, executor.map(self._embed_batch, batches)):
+                vectors.update(zip(batch, embedded))
+
+        return [np.asarray(vectors[text], dtype=np.float32).tolist() for text in normalized]
+
+    def _embed_batch(self, batch):
+        with metrics.timer('stage_seconds', stage='embed_batch'):
+            embedded = self.provider.embed_documents(batch)
+        metrics.counter('embedded_texts_total').inc(len(batch))
+        if self.cache is not None:
+            # Written per batch so that an interrupted run keeps what it paid for
+            self.cache.put_many((EmbeddingCache.key(self.model, text), vector) for text, vector in zip(batch, embedded))
+        return embedded
@@ -6,64 +6,228 @@ TODO: create a publication class that holds the content and metadata.
 '''
 from abc import ABCMeta, abstractmethod
 import logging
-import requests
-from bs4 import BeautifulSoup
-import PyPDF2
-import time
+import os
+import re
+
+import metrics
 
 # Configure the logger for this module
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class PublicationFetcher(metaclass=ABCMeta):
-    '''Abstract base class for publication fetchers.'''
+    '''Abstract base class for publication fetchers.
+
+    Subclasses issue their HTTP requests through ``self.scheduler`` so that
+    they share its connection pool, concurrency bound and rate limits.
+    '''
+    def __init__(self, scheduler=None):
+        if scheduler is None:
+            # Imported here: the scheduler pulls in requests, which slows down startup
+            from scheduler import FetchScheduler
+            scheduler = FetchScheduler()
+        self.scheduler = scheduler
+
     @abstractmethod
     def fetch(self, publication_id):
         '''Fetches the publication content from the source and returns it.'''
         raise NotImplementedError("Subclasses must implement this method!")
 
+    def fetch_many(self, publication_ids):
+        '''Fetches several publications at once.
+
+        Returns a ``(results, missing, failed)`` tuple where ``results`` maps
+        each fetched id to its ``(abstract, authors)``, ``missing`` lists the
+        ids the source answered for but does not know, and ``failed`` lists
+        the ids whose requests failed and are worth retrying later. The
+        default implementation calls ``fetch`` once per id on the scheduler's
+        worker pool and, since ``fetch`` cannot tell the two apart, reports
+        every unfetched id as failed; subclasses can override it with a
+        batched request.
+        '''
+        results = {}
+        failed = []
+        fetched = self.scheduler.map(self.fetch, publication_ids)
+        for publication_id, (abstract, authors) in zip(publication_ids, fetched):
+            if abstract is None:
+                failed.append(publication_id)
+            else:
+                results[publication_id] = (abstract, authors)
+        return results, [], failed
+
 class ArxivFetcher(PublicationFetcher):
+    API_URL = "http://export.arxiv.org/api/query"
+    PDF_URL = "https://arxiv.org/pdf/{}"
+    HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
+    }
+    # Matches the trailing version suffix of an arXiv id, e.g. the "v2" in 2308.09318v2
+    VERSION_RE = re.compile(r'v\d+$')
+    URL_RE = re.compile(r'/(?:abs|pdf)/(.+?)(?:\.pdf)?/?$')
+
+    def __init__(self, api_url=None, batch_size=100, scheduler=None):
+        super().__init__(scheduler)
+        self.api_url = api_url or self.API_URL
+        self.batch_size = batch_size
+
+    def _query(self, params):
+        '''GETs the arXiv API through the scheduler, returning the response or None.'''
+        return self.scheduler.get(self.api_url, params=params, headers=self.HEADERS)
+
+    @classmethod
+    def parse_feed(cls, content):
+        '''Parses an Atom feed into a dict of unversioned arXiv id -> (abstract, authors).'''
+        from bs4 import BeautifulSoup
+        with metrics.timer('stage_seconds', stage='arxiv_parse'):
+            soup = BeautifulSoup(content, 'xml')
+            entries = {}
+            for entry in soup.find_all('entry'):
+                entry_id = entry.find('id')
+                summary = entry.find('summary')
+                # arXiv reports unknown ids as an entry without a summary
+                if entry_id is None or summary is None:
+                    continue
+                arxiv_id = cls.canonical_id(entry_id.text.strip().split('/abs/')[-1])
+                authors = [author.find('name').text for author in entry.find_all('author')]
+                entries[arxiv_id] = (summary.text.strip(), authors)
+        return entries
+
+    @classmethod
+    def canonical_id(cls, arxiv_id):
+        '''Strips the version suffix from an arXiv id.'''
+        return cls.VERSION_RE.sub('', arxiv_id)
+
+    @classmethod
+    def id_from_url(cls, url):
+        '''Canonical id of an arXiv abs or pdf link, e.g. ".../pdf/2308.09318v2.pdf" -> "2308.09318".'''
+        match = cls.URL_RE.search(url)
+        return cls.canonical_id(match.group(1) if match else url.rstrip('/').split('/')[-1])
+
     def fetch(self, arxiv_id):
         logger.debug(f"Attempting to fetch publication {arxiv_id} from arXiv")
-        api_url = f"http://export.arxiv.org/api/query?id_list={arxiv_id}"
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
-        }
-        
-        # Implementing retries with exponential backoff
-        max_retries = 5
-        retry_delay = 1  # Start with 1 second delay
-        for attempt in range(max_retries):
-            try:
-                response = requests.get(api_url, headers=headers)
-                response.raise_for_status()  # Check for HTTP request errors
-                logger.debug("Successfully fetched the data on attempt #%d", attempt + 1)
-                break  # Success, exit retry loop
-            except requests.exceptions.RequestException as e:
-                logger.warning("Attempt #%d failed with error: %s. Retrying in %d seconds...", attempt + 1, e, retry_delay)
-                time.sleep(retry_delay)
-                retry_delay *= 2  # Exponential backoff
-        else:
-            # Failed all retries
-            logger.error("Failed to fetch publication %s after %d attempts.", arxiv_id, max_retries)
+        response = self._query({'id_list': arxiv_id})
+        if response is None:
+            logger.error("Failed to fetch publication %s", arxiv_id)
             return None, None
 
-        soup = BeautifulSoup(response.content, 'xml')
-        entry = soup.find('entry')
-        abstract = entry.find('summary').text.strip()
-        authors = [author.find('name').text for author in entry.find_all('author')]
+        entry = self.parse_feed(response.content).get(self.canonical_id(arxiv_id))
+        if entry is None:
+            logger.warning("arXiv returned no entry for publication %s", arxiv_id)
+            return None, None
+
+        logger.debug("Successfully fetched publication %s from arXiv", arxiv_id)
+        return entry
+
+    @staticmethod
+    def entry_feed(arxiv_id, abstract, authors):
+        '''A one-entry Atom feed for a parsed publication, as the API would answer ``id_list=arxiv_id``.'''
+        from xml.sax.saxutils import escape
+        names = ''.join(f'<author><name>{escape(name)}</name></author>' for name in authors)
+        return ('<?xml version="1.0" encoding="UTF-8"?><feed xmlns="http://www.w3.org/2005/Atom">'
+                f'<entry><id>http://arxiv.org/abs/{escape(arxiv_id)}</id><summary>{escape(abstract)}</summary>'
+                f'{names}</entry></feed>').encode()
+
+    def _cached_entry(self, cache, arxiv_id, stale=False):
+        body = cache.lookup(self.api_url, params={'id_list': self.canonical_id(arxiv_id)}, stale=stale)
+        return None if body is None else self.parse_feed(body).get(self.canonical_id(arxiv_id))
+
+    def _fetch_chunk(self, chunk):
+        # Batch responses are not cached as a whole: their URL depends on how the ids were grouped.
+        # Every entry is cached on its own instead, under the URL of a single-id query.
+        response = self.scheduler.get(self.api_url, params={'id_list': ','.join(chunk), 'max_results': len(chunk)},
+                                      headers=self.HEADERS, use_cache=False)
+        if response is None:
+            logger.error("Failed to fetch a batch of %d publications", len(chunk))
+            return None
+        entries = self.parse_feed(response.content)
+        cache = getattr(self.scheduler, 'cache', None)
+        if cache is not None:
+            for arxiv_id, (abstract, authors) in entries.items():
+                cache.put(self.api_url, self.entry_feed(arxiv_id, abstract, authors), params={'id_list': arxiv_id},
+                          content_type='application/atom+xml')
+        return entries
+
+    def fetch_many(self, arxiv_ids):
+        '''Fetches publications in chunks of ``batch_size`` ids per ``id_list`` query.
+
+        With a response cache on the scheduler, ids with a fresh cached
+        entry are not requested at all, whatever batch they were fetched in
+        before, and the ids of a failed batch fall back to stale entries.
+        '''
+        cache = getattr(self.scheduler, 'cache', None)
+        results = {}
+        missing = []
+        failed = []
+        pending = list(arxiv_ids)
+        if cache is not None:
+            pending = []
+            for arxiv_id in arxiv_ids:
+                entry = self._cached_entry(cache, arxiv_id)
+                if entry is None:
+                    pending.append(arxiv_id)
+                else:
+                    results[arxiv_id] = entry
+
+        chunks = [pending[start:start + self.batch_size] for start in range(0, len(pending), self.batch_size)]
+        for chunk, entries in zip(chunks, self.scheduler.map(self._fetch_chunk, chunks)):
+            if entries is None:
+                for arxiv_id in chunk:
+                    entry = self._cached_entry(cache, arxiv_id, stale=True) if cache is not None else None
+                    if entry is None:
+                        failed.append(arxiv_id)
+                    else:
+                        logger.warning("Using the stale cached entry of publication %s", arxiv_id)
+                        results[arxiv_id] = entry
+                continue
+            for arxiv_id in chunk:
+                entry = entries.get(self.canonical_id(arxiv_id))
+                if entry is None:
+                    missing.append(arxiv_id)
+                else:
+                    results[arxiv_id] = entry
+        results = {arxiv_id: results[arxiv_id] for arxiv_id in arxiv_ids if arxiv_id in results}
+
+        metrics.counter('arxiv_publications_total', result='fetched').inc(len(results))
+        metrics.counter('arxiv_publications_total', result='missing').inc(len(missing))
+        metrics.counter('arxiv_publications_total', result='failed').inc(len(failed))
+        logger.debug("Fetched %d/%d publications from arXiv", len(results), len(arxiv_ids))
+        if missing:
+            logger.warning("arXiv returned no entry for %d publications: %s", len(missing), ', '.join(missing))
+        if failed:
+            logger.error("Failed to fetch %d publications from arXiv", len(failed))
+        return results, missing, failed
+
+    def fetch_pdf(self, arxiv_id, directory):
+        '''Downloads the PDF of a publication into ``directory``, unless it is already there.
 
-        logger.info("Successfully fetched publication %s from arXiv", arxiv_id)
-        return abstract, authors
+        Returns the path of the PDF, or None if it could not be downloaded.
+        Text extraction happens separately (see fulltext).
+        '''
+        arxiv_id = self.canonical_id(arxiv_id)
+        path = os.path.join(directory, arxiv_id.replace('/', '_') + '.pdf')
+        if os.path.exists(path):
+            metrics.counter('pdf_downloads_total', result='cached').inc()
+            return path
 
+        # PDFs are kept as files, so they bypass the HTTP response cache
+        response = self.scheduler.get(self.PDF_URL.format(arxiv_id), headers=self.HEADERS, use_cache=False)
+        if response is None or not response.content.startswith(b'%PDF'):
+            metrics.counter('pdf_downloads_total', result='failed').inc()
+            logger.error("Failed to download the PDF of publication %s", arxiv_id)
+            return None
+        os.makedirs(directory, exist_ok=True)
+        # Written under a temporary name so that an interrupted download is never mistaken for a PDF
+        partial = path + '.part'
+        with open(partial, 'wb') as f:
+            f.write(response.content)
+        os.replace(partial, path)
+        metrics.counter('pdf_downloads_total', result='downloaded').inc()
+        return path
 
-        # for the full paper content
-        #pdf_url = entry.find('link', {'title': 'pdf'})['href']
-        #pdf_response = requests.get(pdf_url)
-        #pdf_response.raise_for_status()
 
-        #with BytesIO(pdf_response.content) as open_pdf_file:
-        #    reader = PyPDF2.PdfReader(open_pdf_file)
-        #    content = ""
-        #    for page_num in range(len(reader.pages)):
-        #        content += reader.pages[page_num].extract_text()
\ No newline at end of file
+def canonical_arxiv_id(paper):
+    '''The unversioned arXiv id of a paper, or None for papers not on arXiv.'''
+    if paper.get('arxiv_id'):
+        return ArxivFetcher.canonical_id(paper['arxiv_id'])
+    url = paper.get('url') or ''
+    return ArxivFetcher.id_from_url(url) if 'arxiv.org/' in url else None
@@ -0,0 +1,343 @@
+'''Full-text ingestion: paper PDFs split into section chunks, embedded and indexed.
+
+Abstracts leave out most method details, so this optional stage makes
+paper bodies searchable:
+
+1. PDFs are downloaded through ArxivFetcher.fetch_pdf into a local
+   directory, which doubles as the download cache;
+2. text is extracted with PyPDF2 in a process pool. Workers read at most
+   ``max_pages`` pages, are replaced every TASKS_PER_WORKER PDFs, and
+   only two PDFs per worker are in flight, so memory stays bounded;
+3. the text is split at section headings ("3 Method", "Related Work")
+   and every section into overlapping word windows; the bibliography is
+   dropped;
+4. chunks are embedded through an EmbeddingPipeline and appended to a
+   ChunkStore (Parquet part files next to the paper store, e.g.
+   ``papers_store.fulltext`` for ``papers_store``) every ``write_batch``
+   chunks, so results reach the disk while the run goes on.
+
+Papers already in the ChunkStore are skipped, so an interrupted run
+resumes where it stopped. FullTextSearcher serves BM25 and vector search
+over the chunks, fused with RRF, and returns the best chunk per paper.
+
+    python fulltext.py papers_store --pdf_dir pdfs --workers 4
+'''
+import argparse
+import logging
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import metrics
+import search_index
+from embeddings import EmbeddingPipeline
+from fetchers import ArxivFetcher, canonical_arxiv_id
+from hybrid import RRF_K, reciprocal_rank_fusion
+from paper_store import PaperStore
+from sinks import chunked
+from vector_index import normalize, top_k
+
+logger = logging.getLogger(__name__)
+
+# Pages read per PDF; long appendices add little and cost memory
+MAX_PAGES = 50
+CHUNK_WORDS = 200
+CHUNK_OVERLAP = 40
+# PDFs a worker process extracts before it is replaced, releasing whatever PyPDF2 held on to
+TASKS_PER_WORKER = 20
+SNIPPET_CHARS = 300
+
+KNOWN_HEADINGS = {'abstract', 'introduction', 'related work', 'background', 'preliminaries', 'method', 'methods',
+                  'methodology', 'approach', 'experiments', 'results', 'evaluation', 'discussion', 'limitations',
+                  'conclusion', 'conclusions', 'acknowledgements', 'acknowledgments', 'appendix'}
+STOP_HEADINGS = {'references', 'bibliography'}
+# "3 Method", "3.1 Chunking", "IV. Experiments": a number, then a capitalised title without sentence punctuation
+NUMBERED_HEADING_RE = re.compile(r'^(?:\d+(?:\.\d+)*|[IVX]+)\.?\s+[A-Z][^.!?]*$')
+MAX_HEADING_WORDS = 8
+HYPHENATION_RE = re.compile(r'(\w)-\n(\w)')
+
+
+def heading(line):
+    '''The section title a line announces, or None for body text.'''
+    line = line.strip()
+    if not line or len(line) > 80:
+        return None
+    if line.lower().rstrip(':') in KNOWN_HEADINGS | STOP_HEADINGS:
+        return line.rstrip(':')
+    if NUMBERED_HEADING_RE.match(line) and len(line.split()) <= MAX_HEADING_WORDS + 1:
+        return line
+    return None
+
+
+def split_sections(text):
+    '''Splits extracted paper text into ``(section title, body)`` pairs, dropping the bibliography.'''
+    text = HYPHENATION_RE.sub(r'\1\2', text)
+    sections, title, lines = [], 'Front matter', []
+    for line in text.split('\n'):
+        name = heading(line)
+        if name is None:
+            lines.append(line)
+            continue
+        body = ' '.join(' '.join(lines).split())
+        if body:
+            sections.append((title, body))
+        if name.lower() in STOP_HEADINGS:
+            return sections
+        title, lines = name, []
+    body = ' '.join(' '.join(lines).split())
+    if body:
+        sections.append((title, body))
+    return sections
+
+
+def chunk_words(text, size=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    '''Windows of ``size`` words, each sharing ``overlap`` words with the previous one.'''
+    words = text.split()
+    step = size - overlap
+    for start in range(0, max(len(words) - overlap, 1), step):
+        yield ' '.join(words[start:start + size])
+
+
+def extract_chunks(path, max_pages=MAX_PAGES, size=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    '''Extracts and chunks one PDF; returns ``([(section, text)], seconds)``. Runs in worker processes.'''
+    from PyPDF2 import PdfReader
+
+    start = time.perf_counter()
+    reader = PdfReader(path)
+    # Pages are joined once at the end rather than concatenated one by one
+    text = '\n'.join(page.extract_text() or '' for page in reader.pages[:max_pages])
+    chunks = [(section, chunk) for section, body in split_sections(text) for chunk in chunk_words(body, size, overlap)]
+    return chunks, time.perf_counter() - start
+
+
+def chunk_schema(dim=None):
+    fields = [pa.field('arxiv_id', pa.string()), pa.field('section', pa.string()),
+              pa.field('chunk', pa.int32()), pa.field('text', pa.string())]
+    if dim:
+        fields.append(pa.field('embedding', pa.list_(pa.float32(), dim)))
+    return pa.schema(fields)
+
+
+def fulltext_directory(store_directory):
+    return store_directory.rstrip('/') + '.fulltext'
+
+
+class ChunkStore(PaperStore):
+    '''Append-only Parquet store of text chunks, laid out like a PaperStore.'''
+
+    def append(self, chunks, embeddings=None, model=None):
+        '''Writes ``chunks`` (dicts with arxiv_id, section, chunk and text) as a new part file.'''
+        if not chunks:
+            return
+        dim = self.dim()
+        if embeddings is not None:
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+            if dim is not None and embeddings.shape[1] != dim:
+                raise ValueError(f"Expected {dim}-dimensional embeddings, got {embeddings.shape[1]}")
+            dim = embeddings.shape[1]
+        elif dim is not None:
+            raise ValueError("This store holds embeddings; append chunks together with theirs")
+
+        columns = {name: [chunk[name] for chunk in chunks] for name in ['arxiv_id', 'section', 'chunk', 'text']}
+        if dim:
+            columns['embedding'] = pa.FixedSizeListArray.from_arrays(pa.array(embeddings.ravel()), dim)
+        path = os.path.join(self.directory, f'part-{len(self.parts()):05d}.parquet')
+        metadata = self._model_metadata(model) if dim else None
+        pq.write_table(pa.table(columns, schema=chunk_schema(dim).with_metadata(metadata)), path)
+        logger.info("Appended %d chunks to '%s'", len(chunks), path)
+
+    def read(self, columns=None):
+        if not self.parts():
+            table = chunk_schema().empty_table()
+            return table.select(columns) if columns else table
+        return super().read(columns)
+
+    def arxiv_ids(self):
+        '''Ids of the papers that already have chunks.'''
+        return set(self.read(['arxiv_id']).column('arxiv_id').to_pylist())
+
+
+class FullTextIngester:
+    '''Downloads, extracts, chunks, embeds and stores the full text of papers.
+
+    ``embedder`` is any provider with ``embed_documents(texts)``; without
+    one, chunks are stored for keyword search only.
+    '''
+
+    def __init__(self, fetcher, pdf_directory, store, embedder=None, embedding_cache=None, workers=None,
+                 max_pages=MAX_PAGES, write_batch=512, chunk_size=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+        self.fetcher = fetcher
+        self.pdf_directory = pdf_directory
+        self.store = store
+        self.pipeline = EmbeddingPipeline(embedder, embedding_cache) if embedder is not None else None
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pages = max_pages
+        self.write_batch = write_batch
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+
+    def download(self, arxiv_ids):
+        return self.fetcher.scheduler.map(lambda arxiv_id: self.fetcher.fetch_pdf(arxiv_id, self.pdf_directory),
+                                          arxiv_ids)
+
+    def _extracted(self, arxiv_id, future):
+        try:
+            chunks, seconds = future.result()
+        except Exception as e:
+            # PyPDF2 raises all sorts of errors on malformed files; skip the paper
+            metrics.counter('fulltext_papers_total', result='failed').inc()
+            logger.warning("Could not extract the text of publication %s: %s", arxiv_id, e)
+            return None
+        metrics.histogram('stage_seconds', stage='pdf_text_extract').observe(seconds)
+        metrics.counter('fulltext_papers_total', result='extracted').inc()
+        return chunks
+
+    def iter_chunks(self, arxiv_ids):
+        '''Yields ``(arxiv_id, [(section, text)])`` per paper, in completion order.
+
+        The next PDFs are downloaded while the workers extract the previous
+        ones; at most two PDFs per worker are queued.
+        '''
+        max_pending = 2 * self.workers
+        executor = ProcessPoolExecutor(max_workers=self.workers, max_tasks_per_child=TASKS_PER_WORKER)
+        pending = {}
+        try:
+            for batch in chunked(arxiv_ids, max_pending):
+                for arxiv_id, path in zip(batch, self.download(batch)):
+                    if path is None:
+                        continue
+                    while len(pending) >= max_pending:
+                        yield from self._collect(pending)
+                    future = executor.submit(extract_chunks, path, self.max_pages, self.chunk_size, self.overlap)
+                    pending[future] = arxiv_id
+                    metrics.gauge('pdf_extract_queue_depth').set(len(pending))
+            while pending:
+                yield from self._collect(pending)
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def _collect(self, pending):
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            arxiv_id = pending.pop(future)
+            chunks = self._extracted(arxiv_id, future)
+            if chunks:
+                yield arxiv_id, chunks
+        metrics.gauge('pdf_extract_queue_depth').set(len(pending))
+
+    def flush(self, chunks):
+        embeddings = None
+        if self.pipeline is not None:
+            embeddings = self.pipeline.embed([f"{chunk['section']}\n{chunk['text']}" for chunk in chunks])
+        with metrics.timer('stage_seconds', stage='chunk_store_write'):
+            self.store.append(chunks, embeddings, self.pipeline.model if self.pipeline is not None else None)
+        return len(chunks)
+
+    def ingest(self, arxiv_ids):
+        '''Stores the chunks of every paper of ``arxiv_ids`` not in the store yet; returns the chunks written.'''
+        done = self.store.arxiv_ids()
+        todo = [arxiv_id for arxiv_id in dict.fromkeys(map(ArxivFetcher.canonical_id, arxiv_ids))
+                if arxiv_id not in done]
+        logger.info("Ingesting the full text of %d papers (%d already stored)", len(todo), len(done))
+
+        buffer, written = [], 0
+        for arxiv_id, chunks in self.iter_chunks(todo):
+            buffer.extend({'arxiv_id': arxiv_id, 'section': section, 'chunk': number, 'text': text}
+                          for number, (section, text) in enumerate(chunks))
+            if len(buffer) >= self.write_batch:
+                written += self.flush(buffer)
+                buffer = []
+        if buffer:
+            written += self.flush(buffer)
+        return written
+
+
+class FullTextSearcher:
+    '''Keyword and vector search over stored chunks, fused with RRF; one hit per paper.
+
+    ``chunks`` are dicts with arxiv_id, section and text; ``vectors``
+    optionally holds one L2-normalised row per chunk, embedded by
+    ``embedding_model``.
+    '''
+
+    def __init__(self, chunks, keyword_index, vectors=None, depth=200, rrf_k=RRF_K, embedding_model=None):
+        self.chunks = chunks
+        self.keyword_index = keyword_index
+        self.vectors = vectors
+        self.embedding_model = embedding_model
+        self.depth = depth
+        self.rrf_k = rrf_k
+
+    @staticmethod
+    def documents(chunks):
+        return [{'abstract': chunk['text']} for chunk in chunks]
+
+    @classmethod
+    def build(cls, chunks, vectors=None, **kwargs):
+        vectors = normalize(vectors) if vectors is not None else None
+        return cls(chunks, search_index.SearchIndex.build(cls.documents(chunks)), vectors, **kwargs)
+
+    @classmethod
+    def load(cls, directory, **kwargs):
+        '''Loads a ChunkStore, with its keyword index persisted next to it.'''
+        store = ChunkStore(directory)
+        chunks = store.records(['arxiv_id', 'section', 'text'])
+        index = search_index.load_or_build(directory, lambda: cls.documents(chunks))
+        vectors = normalize(store.embeddings()) if store.dim() else None
+        logger.info("Loaded %d full-text chunks from '%s'", len(chunks), directory)
+        return cls(chunks, index, vectors, embedding_model=store.embedding_model(), **kwargs)
+
+    def search(self, query, k=10, query_vector=None):
+        '''The ``k`` best papers as dicts with arxiv_id, section, snippet (of the best chunk) and score.'''
+        # Disjunctive BM25, as in HybridSearcher: a chunk missing one query term still gets a keyword rank
+        rankings = [self.keyword_index.search(query, self.depth, 'any')[0]]
+        if query_vector is not None and self.vectors is not None and len(query_vector) == self.vectors.shape[1]:
+            rankings.append(top_k(self.vectors, normalize(query_vector), self.depth)[0])
+        ids, scores = reciprocal_rank_fusion(rankings, self.rrf_k)
+
+        hits, seen = [], set()
+        for chunk_id, score in zip(ids, scores):
+            chunk = self.chunks[chunk_id]
+            if chunk['arxiv_id'] in seen:
+                continue
+            seen.add(chunk['arxiv_id'])
+            hits.append({'arxiv_id': chunk['arxiv_id'], 'section': chunk['section'],
+                         'snippet': chunk['text'][:SNIPPET_CHARS], 'score': float(score)})
+            if len(hits) == k:
+                break
+        return hits
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Index the full text of the papers of a PaperStore")
+    parser.add_argument("store", help="PaperStore directory whose papers to ingest")
+    parser.add_argument("--pdf_dir", type=str, default="pdfs", help="Where downloaded PDFs are kept")
+    parser.add_argument("--workers", type=int, default=None, help="Text extraction processes (all cores by default)")
+    parser.add_argument("--max_pages", type=int, default=MAX_PAGES, help="Pages read per PDF")
+    parser.add_argument("--embedder", choices=['none', 'hashing', 'openai'], default='hashing',
+                        help="Chunk embedding provider ('none' stores chunks for keyword search only)")
+    parser.add_argument("--embedding_cache", type=str, default="embeddings_cache.sqlite",
+                        help="Cache of chunk embeddings")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum number of downloads in flight")
+    args = parser.parse_args()
+
+    from embeddings import EmbeddingCache
+    from scheduler import FetchScheduler
+    from service import make_embedder
+
+    papers = PaperStore(args.store).records(['arxiv_id', 'url'])
+    # Papers of other hosts (OpenReview, PMLR) have no arXiv PDF to ingest
+    arxiv_ids = [canonical_arxiv_id(paper) for paper in papers]
+    embedder = None if args.embedder == 'none' else make_embedder(args.embedder)
+    ingester = FullTextIngester(ArxivFetcher(scheduler=FetchScheduler(concurrency=args.concurrency)), args.pdf_dir,
+                                ChunkStore(fulltext_directory(args.store)), embedder,
+                                EmbeddingCache(args.embedding_cache) if embedder else None, args.workers,
+                                args.max_pages)
+    written = ingester.ingest([arxiv_id for arxiv_id in arxiv_ids if arxiv_id])
+    print(f"Wrote {written} chunks to '{fulltext_directory(args.store)}'")
@@ -0,0 +1,127 @@
+'''Hybrid retrieval: BM25 and vector search fused by reciprocal rank.
+
+HybridSearcher runs two retrievers side by side, each limited to its
+``depth`` best papers:
+
+    keyword   SearchIndex (BM25 over title, abstract and authors)
+    vector    exact cosine top-k over the embedding matrix
+
+and fuses their rankings with reciprocal-rank fusion, which needs no
+score calibration between the two. Only the ``rerank_depth`` best fused
+candidates reach the optional reranker, so an expensive scorer never sees
+more than a small candidate set. Every search reports how long each stage
+took.
+
+benchmarks/eval_hybrid.py measures recall and latency of each stage on
+the bundled papers_repository.json.
+'''
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from rapidfuzz import fuzz
+
+from vector_index import normalize, top_k
+
+logger = logging.getLogger(__name__)
+
+# The constant of the original RRF paper; larger values flatten the rank curve
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K, weights=None):
+    '''Fuses ranked id arrays; an id scores sum(weight / (k + rank)) over the rankings it is in.
+
+    Returns ``(ids, scores)`` sorted by decreasing score.
+    '''
+    rankings = [np.asarray(ranking, dtype=np.int64) for ranking in rankings]
+    weights = weights or [1.0] * len(rankings)
+    if not any(len(ranking) for ranking in rankings):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    ids, positions = np.unique(np.concatenate(rankings), return_inverse=True)
+    scores = np.zeros(len(ids))
+    offset = 0
+    for ranking, weight in zip(rankings, weights):
+        np.add.at(scores, positions[offset:offset + len(ranking)], weight / (k + np.arange(1, len(ranking) + 1)))
+        offset += len(ranking)
+    order = np.argsort(-scores, kind='stable')
+    return ids[order], scores[order]
+
+
+class TitleReranker:
+    '''Blends the fused score with fuzzy similarity between the query and each title.
+
+    An example reranker: any callable ``(query, ids, fused_scores) -> scores``
+    can take its place, e.g. a cross-encoder.
+    '''
+
+    def __init__(self, papers, weight=0.5):
+        self.titles = [paper.get('title') or '' for paper in papers]
+        self.weight = weight
+
+    def __call__(self, query, ids, fused_scores):
+        similarity = np.array([fuzz.token_set_ratio(query, self.titles[i]) / 100 for i in ids])
+        return (1 - self.weight) * fused_scores / fused_scores.max() + self.weight * similarity
+
+
+class HybridSearcher:
+    '''Keyword and vector retrieval fused with RRF, then optionally reranked.
+
+    ``vectors`` holds one L2-normalised row per paper of ``keyword_index``.
+    ``depth`` stays shallow: with disjunctive keyword retrieval, papers in
+    the tail of both lists would otherwise outrank the best keyword hit
+    (benchmarks/eval_hybrid.py).
+    ``embed_query(text)`` returns the query vector; it is not needed when
+    callers pass ``query_vector`` themselves (e.g. from a cache).
+    '''
+
+    def __init__(self, keyword_index, vectors, embed_query=None, depth=20, rerank_depth=100, rrf_k=RRF_K,
+                 weights=None, reranker=None):
+        self.keyword_index = keyword_index
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+        self.embed_query = embed_query
+        self.depth = depth
+        self.rerank_depth = rerank_depth
+        self.rrf_k = rrf_k
+        self.weights = weights
+        self.reranker = reranker
+        # BM25 and the matrix product release the GIL for most of their work
+        self.executor = ThreadPoolExecutor(max_workers=2)
+
+    @staticmethod
+    def _timed(timings, stage, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        timings[stage] = (time.perf_counter() - start) * 1000
+        return result
+
+    def keyword_ranking(self, query, timings):
+        # Disjunctive BM25: a paper missing one query term still gets a keyword rank to fuse
+        ids, _ = self._timed(timings, 'keyword_ms', self.keyword_index.search, query, self.depth, 'any')
+        return ids
+
+    def vector_ranking(self, query, query_vector, timings):
+        if query_vector is None:
+            query_vector = self._timed(timings, 'embed_ms', self.embed_query, query)
+        ids, _ = self._timed(timings, 'vector_ms', top_k, self.vectors, normalize(query_vector), self.depth)
+        return ids
+
+    def search(self, query, k=10, query_vector=None, rerank=True):
+        '''Returns ``(ids, scores, timings)``: the top ``k`` paper positions and per-stage milliseconds.'''
+        timings = {}
+        start = time.perf_counter()
+        keyword = self.executor.submit(self.keyword_ranking, query, timings)
+        vector = self.executor.submit(self.vector_ranking, query, query_vector, timings)
+        rankings = [keyword.result(), vector.result()]
+
+        ids, scores = self._timed(timings, 'fusion_ms', reciprocal_rank_fusion, rankings, self.rrf_k, self.weights)
+        if rerank and self.reranker is not None and len(ids):
+            # Early termination: the reranker only sees the head of the fused list
+            ids, scores = ids[:self.rerank_depth], scores[:self.rerank_depth]
+            scores = self._timed(timings, 'rerank_ms', self.reranker, query, ids, scores)
+            order = np.argsort(-scores, kind='stable')
+            ids, scores = ids[order], scores[order]
+        timings['total_ms'] = (time.perf_counter() - start) * 1000
+        logger.debug("Hybrid search for %r: %s", query, timings)
+        return ids[:k], scores[:k], timings
@@ -0,0 +1,334 @@
+'''Run metrics for the pipeline: counters, gauges and latency histograms.
+
+Stages record into the process-wide ``REGISTRY``:
+
+    metrics.counter('http_requests_total', host='export.arxiv.org').inc()
+    with metrics.timer('stage_seconds', stage='arxiv_parse'):
+        ...
+
+Histograms have fixed buckets, so an observation is a bisect and two
+additions under a lock; nothing is stored per event and recording stays
+on in production. ``report()`` summarises everything as JSON (counts,
+mean and bucket-estimated percentiles, cache hit rates) and
+``prometheus()`` renders the text exposition format.
+
+``profile(mode, path)`` wraps a run in cProfile or in a sampling profiler
+that sees every thread (cProfile only profiles the thread it runs in,
+while fetching happens on the scheduler's worker threads).
+'''
+import bisect
+import collections
+import contextlib
+import json
+import logging
+import math
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds, from sub-millisecond parsing to slow network round trips
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class Gauge:
+    '''A value that goes up and down, e.g. a queue depth; remembers its maximum.'''
+
+    def __init__(self):
+        self.value = 0
+        self.max = 0
+        self.lock = threading.Lock()
+
+    def set(self, value):
+        with self.lock:
+            self.value = value
+            self.max = max(self.max, value)
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+            self.max = max(self.max, self.value)
+
+    def dec(self, amount=1):
+        with self.lock:
+            self.value -= amount
+
+
+class Histogram:
+    '''Cumulative-bucket histogram of durations in seconds.'''
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # The last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    @contextlib.contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def quantile(self, q):
+        '''Estimates a quantile by linear interpolation inside its bucket.'''
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                low = self.buckets[index - 1] if index else 0.0
+                high = self.buckets[index] if index < len(self.buckets) else self.max
+                return min(low + (high - low) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+    def summary(self):
+        return {'count': self.count, 'sum_s': round(self.sum, 6),
+                'mean_ms': round(self.sum / self.count * 1000, 3) if self.count else 0.0,
+                'p50_ms': round(self.quantile(0.5) * 1000, 3), 'p95_ms': round(self.quantile(0.95) * 1000, 3),
+                'p99_ms': round(self.quantile(0.99) * 1000, 3), 'max_ms': round(self.max * 1000, 3)}
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in pairs) + '}'
+
+
+class MetricsRegistry:
+    '''Named metric series, created on first use and keyed by name and labels.'''
+
+    def __init__(self):
+        self.series = {}
+        self.types = {}
+        self.descriptions = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+    def _get(self, kind, name, labels, factory):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self.series.get(key)
+        if metric is None:
+            with self.lock:
+                if self.types.setdefault(name, kind) != kind:
+                    raise ValueError(f"Metric '{name}' is a {self.types[name]}, not a {kind}")
+                metric = self.series.setdefault(key, factory())
+        return metric
+
+    def describe(self, name, text):
+        '''Sets the help text shown for ``name`` in the Prometheus output.'''
+        self.descriptions[name] = text
+
+    def counter(self, name, **labels):
+        return self._get('counter', name, labels, Counter)
+
+    def gauge(self, name, **labels):
+        return self._get('gauge', name, labels, Gauge)
+
+    def histogram(self, name, buckets=DEFAULT_BUCKETS, **labels):
+        return self._get('histogram', name, labels, lambda: Histogram(buckets))
+
+    def timer(self, name, **labels):
+        '''Context manager observing the duration of its block into a histogram.'''
+        return self.histogram(name, **labels).time()
+
+    def reset(self):
+        with self.lock:
+            self.series.clear()
+            self.types.clear()
+            self.started = time.time()
+
+    def _sorted_series(self):
+        with self.lock:
+            return sorted(self.series.items(), key=lambda item: (item[0][0], item[0][1]))
+
+    def report(self):
+        '''A JSON-serialisable summary of every series, grouped by metric type.'''
+        report = {'started': self.started, 'duration_s': round(time.time() - self.started, 3),
+                  'counters': {}, 'gauges': {}, 'histograms': {}, 'cache_hit_rates': {}}
+        for (name, labels), metric in self._sorted_series():
+            series_name = name + format_labels(labels)
+            if isinstance(metric, Counter):
+                report['counters'][series_name] = metric.value
+            elif isinstance(metric, Gauge):
+                report['gauges'][series_name] = {'value': metric.value, 'max': metric.max}
+            else:
+                report['histograms'][series_name] = metric.summary()
+
+        # <cache>_hits_total and <cache>_misses_total pairs become <cache>_hit_rate
+        counters = report['counters']
+        for series_name, hits in counters.items():
+            if '_hits_total' not in series_name:
+                continue
+            misses = counters.get(series_name.replace('_hits_total', '_misses_total'), 0)
+            if hits + misses:
+                report['cache_hit_rates'][series_name.replace('_hits_total', '_hit_rate')] = round(hits / (hits + misses), 4)
+        return report
+
+    def prometheus(self):
+        '''The metrics in the Prometheus text exposition format (version 0.0.4).'''
+        lines = []
+        described = set()
+        for (name, labels), metric in self._sorted_series():
+            if name not in described:
+                described.add(name)
+                if name in self.descriptions:
+                    lines.append(f'# HELP {name} {self.descriptions[name]}')
+                lines.append(f'# TYPE {name} {self.types[name]}')
+            if isinstance(metric, Counter):
+                lines.append(f'{name}{format_labels(labels)} {metric.value}')
+            elif isinstance(metric, Gauge):
+                lines.append(f'{name}{format_labels(labels)} {metric.value}')
+            else:
+                cumulative = 0
+                for bound, count in zip([*metric.buckets, math.inf], metric.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == math.inf else repr(float(bound))
+                    lines.append(f'{name}_bucket{format_labels(labels, [("le", le)])} {cumulative}')
+                lines.append(f'{name}_sum{format_labels(labels)} {metric.sum!r}')
+                lines.append(f'{name}_count{format_labels(labels)} {metric.count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_report(self, path, **extra):
+        '''Writes ``report()``, plus any ``extra`` top-level sections, as JSON.'''
+        with open(path, 'w') as f:
+            json.dump({**self.report(), **extra}, f, indent=4)
+
+    def write_prometheus(self, path):
+        with open(path, 'w') as f:
+            f.write(self.prometheus())
+
+
+REGISTRY = MetricsRegistry()
+
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+timer = REGISTRY.timer
+describe = REGISTRY.describe
+
+describe('stage_seconds', 'Time spent per call of a pipeline stage')
+describe('http_request_seconds', 'Duration of HTTP GETs that reached the network')
+describe('http_requests_total', 'HTTP GETs sent, including retries')
+describe('http_retries_total', 'HTTP GETs that failed and were retried')
+describe('http_failures_total', 'URLs given up on after all retries')
+describe('http_response_bytes_total', 'Bytes of successful HTTP response bodies')
+describe('rate_limit_wait_seconds', 'Time spent waiting for a per-host rate limit token')
+describe('fetch_queue_depth', 'Items queued or running on the fetch worker pool')
+
+
+class StackSampler:
+    '''Samples the stacks of every thread at a fixed interval.
+
+    Counts are kept per collapsed stack ("outer;inner;leaf"), the input
+    format of flamegraph.pl and speedscope.
+    '''
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    @staticmethod
+    def collapse(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{code.co_name} ({code.co_filename.rsplit("/", 1)[-1]}:{code.co_firstlineno})')
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own:
+                    self.stacks[self.collapse(frame)] += 1
+            self.samples += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            f.writelines(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def top(self, n=20):
+        '''The ``n`` functions seen on top of a stack most often, with their share of samples.'''
+        leaves = collections.Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [(name, count / total) for name, count in leaves.most_common(n)]
+
+
+@contextlib.contextmanager
+def profile(mode, path):
+    '''Profiles the enclosed block and writes the result to ``path``.
+
+    ``mode`` is "cprofile" (pstats file, load with ``python -m pstats``)
+    or "sample" (collapsed stacks of all threads, for flame graphs).
+    '''
+    if mode == 'cprofile':
+        import cProfile
+        import io
+        import pstats
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(20)
+            logger.info("cProfile results written to %s\n%s", path, output.getvalue())
+    elif mode == 'sample':
+        sampler = StackSampler()
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            sampler.write(path)
+            top = '\n'.join(f'{share:7.1%}  {name}' for name, share in sampler.top())
+            logger.info("%d stack samples written to %s; busiest functions:\n%s", sampler.samples, path, top)
+    else:
+        raise ValueError(f"Unknown profiler '{mode}', expected 'cprofile' or 'sample'")
@@ -0,0 +1,182 @@
+'''Columnar on-disk paper repository backed by Parquet.
+
+A PaperStore is a directory of Parquet part files that share one schema:
+
+    arxiv_id, title, url, abstract, conference  string
+    authors                                     list<string>
+    year                                        int32
+    embedding                                   fixed_size_list<float32>
+
+Appending writes a new part file, so existing data is never rewritten.
+The name of the model that produced the embeddings is kept in the Parquet
+metadata, so that queries are never embedded with a different one.
+Reads are memory-mapped and can project just the columns a caller needs,
+which lets the app load titles and authors without touching abstracts or
+embeddings.
+
+Convert the existing JSON/CSV repository once with:
+
+    python paper_store.py papers_repository.json papers_store
+'''
+import argparse
+import ast
+import csv
+import glob
+import json
+import logging
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from fetchers import canonical_arxiv_id
+
+logger = logging.getLogger(__name__)
+
+STRING_COLUMNS = ['arxiv_id', 'title', 'url', 'abstract', 'conference']
+
+
+def schema(dim=None):
+    fields = [pa.field(name, pa.string()) for name in STRING_COLUMNS]
+    fields.insert(3, pa.field('authors', pa.list_(pa.string())))
+    fields.append(pa.field('year', pa.int32()))
+    if dim:
+        fields.append(pa.field('embedding', pa.list_(pa.float32(), dim)))
+    return pa.schema(fields)
+
+
+class PaperStore:
+    '''Append-only columnar store of papers and optional fixed-width embeddings.'''
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def parts(self):
+        return sorted(glob.glob(os.path.join(self.directory, 'part-*.parquet')))
+
+    def dim(self):
+        '''Embedding width of the stored data, or None without embeddings.'''
+        parts = self.parts()
+        if not parts:
+            return None
+        part_schema = pq.read_schema(parts[0])
+        if 'embedding' not in part_schema.names:
+            return None
+        return part_schema.field('embedding').type.list_size
+
+    def embedding_model(self):
+        '''Name of the model of the stored embeddings, or None if unknown or without embeddings.'''
+        parts = self.parts()
+        if not parts:
+            return None
+        model = (pq.read_schema(parts[0]).metadata or {}).get(b'embedding_model')
+        return model.decode() if model else None
+
+    def _model_metadata(self, model):
+        '''Schema metadata recording ``model``, which must be the model already stored, if any.'''
+        stored = self.embedding_model()
+        if model is not None and stored is not None and model != stored:
+            raise ValueError(f"This store holds embeddings of '{stored}', not '{model}'")
+        model = model or stored
+        return {'embedding_model': model} if model else None
+
+    def append(self, papers, embeddings=None, model=None):
+        '''Writes ``papers`` (and their ``embeddings`` by ``model``, if given) as a new part file.'''
+        if not papers:
+            return
+        dim = self.dim()
+        if embeddings is not None:
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+            if dim is not None and embeddings.shape[1] != dim:
+                raise ValueError(f"Expected {dim}-dimensional embeddings, got {embeddings.shape[1]}")
+            dim = embeddings.shape[1]
+        elif dim is not None:
+            raise ValueError("This store holds embeddings; append papers together with theirs")
+
+        columns = {name: [paper.get(name) for paper in papers] for name in STRING_COLUMNS}
+        columns['arxiv_id'] = [canonical_arxiv_id(paper) for paper in papers]
+        columns['authors'] = [paper.get('authors') or [] for paper in papers]
+        columns['year'] = [paper.get('year') for paper in papers]
+        if dim:
+            columns['embedding'] = pa.FixedSizeListArray.from_arrays(pa.array(embeddings.ravel()), dim)
+        table = pa.table(columns, schema=schema(dim).with_metadata(self._model_metadata(model) if dim else None))
+
+        path = os.path.join(self.directory, f'part-{len(self.parts()):05d}.parquet')
+        pq.write_table(table, path)
+        logger.info("Appended %d papers to '%s'", len(papers), path)
+
+    def store_papers(self, papers):
+        '''Appends papers that may carry an 'embedding' key, so the store works as a sinks.DALSink target.'''
+        embeddings = [paper['embedding'] for paper in papers if 'embedding' in paper] or None
+        self.append(papers, embeddings)
+
+    def read(self, columns=None):
+        '''Returns a memory-mapped pyarrow Table with only ``columns`` loaded.'''
+        parts = self.parts()
+        if not parts:
+            return schema().empty_table().select(columns) if columns else schema().empty_table()
+        return pa.concat_tables(pq.read_table(path, columns=columns, memory_map=True) for path in parts)
+
+    def records(self, columns=None):
+        '''The stored papers as a list of dicts, restricted to ``columns``.'''
+        return self.read(columns).to_pylist()
+
+    def embeddings(self):
+        '''All embeddings as an (n, dim) float32 array.'''
+        column = self.read(['embedding']).column('embedding').combine_chunks()
+        return column.values.to_numpy(zero_copy_only=False).reshape(len(column), -1)
+
+    def __len__(self):
+        return sum(pq.ParquetFile(path).metadata.num_rows for path in self.parts())
+
+
+def is_paper_store(directory):
+    '''True for directories holding PaperStore part files.'''
+    return os.path.isdir(directory) and bool(PaperStore(directory).parts())
+
+
+def read_legacy_papers(path):
+    '''Loads papers from the old papers_repository.json/.jsonl, a scraper CSV or a shard directory.'''
+    if os.path.isdir(path):
+        from shards import is_shard_directory, read_papers
+        if not is_shard_directory(path):
+            raise ValueError(f"'{path}' is neither a shard directory (no manifest.json) nor a PaperStore")
+        return list(read_papers(path))
+    if path.endswith('.jsonl'):
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    if path.endswith('.csv'):
+        with open(path, newline='') as f:
+            papers = list(csv.DictReader(f))
+        for paper in papers:
+            # CSVs written from DataFrames store author lists as their repr
+            if paper.get('authors', '').startswith('['):
+                paper['authors'] = ast.literal_eval(paper['authors'])
+        return papers
+    with open(path) as f:
+        return json.load(f)
+
+
+def convert(source, directory, conference=None, year=None):
+    '''One-shot conversion of a JSON/JSONL/CSV repository into a PaperStore.'''
+    papers = read_legacy_papers(source)
+    for paper in papers:
+        paper.setdefault('conference', conference)
+        paper.setdefault('year', year)
+    store = PaperStore(directory)
+    store.append(papers)
+    return store
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert a JSON/JSONL/CSV paper repository to a Parquet PaperStore")
+    parser.add_argument("source", help="papers_repository.json, .jsonl or a scraper CSV")
+    parser.add_argument("directory", help="PaperStore directory to append to")
+    parser.add_argument("--conference", type=str, default=None, help="Conference to record for these papers")
+    parser.add_argument("--year", type=int, default=None, help="Year to record for these papers")
+    args = parser.parse_args()
+
+    store = convert(args.source, args.directory, args.conference, args.year)
+    print(f"'{args.directory}' now holds {len(store)} papers")
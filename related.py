@@ -0,0 +1,263 @@
+'''Precomputed "related papers" graph and topic clusters for a PaperStore.
+
+An offline job computes, from the stored embeddings:
+
+- the k nearest neighbours of every paper by cosine similarity, with
+  blocked matrix products so that only a block of the N x N similarity
+  matrix exists at any time;
+- topics, by spherical mini-batch k-means, labelled with the title terms
+  most specific to each cluster.
+
+The results are compact arrays in a directory next to the store
+(``papers_store.related`` for ``papers_store``):
+
+    neighbors.npy        int32   (n, k) row numbers, -1 where fewer exist
+    neighbor_scores.npy  float16 (n, k) cosine similarities
+    topics.npy           int32   (n,) topic of every paper
+    centroids.npy        float32 (topics, dim)
+    topics.json          topic labels and the number of papers covered
+
+so "related papers" and "browse by topic" are array lookups. When papers
+are appended to the store, a rebuild only scores the new rows against
+the corpus (and the old rows against the new ones) and assigns the new
+papers to the existing topics.
+
+    python related.py papers_store --k 10 --topics 50
+'''
+import argparse
+import json
+import logging
+import os
+from collections import Counter
+
+import numpy as np
+
+from paper_store import PaperStore
+from resolver import STOPWORDS
+from search_index import tokenize
+from vector_index import IVFIndex, normalize
+
+logger = logging.getLogger(__name__)
+
+# Rows per block of the similarity matrix: BLOCK_SIZE x BLOCK_SIZE float32 scores in memory at a time
+BLOCK_SIZE = 2048
+
+
+def merge_top_k(ids, scores, new_ids, new_scores, k):
+    '''Keeps the ``k`` best of two (rows, candidates) id/score arrays, unsorted.'''
+    ids = np.concatenate([ids, new_ids], axis=1)
+    scores = np.concatenate([scores, new_scores], axis=1)
+    if scores.shape[1] > k:
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        ids, scores = np.take_along_axis(ids, best, axis=1), np.take_along_axis(scores, best, axis=1)
+    return ids, scores
+
+
+def sort_rows(ids, scores):
+    order = np.argsort(-scores, axis=1, kind='stable')
+    return np.take_along_axis(ids, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+def merge_block(all_ids, all_scores, rows, columns, block_scores, k):
+    '''Merges the scores of ``rows`` against ``columns`` into their running top-k lists.'''
+    block_ids = np.broadcast_to(np.arange(columns.start, columns.stop), block_scores.shape)
+    ids, scores = merge_top_k(all_ids[rows.start:rows.stop], all_scores[rows.start:rows.stop],
+                              block_ids, block_scores, k)
+    all_ids[rows.start:rows.stop], all_scores[rows.start:rows.stop] = ids, scores
+
+
+def knn_graph(matrix, k, start=0, neighbors=None, scores=None, block_size=BLOCK_SIZE):
+    '''k-nearest-neighbour lists of every row of the L2-normalised ``matrix``.
+
+    Similarities are symmetric, so each pair of blocks is multiplied once
+    and feeds the lists of both. With ``neighbors``/``scores`` from a graph
+    of the first ``start`` rows, pairs of two old blocks are skipped: only
+    the new rows are scored, against everything.
+    '''
+    n = len(matrix)
+    all_ids = np.full((n, k), -1, dtype=np.int64)
+    all_scores = np.full((n, k), -np.inf, dtype=np.float32)
+    if start:
+        all_ids[:start] = neighbors
+        all_scores[:start] = np.where(neighbors >= 0, scores, -np.inf)
+
+    # Blocks never straddle the old/new boundary
+    bounds = [*range(0, start, block_size), *range(start, n, block_size), n]
+    blocks = [range(low, high) for low, high in zip(bounds, bounds[1:])]
+    for i, rows in enumerate(blocks):
+        queries = np.asarray(matrix[rows.start:rows.stop])
+        for columns in blocks[i:]:
+            if columns.stop <= start:
+                continue
+            block_scores = queries @ np.asarray(matrix[columns.start:columns.stop]).T
+            if columns is rows:
+                np.fill_diagonal(block_scores, -np.inf)
+            merge_block(all_ids, all_scores, rows, columns, block_scores, k)
+            if columns is not rows:
+                merge_block(all_ids, all_scores, columns, rows, block_scores.T, k)
+        logger.debug("Neighbours computed for papers %d-%d of %d", rows.start, rows.stop, n)
+
+    all_ids, all_scores = sort_rows(all_ids, all_scores)
+    all_ids[np.isneginf(all_scores)] = -1
+    all_scores[all_ids < 0] = 0
+    return all_ids.astype(np.int32), all_scores.astype(np.float16)
+
+
+def minibatch_kmeans(matrix, n_clusters, batch_size=1024, iterations=100, seed=0):
+    '''Spherical mini-batch k-means (Sculley, 2010); returns unit-length centroids.'''
+    rng = np.random.default_rng(seed)
+    n = len(matrix)
+    centroids = normalize(matrix[np.sort(rng.choice(n, n_clusters, replace=False))])
+    counts = np.zeros(n_clusters)
+    for _ in range(iterations):
+        batch = np.asarray(matrix[np.sort(rng.choice(n, min(batch_size, n), replace=False))])
+        assignments = np.argmax(batch @ centroids.T, axis=1)
+        batch_counts = np.bincount(assignments, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, batch)
+        counts += batch_counts
+        # Per-centroid learning rate: a centroid moves less the more points it has seen
+        updated = batch_counts > 0
+        rate = (batch_counts[updated] / counts[updated])[:, None]
+        centroids[updated] = (1 - rate) * centroids[updated] + rate * sums[updated] / batch_counts[updated, None]
+        centroids = normalize(centroids)
+    return centroids
+
+
+def topic_labels(titles, topics, n_topics, n_terms=3):
+    '''Labels each topic with the title terms most specific to it (document frequency x idf).'''
+    documents = [{word for word in tokenize(title) if word not in STOPWORDS and not word.isdigit()}
+                 for title in titles]
+    frequency = Counter(word for words in documents for word in words)
+    by_topic = [Counter() for _ in range(n_topics)]
+    for topic, words in zip(topics, documents):
+        by_topic[topic].update(words)
+    labels = []
+    for counts in by_topic:
+        ranked = sorted(counts, key=lambda word: (-counts[word] * np.log(len(documents) / frequency[word]), word))
+        labels.append(', '.join(ranked[:n_terms]))
+    return labels
+
+
+def related_directory(store_directory):
+    return store_directory.rstrip('/') + '.related'
+
+
+def replace_file(path, write):
+    '''Calls ``write`` on a binary file next to ``path``, then atomically renames it to ``path``.'''
+    partial = path + '.part'
+    with open(partial, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(partial, path)
+
+
+class RelatedPapers:
+    '''Loaded neighbour lists and topics; lookups are array indexing.'''
+
+    def __init__(self, neighbors, scores, topics, centroids, labels):
+        self.neighbors = neighbors
+        self.scores = scores
+        self.topics = topics
+        self.centroids = centroids
+        self.labels = labels
+        order = np.argsort(topics, kind='stable')
+        self.topic_order = order
+        self.topic_bounds = np.searchsorted(topics[order], np.arange(len(labels) + 1))
+
+    def __len__(self):
+        return len(self.topics)
+
+    def related(self, row, k=None):
+        '''``(rows, scores)`` of the papers most similar to paper ``row``.'''
+        ids = self.neighbors[row][:k]
+        keep = ids >= 0
+        return ids[keep], self.scores[row][:k][keep].astype(np.float32)
+
+    def topic_of(self, row):
+        return int(self.topics[row])
+
+    def members(self, topic):
+        '''Rows of the papers in ``topic``, in store order.'''
+        return self.topic_order[self.topic_bounds[topic]:self.topic_bounds[topic + 1]]
+
+    def topic_sizes(self):
+        return np.diff(self.topic_bounds)
+
+    def save(self, directory):
+        '''Writes every file under a temporary name and renames it into place.
+
+        Readers may have the previous arrays memory-mapped (the app keeps
+        them loaded), so files are replaced, never rewritten in place.
+        topics.json goes last: a reader that sees the new one finds the
+        new arrays next to it.
+        '''
+        os.makedirs(directory, exist_ok=True)
+        for name, array in [('neighbors.npy', self.neighbors), ('neighbor_scores.npy', self.scores),
+                            ('topics.npy', self.topics), ('centroids.npy', self.centroids)]:
+            replace_file(os.path.join(directory, name), lambda f: np.save(f, array))
+        replace_file(os.path.join(directory, 'topics.json'), lambda f: f.write(
+            json.dumps({'papers': len(self), 'labels': self.labels}, indent=4).encode()))
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, 'topics.json')) as f:
+            labels = json.load(f)['labels']
+        # Neighbour lists are memory-mapped: a lookup reads one row from disk
+        return cls(np.load(os.path.join(directory, 'neighbors.npy'), mmap_mode='r'),
+                   np.load(os.path.join(directory, 'neighbor_scores.npy'), mmap_mode='r'),
+                   np.load(os.path.join(directory, 'topics.npy')),
+                   np.load(os.path.join(directory, 'centroids.npy')), labels)
+
+
+def build(store_directory, k=10, n_topics=None, rebuild=False):
+    '''Builds or incrementally extends the related-papers data of a PaperStore.
+
+    Without ``rebuild``, data for the first n papers is reused when the
+    store has grown since it was built: only new rows get scored and new
+    papers join the existing topics.
+    '''
+    store = PaperStore(store_directory)
+    if not store.dim():
+        raise ValueError(f"'{store_directory}' holds no embeddings to relate papers by")
+    matrix = normalize(store.embeddings())
+    titles = [paper['title'] for paper in store.records(['title'])]
+    directory = related_directory(store_directory)
+
+    previous = None
+    if not rebuild and os.path.exists(os.path.join(directory, 'topics.json')):
+        previous = RelatedPapers.load(directory)
+        if len(previous) > len(matrix) or previous.neighbors.shape[1] != k:
+            previous = None  # The store was rewritten or k changed
+
+    if previous is not None:
+        start = len(previous)
+        neighbors, scores = knn_graph(matrix, k, start, np.asarray(previous.neighbors),
+                                      np.asarray(previous.scores, dtype=np.float32))
+        centroids = previous.centroids
+        topics = np.concatenate([previous.topics, IVFIndex.assign(matrix[start:], centroids)]).astype(np.int32)
+        logger.info("Extended related papers from %d to %d papers", start, len(matrix))
+    else:
+        n_topics = min(n_topics or max(1, int(np.sqrt(len(matrix) / 2))), len(matrix))
+        neighbors, scores = knn_graph(matrix, k)
+        centroids = minibatch_kmeans(matrix, n_topics)
+        topics = IVFIndex.assign(matrix, centroids).astype(np.int32)
+        logger.info("Built related papers for %d papers in %d topics", len(matrix), n_topics)
+
+    related = RelatedPapers(neighbors, scores, topics, centroids, topic_labels(titles, topics, len(centroids)))
+    related.save(directory)
+    return related
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Precompute related papers and topics for a PaperStore")
+    parser.add_argument("store", help="PaperStore directory with embeddings")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours kept per paper")
+    parser.add_argument("--topics", type=int, default=None, help="Number of topics (default sqrt(n/2))")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute everything instead of extending")
+    args = parser.parse_args()
+
+    related = build(args.store, args.k, args.topics, args.rebuild)
+    print(f"Wrote related papers and {len(related.labels)} topics to '{related_directory(args.store)}'")
@@ -0,0 +1,225 @@
+'''Resolve conference paper titles to arXiv ids with a local fuzzy-match index.
+
+Sources such as the AAAI accepted-papers PDF list titles and authors but
+no arXiv links. TitleIndex holds arXiv titles offline (built once from an
+arXiv metadata dump, e.g. the JSONL snapshot published on Kaggle):
+
+1. titles are normalised (accents, case, punctuation) and reduced to
+   their content words;
+2. MinHash signatures of those words are banded for locality-sensitive
+   hashing, so a lookup only touches titles that share a band;
+3. candidates are reranked by edit-distance similarity and checked for
+   author surname overlap.
+
+ArxivResolver batches and caches lookups and records a confidence score
+with every paper it resolves.
+
+    python resolver.py build arxiv-metadata-oai-snapshot.json arxiv_titles.pkl
+    python resolver.py resolve arxiv_titles.pkl aaai_papers.json
+'''
+import argparse
+import json
+import logging
+import os
+import pickle
+import re
+import zlib
+
+import numpy as np
+from rapidfuzz import fuzz
+
+from search_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+STOPWORDS = {'a', 'an', 'and', 'are', 'as', 'at', 'by', 'for', 'from', 'in', 'into', 'is', 'of', 'on', 'or',
+             'the', 'to', 'towards', 'via', 'with'}
+PRIME = (1 << 31) - 1
+AUTHOR_SPLIT_RE = re.compile(r',|\band\b|;')
+
+
+def normalize_title(title):
+    return ' '.join(tokenize(title))
+
+
+def title_words(title):
+    return {word for word in tokenize(title) if word not in STOPWORDS} or set(tokenize(title))
+
+
+def surnames(authors):
+    '''Folded last names from an author list or an arXiv "A, B and C" string.'''
+    if isinstance(authors, str):
+        authors = AUTHOR_SPLIT_RE.split(authors)
+    names = set()
+    for author in authors or []:
+        tokens = tokenize(author)
+        if tokens:
+            names.add(tokens[-1])
+    return names
+
+
+class MinHasher:
+    '''MinHash signatures over sets of words, split into LSH bands.'''
+
+    def __init__(self, bands=16, rows=4, seed=1):
+        self.bands = bands
+        self.rows = rows
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, PRIME, bands * rows, dtype=np.uint64)
+        self.b = rng.integers(0, PRIME, bands * rows, dtype=np.uint64)
+        self.mix = rng.integers(1, 1 << 62, rows, dtype=np.uint64) | np.uint64(1)
+
+    def band_keys(self, words):
+        hashes = np.fromiter((zlib.crc32(word.encode()) for word in words), dtype=np.uint64, count=len(words))
+        signature = ((self.a[:, None] * hashes[None, :] + self.b[:, None]) % PRIME).min(axis=1)
+        # One uint64 key per band; wrap-around multiplication is fine for hashing
+        return (signature.reshape(self.bands, self.rows) * self.mix).sum(axis=1)
+
+
+class TitleIndex:
+    '''LSH index of arXiv titles, persisted as a single pickle file.'''
+
+    def __init__(self, hasher, ids, titles, authors, band_keys):
+        self.hasher = hasher
+        self.ids = ids
+        self.titles = titles        # normalised titles, for reranking
+        self.authors = authors      # surname sets, for the author check
+        self.order = np.argsort(band_keys, axis=0, kind='stable')
+        self.sorted_keys = np.take_along_axis(band_keys, self.order, axis=0)
+
+    @classmethod
+    def build(cls, records, hasher=None):
+        '''Builds the index from dicts with 'id', 'title' and 'authors'.'''
+        hasher = hasher or MinHasher()
+        ids, titles, authors, keys = [], [], [], []
+        for record in records:
+            words = title_words(record['title'])
+            if not words:
+                continue
+            ids.append(record['id'])
+            titles.append(normalize_title(record['title']))
+            authors.append(surnames(record.get('authors')))
+            keys.append(hasher.band_keys(list(words)))
+        band_keys = np.array(keys, dtype=np.uint64).reshape(len(keys), hasher.bands)
+        logger.info("Indexed %d arXiv titles", len(ids))
+        return cls(hasher, ids, titles, authors, band_keys)
+
+    def candidates(self, title):
+        '''Rows whose titles share at least one LSH band with ``title``.'''
+        words = title_words(title)
+        if not words or not self.ids:
+            return set()
+        rows = set()
+        for band, key in enumerate(self.hasher.band_keys(list(words))):
+            column = self.sorted_keys[:, band]
+            start, end = np.searchsorted(column, key, 'left'), np.searchsorted(column, key, 'right')
+            rows.update(self.order[start:end, band].tolist())
+        return rows
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+class ArxivResolver:
+    '''Matches paper titles (and authors) to arXiv ids using a TitleIndex.
+
+    A match is accepted when its confidence reaches ``threshold``.
+    Confidence is the title similarity, blended with the share of the
+    paper's author surnames found on the arXiv record when both have
+    authors. Results are cached by normalised title and author surnames,
+    optionally on disk. The cache holds the best candidate and its confidence whether or not it
+    passed, and the threshold is applied on every lookup, so changing the
+    threshold never reuses a decision made under another one.
+    '''
+
+    def __init__(self, index, threshold=0.85, cache_path=None):
+        self.index = index
+        self.threshold = threshold
+        self.cache_path = cache_path
+        self.cache = {}
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path) as f:
+                self.cache = json.load(f)
+
+    def score(self, title, authors, row):
+        title_similarity = fuzz.ratio(normalize_title(title), self.index.titles[row]) / 100
+        query_surnames = surnames(authors)
+        if not query_surnames or not self.index.authors[row]:
+            return title_similarity
+        overlap = len(query_surnames & self.index.authors[row]) / len(query_surnames)
+        return 0.8 * title_similarity + 0.2 * overlap
+
+    def resolve(self, title, authors=None):
+        '''Returns ``(arxiv_id, confidence)``, with arxiv_id None below the threshold.'''
+        # Authors weigh in the confidence, so they are part of the key
+        key = f"{normalize_title(title)}|{' '.join(sorted(surnames(authors)))}"
+        cached = self.cache.get(key)
+        # Caches written before the threshold moved out of them hold no id for rejected candidates.
+        # (Caches keyed by title alone are never hit: their keys have no '|'.)
+        if cached is None or (cached[0] is None and cached[1] >= self.threshold):
+            best, best_score = None, 0.0
+            for row in self.index.candidates(title):
+                score = self.score(title, authors, row)
+                if score > best_score:
+                    best, best_score = row, score
+            self.cache[key] = [self.index.ids[best] if best is not None else None, round(best_score, 4)]
+        arxiv_id, confidence = self.cache[key]
+        return (arxiv_id if confidence >= self.threshold else None), confidence
+
+    def resolve_many(self, papers):
+        '''Resolves a batch of papers, then persists the cache once.'''
+        results = [self.resolve(paper['title'], paper.get('authors')) for paper in papers]
+        if self.cache_path:
+            with open(self.cache_path, 'w') as f:
+                json.dump(self.cache, f)
+        resolved = sum(arxiv_id is not None for arxiv_id, _ in results)
+        logger.info("Resolved %d of %d titles to arXiv", resolved, len(papers))
+        return results
+
+    def resolve_papers(self, papers):
+        '''Adds 'arxiv_id', 'url' and 'match_confidence' to every paper, in place.'''
+        for paper, (arxiv_id, confidence) in zip(papers, self.resolve_many(papers)):
+            paper['arxiv_id'] = arxiv_id
+            paper['match_confidence'] = confidence
+            if arxiv_id is not None:
+                paper.setdefault('url', f'http://arxiv.org/abs/{arxiv_id}')
+        return papers
+
+
+def read_arxiv_metadata(path):
+    '''Yields id/title/authors records from an arXiv metadata JSONL dump.'''
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            yield {'id': record['id'], 'title': record['title'], 'authors': record.get('authors')}
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Resolve conference paper titles to arXiv ids offline")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="Build a title index from an arXiv metadata JSONL dump")
+    build.add_argument("metadata", help="arXiv metadata JSONL (one record per line)")
+    build.add_argument("index", help="Where to write the index")
+    resolve = commands.add_parser('resolve', help="Add arxiv_id and match_confidence to a JSON list of papers")
+    resolve.add_argument("index", help="Index written by the build command")
+    resolve.add_argument("papers", help="JSON file with a list of papers; updated in place")
+    resolve.add_argument("--threshold", type=float, default=0.85, help="Minimum confidence to accept a match")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        TitleIndex.build(read_arxiv_metadata(args.metadata)).save(args.index)
+    else:
+        with open(args.papers) as f:
+            papers = json.load(f)
+        resolver = ArxivResolver(TitleIndex.load(args.index), args.threshold,
+                                 cache_path=args.papers + '.resolver_cache.json')
+        resolver.resolve_papers(papers)
+        with open(args.papers, 'w') as f:
+            json.dump(papers, f, indent=4)
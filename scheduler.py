@@ -0,0 +1,179 @@
+'''Concurrent, rate-limited HTTP fetching shared by the fetchers and scrapers.
+
+A FetchScheduler owns a pooled requests.Session, a thread pool that bounds
+how many requests are in flight, and one token bucket per host so that we
+stay within each source's published rate limit. Retries back off inside the
+worker thread that issued the request, so other in-flight work keeps going.
+Only transient failures are retried: connection errors, timeouts, 5xx and
+429 (after its Retry-After, if given). Any other 4xx means the resource is
+not there, and returns None at once.
+With a ResponseCache attached, cached responses are served before any rate
+limiting so a fully cached run makes no network calls at all.
+'''
+import logging
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Failures worth another attempt; anything else (an invalid URL, say) will fail the same way again
+TRANSIENT_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError)
+
+# Requests per second allowed per host when nothing else is configured.
+# arXiv asks API clients to make no more than one request every three seconds.
+DEFAULT_HOST_RATES = {
+    'export.arxiv.org': 1 / 3,
+    # PDF downloads are held to the same pace
+    'arxiv.org': 1 / 3,
+}
+
+
+def retry_after(response):
+    '''Seconds to wait as asked by a Retry-After header (delta seconds or HTTP date), or None.'''
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return int(value)
+    try:
+        return max(0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    '''Thread-safe token bucket refilled at ``rate`` tokens per second.'''
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        '''Blocks until a token is available and takes it.'''
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class FetchScheduler:
+    '''Runs HTTP GETs with bounded concurrency, per-host rate limits and retries.
+
+    ``rate`` is the requests-per-second limit applied to hosts missing from
+    ``host_rates``; ``None`` leaves them unthrottled.
+    '''
+
+    def __init__(self, concurrency=4, rate=None, host_rates=None, max_retries=5, retry_delay=1, session=None,
+                 cache=None):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.host_rates = DEFAULT_HOST_RATES if host_rates is None else host_rates
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.session = session or self._make_session(concurrency)
+        self.cache = cache
+        self._buckets = {}
+        self._buckets_lock = threading.Lock()
+
+    @staticmethod
+    def _make_session(concurrency):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _bucket(self, host):
+        with self._buckets_lock:
+            if host not in self._buckets:
+                rate = self.host_rates.get(host, self.rate)
+                self._buckets[host] = TokenBucket(rate) if rate else None
+            return self._buckets[host]
+
+    def get(self, url, params=None, headers=None, use_cache=True, **kwargs):
+        '''GETs ``url``, retrying with exponential backoff.
+
+        Goes through the cache when one is attached, unless ``use_cache`` is
+        false (e.g. for large files stored elsewhere). Returns the response,
+        or None once all retries are exhausted.
+        '''
+        if self.cache is not None and use_cache:
+            return self.cache.get(url, lambda url, headers: self._send(url, headers=headers, **kwargs),
+                                  params=params, headers=headers)
+        return self._send(url, params=params, headers=headers, **kwargs)
+
+    def _send(self, url, **kwargs):
+        host = urlparse(url).netloc
+        bucket = self._bucket(host)
+        retry_delay = self.retry_delay
+        for attempt in range(self.max_retries):
+            if bucket is not None:
+                with metrics.timer('rate_limit_wait_seconds', host=host):
+                    bucket.acquire()
+            metrics.counter('http_requests_total', host=host).inc()
+            if attempt:
+                metrics.counter('http_retries_total', host=host).inc()
+            try:
+                with metrics.timer('http_request_seconds', host=host):
+                    response = self.session.get(url, **kwargs)
+                response.raise_for_status()  # Check for HTTP request errors
+                metrics.counter('http_response_bytes_total', host=host).inc(len(response.content))
+                logger.debug("Fetched %s on attempt #%d", url, attempt + 1)
+                return response
+            except requests.exceptions.HTTPError as e:
+                status = e.response.status_code
+                if status != 429 and status < 500:
+                    # 404, 403, 410...: retrying would only spend rate-limit tokens on the same answer
+                    metrics.counter('http_failures_total', host=host).inc()
+                    logger.warning("Giving up on %s: %s", url, e)
+                    return None
+                error, delay = e, retry_after(e.response) if status == 429 else None
+            except TRANSIENT_ERRORS as e:
+                error, delay = e, None
+            except requests.exceptions.RequestException as e:
+                metrics.counter('http_failures_total', host=host).inc()
+                logger.error("Failed to fetch %s: %s", url, e)
+                return None
+            delay = retry_delay if delay is None else delay
+            logger.warning("Attempt #%d for %s failed with error: %s. Retrying in %g seconds...",
+                           attempt + 1, url, error, delay)
+            time.sleep(delay)
+            retry_delay *= 2  # Exponential backoff
+        metrics.counter('http_failures_total', host=host).inc()
+        logger.error("Failed to fetch %s after %d attempts.", url, self.max_retries)
+        return None
+
+    def map(self, func, items):
+        '''Applies ``func`` to every item on the worker pool, returning results in input order.'''
+        items = list(items)
+        queue_depth = metrics.gauge('fetch_queue_depth')
+        queue_depth.inc(len(items))
+
+        def run(item):
+            try:
+                return func(item)
+            finally:
+                queue_depth.dec()
+
+        if self.concurrency <= 1 or len(items) <= 1:
+            return [run(item) for item in items]
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            return list(executor.map(run, items))
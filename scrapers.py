@@ -1,48 +1,221 @@
 import logging
-from bs4 import BeautifulSoup
-import requests
+import re
+from urllib.parse import urljoin
+
+import lxml.html
+
+import metrics
+from fetchers import ArxivFetcher
 
 # Configure logging for your module
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Conference name -> scraper class, filled in by @register
+SCRAPERS = {}
+# Registered names that stand for a whole site rather than one conference
+SITE_NAMES = {'cvf', 'openreview', 'pmlr'}
+# Conference and year in a listing URL, e.g. "ICCV2023" (CVF) or "ICLR.cc/2024" (OpenReview)
+VENUE_RE = re.compile(r'(?<![A-Za-z])([A-Za-z]+)(?:\.cc)?[/_-]?((?:19|20)\d{2})(?!\d)')
+
+def register(*names):
+    def decorator(cls):
+        for name in names:
+            SCRAPERS[name] = cls
+        return cls
+    return decorator
+
+def get_scraper(conference, fetcher, **kwargs):
+    '''Instantiates the scraper registered for ``conference`` (e.g. "iccv", "openreview", "pmlr").'''
+    try:
+        scraper_class = SCRAPERS[conference.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown conference '{conference}', expected one of: {', '.join(sorted(SCRAPERS))}") from None
+    scraper = scraper_class(fetcher, **kwargs)
+    scraper.conference = conference.lower()
+    return scraper
+
+def listing(title, url, authors=None, abstract=None, arxiv_id=None):
+    return {'title': title, 'url': url, 'authors': authors, 'abstract': abstract, 'arxiv_id': arxiv_id}
+
+def classes(element):
+    return (element.get('class') or '').split()
+
+def parse_cvf_listing(content, base_url=None):
+    '''Listings of a CVF open access page (ICCV, CVPR, WACV) that link to arXiv.
+
+    One forward sweep over the ``dt`` titles and the anchors: each arXiv
+    anchor belongs to the last title seen.
+    '''
+    root = lxml.html.fromstring(content)
+    listings, title = [], None
+    for element in root.iter('dt', 'a'):
+        if element.tag == 'dt':
+            title = element.text_content().strip()
+        elif title is not None and element.text and 'arXiv' in element.text:
+            link = element.get('href')
+            listings.append(listing(title, link, arxiv_id=ArxivFetcher.id_from_url(link)))
+    return listings
+
+def parse_openreview_listing(content, base_url='https://openreview.net'):
+    '''Listings of a saved OpenReview venue page: one ``li.note`` per submission.'''
+    root = lxml.html.fromstring(content)
+    listings = []
+    for note in root.iter('li'):
+        if 'note' not in classes(note):
+            continue
+        title = link = abstract = None
+        authors, field = [], None
+        for element in note.iter('a', 'strong', 'span', 'div'):
+            element_classes = classes(element)
+            if element.tag == 'a' and title is None and element.getparent().tag == 'h4':
+                title, link = element.text_content().strip(), urljoin(base_url, element.get('href'))
+            elif element.tag == 'div' and 'note-authors' in element_classes:
+                authors = [author.text_content().strip() for author in element.iter('a')]
+            elif element.tag == 'strong' and 'note-content-field' in element_classes:
+                field = element.text_content().strip().rstrip(':').lower()
+            elif element.tag == 'span' and 'note-content-value' in element_classes and field == 'abstract':
+                abstract = element.text_content().strip()
+        if title:
+            listings.append(listing(title, link, authors, abstract))
+    return listings
+
+def parse_pmlr_listing(content, base_url=None):
+    '''Listings of a PMLR proceedings volume: title, authors and abstract page per ``div.paper``.'''
+    root = lxml.html.fromstring(content)
+    listings = []
+    for element in root.iter('p', 'span', 'a'):
+        element_classes = classes(element)
+        if element.tag == 'p' and 'title' in element_classes:
+            listings.append(listing(element.text_content().strip(), None, authors=[]))
+        elif not listings:
+            continue
+        elif element.tag == 'span' and 'authors' in element_classes:
+            # Names are joined with non-breaking spaces on PMLR pages
+            names = (' '.join(author.split()) for author in element.text_content().split(','))
+            listings[-1]['authors'] = [name for name in names if name]
+        elif element.tag == 'a' and listings[-1]['url'] is None and (element.text or '').strip() == 'abs':
+            listings[-1]['url'] = urljoin(base_url or '', element.get('href'))
+    return listings
+
+def parse_pmlr_abstract(content):
+    abstracts = lxml.html.fromstring(content).xpath('//div[@id="abstract"]')
+    return abstracts[0].text_content().strip() if abstracts else None
+
 class Scraper:
-    def get_publications(self, url):
+    # Name the scraper was registered under, set by get_scraper
+    conference = None
+
+    def venue(self, url):
+        '''``{'conference': ..., 'year': ...}`` of a listing, from its URL or the registered name.'''
+        match = VENUE_RE.search(url or '')
+        if match:
+            return {'conference': match.group(1).upper(), 'year': int(match.group(2))}
+        conference = self.conference if self.conference not in SITE_NAMES else None
+        return {'conference': conference.upper() if conference else None, 'year': None}
+
+    def iter_publications(self, url):
+        '''Yields papers as they are fetched.'''
         raise NotImplementedError("Subclasses must implement this method!")
 
-class ICCVScraper(Scraper):
-    def __init__(self, fetcher, num_papers_to_scrape=None):
+    def get_publications(self, url):
+        return list(self.iter_publications(url))
+
+class ListingScraper(Scraper):
+    '''Scrapes a conference listing page, then completes the papers chunk by chunk.
+
+    Subclasses provide ``parse_listings(content, base_url)``, returning
+    dicts with title, url, authors, abstract and arxiv_id. Abstracts the
+    listing lacks are fetched from arXiv for papers that link there.
+    '''
+    parse_listings = None
+    # Whether listings carry arXiv ids, which incremental crawls are keyed by
+    arxiv_linked = False
+
+    def __init__(self, fetcher, num_papers_to_scrape=None, chunk_size=100):
         self.fetcher = fetcher
         self.num_papers_to_scrape = num_papers_to_scrape
-        logger.info("ICCVScraper instance created with fetcher %s and num_papers_to_scrape %s", fetcher, num_papers_to_scrape)
+        # Papers fetched per round before they are yielded downstream
+        self.chunk_size = chunk_size
+        logger.info("%s instance created with fetcher %s and num_papers_to_scrape %s",
+                    type(self).__name__, fetcher, num_papers_to_scrape)
 
-    def get_publications(self, url):
+    def fetch_listings(self, url):
         logger.info("Fetching publications from URL: %s", url)
-        try:
-            response = requests.get(url)
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            logger.error("Request failed for URL %s: %s", url, e)
+        # The page GET shares the fetcher's pooled session and per-host rate limit
+        response = self.fetcher.scheduler.get(url)
+        if response is None:
+            logger.error("Request failed for URL %s", url)
             return []
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        papers = []
-
-        arxiv_anchors = [anchor for anchor in soup.find_all('a') if 'arXiv' in anchor.text]
-        logger.debug("Found %d arXiv anchors", len(arxiv_anchors))
+        with metrics.timer('stage_seconds', stage='listing_parse'):
+            listings = self.parse_listings(response.content, url)
+        metrics.counter('listings_total', scraper=type(self).__name__).inc(len(listings))
+        logger.debug("Found %d listings", len(listings))
 
         # If num_papers_to_scrape is defined, limit the number of papers
         if self.num_papers_to_scrape:
-            arxiv_anchors = arxiv_anchors[:self.num_papers_to_scrape]
+            listings = listings[:self.num_papers_to_scrape]
             logger.info("Limiting the number of papers to scrape to %d", self.num_papers_to_scrape)
+        return listings
+
+    def list_publications(self, url):
+        '''Returns ``(title, link, arxiv_id)`` for every arXiv paper listed on the page.'''
+        return [(item['title'], item['url'], item['arxiv_id']) for item in self.fetch_listings(url) if item['arxiv_id']]
+
+    def complete(self, chunk):
+        '''Fills in abstracts and authors of a chunk of listings, in place.'''
+        arxiv_ids = [item['arxiv_id'] for item in chunk if item['arxiv_id'] and item['abstract'] is None]
+        if not arxiv_ids:
+            return
+        fetched, _, _ = self.fetcher.fetch_many(arxiv_ids)
+        for item in chunk:
+            if item['arxiv_id'] in fetched:
+                item['abstract'], authors = fetched[item['arxiv_id']]
+                item['authors'] = authors or item['authors']
+
+    def iter_publications(self, url):
+        listings = self.fetch_listings(url)
+        venue = self.venue(url)
+        count = 0
+        for start in range(0, len(listings), self.chunk_size):
+            chunk = listings[start:start + self.chunk_size]
+            with metrics.timer('stage_seconds', stage='complete'):
+                self.complete(chunk)
+            for item in chunk:
+                yield {'title': item['title'], 'url': item['url'], 'abstract': item['abstract'],
+                       'authors': item['authors'], 'arxiv_id': item['arxiv_id'], **venue}
+            count += len(chunk)
+
+        logger.info("Successfully fetched %d papers", count)
+
+@register('iccv', 'cvpr', 'wacv', 'cvf')
+class CVFScraper(ListingScraper):
+    '''CVF open access pages; papers are the ones with an arXiv link.'''
+    arxiv_linked = True
+    parse_listings = staticmethod(parse_cvf_listing)
+
+# The original name, kept for existing callers
+ICCVScraper = CVFScraper
+
+@register('openreview', 'iclr')
+class OpenReviewScraper(ListingScraper):
+    '''Saved OpenReview venue pages, which carry abstracts and authors inline.'''
+    parse_listings = staticmethod(parse_openreview_listing)
 
-        for anchor in arxiv_anchors:
-            title = anchor.find_previous('dt').text.strip()
-            link = anchor['href']
-            arxiv_id = link.split('/')[-1]
+@register('pmlr', 'icml', 'aistats')
+class PMLRScraper(ListingScraper):
+    '''PMLR proceedings volumes; abstracts come from each paper's abs page.'''
+    parse_listings = staticmethod(parse_pmlr_listing)
 
-            abstract, authors = self.fetcher.fetch(arxiv_id)
-            papers.append({'title': title, 'url': link, 'abstract': abstract, 'authors': authors})
+    def fetch_abstract(self, url):
+        response = self.fetcher.scheduler.get(url)
+        if response is None:
+            logger.error("Request failed for abstract page %s", url)
+            return None
+        return parse_pmlr_abstract(response.content)
 
-        logger.info("Successfully fetched %d papers", len(papers))
-        return papers
+    def complete(self, chunk):
+        pending = [item for item in chunk if item['abstract'] is None and item['url']]
+        for item, abstract in zip(pending, self.fetcher.scheduler.map(self.fetch_abstract, [item['url'] for item in pending])):
+            item['abstract'] = abstract
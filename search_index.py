@@ -0,0 +1,213 @@
+'''Inverted full-text index over paper titles, abstracts and authors.
+
+Documents are scored with BM25, computed per field and combined with
+field weights (a title match counts more than an abstract match). Queries
+support:
+
+    graph neural        all terms must match (the last one as a prefix,
+                        so results update while the user is typing)
+    diffus*             explicit prefix term
+    "neural radiance"   phrase, checked on the candidate documents only
+
+That is the default, conjunctive ``mode='all'``. With ``mode='any'``
+(used for hybrid retrieval, where the keyword side must still rank
+documents that miss a term) a document matching any term is a candidate,
+scored by the BM25 sum over the terms it matches times the share of query
+terms it matches; words are complete terms unless they end in ``*``, and
+phrases count as their words.
+
+Author names are normalised (accents, punctuation, case) before indexing.
+The index is built once, pickled next to the repository it was built
+from, and rebuilt only when that repository changes.
+'''
+import bisect
+import glob
+import logging
+import os
+import pickle
+import re
+import unicodedata
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+')
+PHRASE_RE = re.compile(r'"([^"]*)"')
+
+# Relative weight of a match in each field
+FIELD_WEIGHTS = {'title': 2.0, 'authors': 1.5, 'abstract': 1.0}
+# Prefix terms expand to at most this many vocabulary terms
+MAX_PREFIX_EXPANSIONS = 100
+MATCH_MODES = ('all', 'any')
+
+
+def fold(text):
+    '''Lowercases and strips accents, e.g. "Müller" -> "muller".'''
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).lower()
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(fold(text or ''))
+
+
+def normalize_author(name):
+    '''Canonical form of an author name: folded tokens joined by single spaces.'''
+    return ' '.join(tokenize(name))
+
+
+def field_text(paper, field):
+    if field == 'authors':
+        return ' '.join(normalize_author(author) for author in paper.get('authors') or [])
+    return paper.get(field) or ''
+
+
+class SearchIndex:
+    '''BM25 inverted index; ``search`` returns positions in the indexed paper list.'''
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.num_docs = 0
+        self.postings = {}      # field -> term -> (doc ids, term frequencies)
+        self.doc_lengths = {}   # field -> per-document token counts
+        self.vocabulary = []    # sorted terms across all fields, for prefix lookups
+        self.tokens = {}        # field -> per-document token tuples, for phrase checks
+
+    @classmethod
+    def build(cls, papers):
+        index = cls()
+        index.num_docs = len(papers)
+        for field in FIELD_WEIGHTS:
+            term_docs = {}
+            tokens = [tuple(tokenize(field_text(paper, field))) for paper in papers]
+            for doc_id, doc_tokens in enumerate(tokens):
+                counts = {}
+                for token in doc_tokens:
+                    counts[token] = counts.get(token, 0) + 1
+                for token, count in counts.items():
+                    term_docs.setdefault(token, ([], []))
+                    term_docs[token][0].append(doc_id)
+                    term_docs[token][1].append(count)
+            index.postings[field] = {term: (np.array(ids, dtype=np.int32), np.array(tfs, dtype=np.float32))
+                                     for term, (ids, tfs) in term_docs.items()}
+            index.doc_lengths[field] = np.array([len(doc_tokens) for doc_tokens in tokens], dtype=np.float32)
+            index.tokens[field] = tokens
+        index.vocabulary = sorted(set().union(*(postings.keys() for postings in index.postings.values())))
+        logger.info("Built search index over %d papers and %d terms", index.num_docs, len(index.vocabulary))
+        return index
+
+    def expand_prefix(self, prefix):
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        end = bisect.bisect_left(self.vocabulary, prefix + '\uffff')
+        return self.vocabulary[start:min(end, start + MAX_PREFIX_EXPANSIONS)]
+
+    def _term_scores(self, terms):
+        '''BM25 scores over all documents for a group of alternative terms.'''
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        for field, weight in FIELD_WEIGHTS.items():
+            postings = self.postings[field]
+            lengths = self.doc_lengths[field]
+            average = lengths.mean() or 1
+            for term in terms:
+                if term not in postings:
+                    continue
+                ids, tfs = postings[term]
+                idf = np.log(1 + (self.num_docs - len(ids) + 0.5) / (len(ids) + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * lengths[ids] / average)
+                scores[ids] += weight * idf * tfs * (self.k1 + 1) / (tfs + norm)
+        return scores
+
+    @staticmethod
+    def _contains(tokens, phrase):
+        n = len(phrase)
+        return any(tokens[i:i + n] == phrase for i in range(len(tokens) - n + 1))
+
+    def parse(self, query, typeahead=True):
+        '''Splits a query into phrases and term groups (a prefix expands to a group).
+
+        With ``typeahead``, an unfinished last word is a prefix too.
+        '''
+        phrases = [tuple(tokenize(phrase)) for phrase in PHRASE_RE.findall(query)]
+        phrases = [phrase for phrase in phrases if phrase]
+        rest = PHRASE_RE.sub(' ', query)
+        words = rest.split()
+        groups = []
+        for position, word in enumerate(words):
+            prefix = word.endswith('*') or (typeahead and position == len(words) - 1 and not rest.endswith(' '))
+            for token in tokenize(word):
+                groups.append(self.expand_prefix(token) if prefix else [token])
+        return phrases, groups
+
+    def search(self, query, k=100, mode='all'):
+        '''Returns ``(doc ids, scores)`` of the top ``k`` documents matching every query part (any, with 'any').'''
+        if mode not in MATCH_MODES:
+            raise ValueError(f"Unknown match mode '{mode}', expected one of: {', '.join(MATCH_MODES)}")
+        conjunctive = mode == 'all'
+        phrases, groups = self.parse(query, typeahead=conjunctive)
+        # Phrase words must all match too; their order is checked afterwards
+        groups += [[token] for phrase in phrases for token in phrase]
+        if not groups:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        matched = np.ones(self.num_docs, dtype=bool)
+        matched_groups = np.zeros(self.num_docs, dtype=np.float32)
+        for terms in groups:
+            term_scores = self._term_scores(terms)
+            matched &= term_scores > 0
+            matched_groups += term_scores > 0
+            scores += term_scores
+        if conjunctive:
+            candidates = np.flatnonzero(matched)
+        else:
+            candidates = np.flatnonzero(matched_groups)
+            # Coordination: the share of query terms a document matches scales its score, so
+            # documents matching most terms stay ahead of those matching one frequent term many times
+            scores *= matched_groups / len(groups)
+
+        if phrases and conjunctive:
+            candidates = np.array([doc_id for doc_id in candidates
+                                   if all(any(self._contains(self.tokens[field][doc_id], phrase)
+                                              for field in FIELD_WEIGHTS) for phrase in phrases)], dtype=np.int64)
+        if len(candidates) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        candidate_scores = scores[candidates]
+        k = min(k, len(candidates))
+        best = np.argpartition(-candidate_scores, k - 1)[:k]
+        best = best[np.argsort(-candidate_scores[best], kind='stable')]
+        return candidates[best], candidate_scores[best]
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+def source_mtime(source):
+    '''Last modification time of a repository file or PaperStore directory.'''
+    if os.path.isdir(source):
+        return max((os.path.getmtime(path) for path in glob.glob(os.path.join(source, '*'))), default=0)
+    return os.path.getmtime(source)
+
+
+def load_or_build(source, load_papers):
+    '''Loads the index persisted next to ``source``, rebuilding it if ``source`` changed.
+
+    ``load_papers()`` must return the papers of ``source`` in the order the
+    caller displays them, with title, abstract and authors.
+    '''
+    path = source.rstrip('/') + '.index.pkl'
+    if os.path.exists(path) and os.path.getmtime(path) >= source_mtime(source):
+        return SearchIndex.load(path)
+    index = SearchIndex.build(load_papers())
+    index.save(path)
+    return index
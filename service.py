@@ -0,0 +1,451 @@
+'''Asynchronous HTTP query service over the local paper corpus.
+
+The papers, the BM25 SearchIndex and the embedding matrix are loaded once
+at startup and served by an aiohttp application:
+
+    GET /search?q=...&k=10          keyword search (see search_index)
+    GET /semantic?q=...&k=10        nearest papers to the embedded query
+    GET /similar/{arxiv_id}?k=10    nearest papers to a stored paper
+    GET /hybrid?q=...&k=10          keyword and vector results fused and
+                                    reranked (see hybrid), with stage timings
+    GET /fulltext?q=...&k=10        papers whose body matches, with the best
+                                    section chunk (see fulltext)
+    GET /metrics                    request counts, p50/p99 latency, cache stats
+    GET /metrics?format=prometheus  the same process's metrics (see metrics)
+                                    in the Prometheus text format
+
+Query embeddings and results are kept in LRU caches. Concurrent /semantic
+misses are micro-batched: queries arriving within a couple of
+milliseconds share one ``embed_documents`` call to the provider.
+
+Queries must be embedded by the model that produced the stored vectors:
+the service records that model (and the vectors' dimension) at load time
+and refuses to start with another one. By default (``--embedder auto``)
+it picks the provider of the recorded model.
+
+    python service.py --source papers_store --port 8080
+'''
+import argparse
+import asyncio
+import collections
+import logging
+import os
+import time
+
+import numpy as np
+from aiohttp import web
+
+import search_index
+from embeddings import EmbeddingCache, EmbeddingPipeline, HashingEmbedder, model_name, normalize_text
+from fetchers import canonical_arxiv_id
+from fulltext import ChunkStore, FullTextSearcher, fulltext_directory
+from hybrid import HybridSearcher, TitleReranker
+from metrics import REGISTRY
+from paper_store import PaperStore, is_paper_store, read_legacy_papers
+from vector_index import normalize, top_k
+
+logger = logging.getLogger(__name__)
+
+# Fields returned for every hit; abstracts stay out of responses
+RESULT_FIELDS = ['arxiv_id', 'title', 'authors', 'url', 'conference', 'year']
+MAX_K = 100
+
+
+class LRUCache:
+    '''Bounded mapping that evicts the least recently used entry.'''
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries)}
+
+
+class LatencyRecorder:
+    '''Request counts and latency percentiles over a sliding window of requests.'''
+
+    def __init__(self, window=10000):
+        self.window = window
+        self.samples = collections.defaultdict(lambda: collections.deque(maxlen=self.window))
+        self.counts = collections.Counter()
+
+    def record(self, endpoint, seconds):
+        self.samples[endpoint].append(seconds)
+        self.counts[endpoint] += 1
+
+    def summary(self):
+        summary = {}
+        for endpoint, samples in self.samples.items():
+            p50, p99 = np.percentile(np.fromiter(samples, dtype=np.float64), [50, 99]) * 1000
+            summary[endpoint] = {'count': self.counts[endpoint], 'p50_ms': round(p50, 3), 'p99_ms': round(p99, 3)}
+        return summary
+
+
+class MicroBatcher:
+    '''Coalesces concurrent ``embed`` calls into batched provider calls.
+
+    A batch is sent when ``max_batch_size`` texts are waiting or
+    ``max_delay`` seconds after the first one arrived. The provider runs in
+    the default executor so the event loop keeps accepting requests.
+    '''
+
+    def __init__(self, embed_batch, max_batch_size=64, max_delay=0.002):
+        self.embed_batch = embed_batch
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.pending = []
+        self.timer = None
+        self.tasks = set()
+        self.batches = 0
+        self.texts = 0
+
+    async def embed(self, text):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((text, future))
+        if len(self.pending) >= self.max_batch_size:
+            self._flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            # Keep a reference until the batch is done, or it may be garbage collected
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, batch):
+        self.batches += 1
+        self.texts += len(batch)
+        try:
+            vectors = await asyncio.get_running_loop().run_in_executor(
+                None, self.embed_batch, [text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+
+class QueryService:
+    '''Keyword, semantic and similar-paper search over papers held in memory.
+
+    ``vectors`` is an (n, dim) matrix aligned with ``papers``, embedded by
+    ``embedding_model``; ``embedder`` is any provider with
+    ``embed_documents(texts)`` and must be that model. ``fulltext`` is an
+    optional FullTextSearcher over chunks of the papers' bodies.
+    '''
+
+    def __init__(self, papers, keyword_index, vectors=None, embedder=None, cache_size=10000,
+                 max_batch_size=64, max_delay=0.002, fulltext=None, embedding_model=None):
+        self.papers = [{field: paper.get(field) for field in RESULT_FIELDS} for paper in papers]
+        for paper in self.papers:
+            paper['arxiv_id'] = canonical_arxiv_id(paper)
+        self.rows = {paper['arxiv_id']: row for row, paper in enumerate(self.papers) if paper['arxiv_id']}
+        self.keyword_index = keyword_index
+        self.vectors = normalize(vectors) if vectors is not None else None
+        self.embedder = embedder
+        self.embedding_model = embedding_model
+        self.fulltext = fulltext
+        self.check_embedder()
+        self.hybrid_searcher = (HybridSearcher(keyword_index, self.vectors, reranker=TitleReranker(self.papers))
+                                if self.vectors is not None else None)
+        self.batcher = MicroBatcher(embedder.embed_documents, max_batch_size, max_delay) if embedder else None
+        self.query_embeddings = LRUCache(cache_size)
+        self.results = LRUCache(cache_size)
+        self.latency = LatencyRecorder()
+
+    def check_embedder(self):
+        '''Raises ValueError if the query embedder cannot search the stored vectors.
+
+        The embedder's model must be the recorded one. For vectors stored
+        without a model name, only a probe query's dimension can be checked.
+        '''
+        if self.embedder is None:
+            return
+        query_model = model_name(self.embedder)
+        probe_dim = None
+        for name, vectors, model in [('paper', self.vectors, self.embedding_model),
+                                     ('full-text', getattr(self.fulltext, 'vectors', None),
+                                      getattr(self.fulltext, 'embedding_model', None))]:
+            if vectors is None:
+                continue
+            if model is not None and model != query_model:
+                raise ValueError(f"The {name} embeddings were made by '{model}', but queries would be embedded by "
+                                 f"'{query_model}'; start the service with the same model")
+            if model is None:
+                logger.warning("The %s embeddings do not record their model; checking the dimension only", name)
+                if probe_dim is None:
+                    probe_dim = getattr(self.embedder, 'dim', None) or len(self.embedder.embed_query('dimension probe'))
+                if probe_dim != vectors.shape[1]:
+                    raise ValueError(f"The {name} embeddings have {vectors.shape[1]} dimensions, but "
+                                     f"'{query_model}' embeds queries in {probe_dim}")
+
+    @classmethod
+    def load(cls, source, embedder=None, embedding_cache_path=None, **kwargs):
+        '''Loads a PaperStore directory, a shard directory or a JSON/JSONL/CSV repository.
+
+        Without stored embeddings, titles and abstracts are embedded with
+        ``embedder`` through an EmbeddingPipeline, cached at
+        ``embedding_cache_path`` if given. Full-text chunks ingested next to
+        a PaperStore are loaded too.
+        '''
+        vectors = None
+        embedding_model = None
+        if is_paper_store(source):
+            if os.path.isdir(fulltext_directory(source)) and 'fulltext' not in kwargs:
+                kwargs['fulltext'] = FullTextSearcher.load(fulltext_directory(source))
+            store = PaperStore(source)
+            papers = store.records(RESULT_FIELDS)
+            index = search_index.load_or_build(source, lambda: store.records(['title', 'authors', 'abstract']))
+            if store.dim():
+                vectors = store.embeddings()
+                embedding_model = store.embedding_model()
+            texts = lambda: (f"{paper['title']}\n{paper['abstract'] or ''}"
+                             for paper in store.records(['title', 'abstract']))
+        else:
+            # Raises for a directory that is neither a PaperStore nor a shard directory
+            papers = read_legacy_papers(source)
+            index = search_index.load_or_build(source, lambda: papers)
+            texts = lambda: (f"{paper['title']}\n{paper.get('abstract') or ''}" for paper in papers)
+        if vectors is None and embedder is not None and papers:
+            cache = EmbeddingCache(embedding_cache_path) if embedding_cache_path else None
+            vectors = np.array(EmbeddingPipeline(embedder, cache).embed(list(texts())), dtype=np.float32)
+            embedding_model = model_name(embedder)
+        logger.info("Loaded %d papers from '%s' (%s)", len(papers), source,
+                    'no embeddings' if vectors is None
+                    else f"{vectors.shape[1]}-dimensional embeddings by {embedding_model or 'an unrecorded model'}")
+        return cls(papers, index, vectors, embedder, embedding_model=embedding_model, **kwargs)
+
+    def hits(self, rows, scores):
+        return [dict(self.papers[row], score=round(float(score), 6)) for row, score in zip(rows, scores)]
+
+    def keyword(self, query, k):
+        key = ('search', query, k)
+        results = self.results.get(key)
+        if results is None:
+            results = self.hits(*self.keyword_index.search(query, k))
+            self.results.put(key, results)
+        return results
+
+    async def embed_query(self, query):
+        text = normalize_text(query)
+        vector = self.query_embeddings.get(text)
+        if vector is None:
+            vector = normalize(await self.batcher.embed(text))
+            self.query_embeddings.put(text, vector)
+        return vector
+
+    async def semantic(self, query, k):
+        key = ('semantic', query, k)
+        results = self.results.get(key)
+        if results is None:
+            results = self.hits(*top_k(self.vectors, await self.embed_query(query), k))
+            self.results.put(key, results)
+        return results
+
+    async def hybrid(self, query, k, rerank=True):
+        '''Returns ``(results, stage timings)``; cached results report the timings of their first run.'''
+        key = ('hybrid', query, k, rerank)
+        cached = self.results.get(key)
+        if cached is None:
+            ids, scores, timings = self.hybrid_searcher.search(query, k, await self.embed_query(query), rerank)
+            cached = (self.hits(ids, scores), timings)
+            self.results.put(key, cached)
+        return cached
+
+    async def fulltext_search(self, query, k):
+        key = ('fulltext', query, k)
+        results = self.results.get(key)
+        if results is None:
+            vector = await self.embed_query(query) if self.batcher and self.fulltext.vectors is not None else None
+            results = []
+            for hit in self.fulltext.search(query, k, vector):
+                row = self.rows.get(hit['arxiv_id'])
+                paper = self.papers[row] if row is not None else {'arxiv_id': hit['arxiv_id']}
+                results.append(dict(paper, section=hit['section'], snippet=hit['snippet'],
+                                    score=round(hit['score'], 6)))
+            self.results.put(key, results)
+        return results
+
+    def similar(self, arxiv_id, k):
+        row = self.rows[arxiv_id]
+        key = ('similar', arxiv_id, k)
+        results = self.results.get(key)
+        if results is None:
+            rows, scores = top_k(self.vectors, self.vectors[row], k + 1)
+            keep = rows != row
+            results = self.hits(rows[keep][:k], scores[keep][:k])
+            self.results.put(key, results)
+        return results
+
+    def metrics(self):
+        return {'latency': self.latency.summary(),
+                'query_embedding_cache': self.query_embeddings.stats(),
+                'result_cache': self.results.stats(),
+                'embedding_batches': {'batches': self.batcher.batches if self.batcher else 0,
+                                      'texts': self.batcher.texts if self.batcher else 0}}
+
+
+SERVICE = web.AppKey('service', QueryService)
+
+
+def query_params(request):
+    query = request.query.get('q', '').strip()
+    if not query:
+        raise web.HTTPBadRequest(text="Missing query parameter 'q'")
+    return query, result_count(request)
+
+
+def result_count(request):
+    try:
+        k = int(request.query.get('k', 10))
+    except ValueError:
+        raise web.HTTPBadRequest(text="'k' must be an integer") from None
+    return max(1, min(k, MAX_K))
+
+
+def require_vectors(service):
+    if service.vectors is None:
+        raise web.HTTPServiceUnavailable(text="The corpus has no embeddings")
+
+
+async def search(request):
+    query, k = query_params(request)
+    return web.json_response({'results': request.app[SERVICE].keyword(query, k)})
+
+
+async def semantic(request):
+    service = request.app[SERVICE]
+    require_vectors(service)
+    if service.embedder is None:
+        raise web.HTTPServiceUnavailable(text="No embedder is configured")
+    query, k = query_params(request)
+    return web.json_response({'results': await service.semantic(query, k)})
+
+
+async def hybrid(request):
+    service = request.app[SERVICE]
+    require_vectors(service)
+    if service.embedder is None:
+        raise web.HTTPServiceUnavailable(text="No embedder is configured")
+    query, k = query_params(request)
+    results, timings = await service.hybrid(query, k, request.query.get('rerank', '1') != '0')
+    return web.json_response({'results': results, 'timings': timings})
+
+
+async def fulltext(request):
+    service = request.app[SERVICE]
+    if service.fulltext is None:
+        raise web.HTTPServiceUnavailable(text="No full text has been ingested (see fulltext.py)")
+    query, k = query_params(request)
+    return web.json_response({'results': await service.fulltext_search(query, k)})
+
+
+async def similar(request):
+    service = request.app[SERVICE]
+    require_vectors(service)
+    # /similar/2308.09318v2 finds the paper stored as 2308.09318
+    arxiv_id = canonical_arxiv_id({'arxiv_id': request.match_info['arxiv_id']})
+    if arxiv_id not in service.rows:
+        raise web.HTTPNotFound(text=f"Unknown paper '{arxiv_id}'")
+    return web.json_response({'results': service.similar(arxiv_id, result_count(request))})
+
+
+async def metrics(request):
+    if request.query.get('format') == 'prometheus':
+        return web.Response(text=REGISTRY.prometheus(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Prometheus-Format': '0.0.4'})
+    return web.json_response(request.app[SERVICE].metrics())
+
+
+@web.middleware
+async def record_latency(request, handler):
+    start = time.perf_counter()
+    try:
+        return await handler(request)
+    finally:
+        route = request.match_info.route.resource
+        endpoint = route.canonical if route is not None else 'unmatched'
+        seconds = time.perf_counter() - start
+        request.app[SERVICE].latency.record(endpoint, seconds)
+        REGISTRY.histogram('http_server_seconds', endpoint=endpoint).observe(seconds)
+
+
+def create_app(service):
+    app = web.Application(middlewares=[record_latency])
+    app[SERVICE] = service
+    app.router.add_get('/search', search)
+    app.router.add_get('/semantic', semantic)
+    app.router.add_get('/hybrid', hybrid)
+    app.router.add_get('/fulltext', fulltext)
+    app.router.add_get('/similar/{arxiv_id}', similar)
+    app.router.add_get('/metrics', metrics)
+    return app
+
+
+def stored_embedding_model(source):
+    '''The model recorded with the embeddings stored at ``source`` (a PaperStore and its full text), if any.'''
+    if not is_paper_store(source):
+        return None
+    model = PaperStore(source).embedding_model()
+    if model is None and os.path.isdir(fulltext_directory(source)):
+        model = ChunkStore(fulltext_directory(source)).embedding_model()
+    return model
+
+
+def make_embedder(name, model=None):
+    '''The ``name`` provider; 'auto' picks the provider (and model) of ``model``, hashing without one.'''
+    hashing_dim = int(model[len('hashing-'):]) if model and model.startswith('hashing-') else None
+    if name == 'auto':
+        name = 'openai' if model and hashing_dim is None else 'hashing'
+    if name == 'openai':
+        from langchain.embeddings import OpenAIEmbeddings
+        kwargs = {'model': model} if model and hashing_dim is None else {}
+        return OpenAIEmbeddings(openai_api_key=os.environ.get("OPENAI_API_KEY"), **kwargs)
+    return HashingEmbedder(hashing_dim) if hashing_dim else HashingEmbedder()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Serve keyword and semantic search over the paper corpus")
+    parser.add_argument("--source", type=str, default="papers_repository.json",
+                        help="PaperStore directory, shard directory (cli.py --output_dir) or JSON/JSONL/CSV repository")
+    parser.add_argument("--embedder", choices=['auto', 'hashing', 'openai'], default='auto',
+                        help="Query (and, without stored embeddings, corpus) embedding provider; "
+                             "'auto' uses the model recorded with the stored embeddings")
+    parser.add_argument("--embedding_cache", type=str, default="embeddings_cache.sqlite",
+                        help="Cache for corpus embeddings computed at startup")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    embedder = make_embedder(args.embedder, stored_embedding_model(args.source))
+    service = QueryService.load(args.source, embedder, args.embedding_cache)
+    web.run_app(create_app(service), host=args.host, port=args.port)
@@ -0,0 +1,260 @@
+'''Sharded, compressed JSONL output described by a manifest.
+
+A shard directory looks like:
+
+    papers_out/
+        manifest.json
+        iccv/20261017T120000Z-00000.jsonl.gz
+        iccv/20261017T120000Z-00001.jsonl.gz
+        iclr/20261018T090000Z-00000.jsonl.gz
+
+ShardedSink writes the papers of a run ``shard_size`` at a time into
+compressed JSONL shards: one subdirectory per conference, one batch id
+(the UTC start time of the run) per run. A shard is written under a
+temporary name, renamed when complete and only then added to the
+manifest, with its record count, size and SHA-256, so readers never see
+partial shards. Every shard gets the next sequence number. Several sinks
+(e.g. one crawl per conference) can write to the same directory: the
+manifest is re-read and rewritten under a lock on manifest.json.lock, so
+no entry is lost and no sequence number is handed out twice.
+
+Consumers read only what is new since their last sync, and can hand
+separate shards to parallel workers:
+
+    python shards.py papers_out --since 17 --output delta.jsonl
+
+prints the sequence number to pass as ``--since`` next time.
+'''
+import argparse
+import contextlib
+import fcntl
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+import metrics
+from sinks import Sink
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+LOCK = MANIFEST + '.lock'
+SUFFIXES = {'gzip': '.jsonl.gz', 'zstd': '.jsonl.zst', 'none': '.jsonl'}
+
+
+def open_shard(path, mode, compression):
+    '''Opens a shard as a text stream, ``mode`` being 'r' or 'w'.'''
+    if compression == 'gzip':
+        # Level 6 compresses JSON nearly as well as 9 at a fraction of the cost
+        return gzip.open(path, mode + 't', compresslevel=6, encoding='utf-8')
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("zstd shards need the 'zstandard' package (pip install zstandard)") from None
+        raw = open(path, mode + 'b')
+        if mode == 'w':
+            stream = zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=True)
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return io.TextIOWrapper(stream, encoding='utf-8')
+    if compression == 'none':
+        return open(path, mode, encoding='utf-8')
+    raise ValueError(f"Unknown compression '{compression}', expected one of: {', '.join(SUFFIXES)}")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_shard_directory(directory):
+    '''True for directories written by ShardedSink, which hold a manifest.json.'''
+    return os.path.isfile(os.path.join(directory, MANIFEST))
+
+
+def parse_since(since):
+    '''``--since`` as ``('sequence', n)`` for a number or ``('created', epoch seconds)`` for an ISO date.'''
+    if since is None:
+        return None
+    if str(since).isdigit():
+        return 'sequence', int(since)
+    moment = datetime.fromisoformat(str(since))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return 'created', moment.timestamp()
+
+
+class ShardManifest:
+    '''The list of complete shards of a directory, saved atomically as manifest.json.'''
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, MANIFEST)
+        self.shards = []
+        self.reload()
+
+    def reload(self):
+        '''Re-reads the shards from disk, picking up those added by other writers.'''
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.shards = json.load(f)['shards']
+
+    @contextlib.contextmanager
+    def lock(self):
+        '''Holds an exclusive lock on the manifest among the processes writing to this directory.'''
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, LOCK), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def next_sequence(self):
+        return self.shards[-1]['sequence'] + 1 if self.shards else 1
+
+    def add(self, shard):
+        '''Appends ``shard`` with the next sequence number on disk and returns the entry as saved.'''
+        with self.lock():
+            self.reload()
+            # Taken under the lock, so sequence numbers and creation times grow together
+            shard = dict(shard, sequence=self.next_sequence(), created=time.time())
+            self.shards.append(shard)
+            partial = self.path + '.part'
+            with open(partial, 'w') as f:
+                json.dump({'version': 1, 'shards': self.shards}, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(partial, self.path)
+        return shard
+
+    def since(self, since=None, conference=None):
+        '''Shards added after ``since`` (a sequence number or an ISO date), optionally of one conference.'''
+        cutoff = parse_since(since)
+        shards = self.shards
+        if cutoff is not None:
+            key, value = cutoff
+            shards = [shard for shard in shards if shard[key] > value]
+        if conference is not None:
+            shards = [shard for shard in shards if shard['conference'] == conference]
+        return shards
+
+    def records(self):
+        return sum(shard['records'] for shard in self.shards)
+
+
+def read_shard(directory, shard, verify=True):
+    '''Returns the papers of one manifest entry, checking its checksum first.'''
+    path = os.path.join(directory, shard['path'])
+    if verify and file_sha256(path) != shard['sha256']:
+        raise ValueError(f"Checksum mismatch for shard '{shard['path']}'")
+    with open_shard(path, 'r', shard['compression']) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def read_papers(directory, since=None, conference=None, verify=True):
+    '''Yields the papers of the shards added after ``since``, in manifest order.'''
+    manifest = ShardManifest(directory)
+    for shard in manifest.since(since, conference):
+        yield from read_shard(directory, shard, verify)
+
+
+class ShardedSink(Sink):
+    '''Writes papers as compressed JSONL shards of ``shard_size`` records; see the module docstring.'''
+
+    def __init__(self, directory, conference, shard_size=1000, compression='gzip', chunk_size=100, batch=None):
+        super().__init__(chunk_size)
+        if compression not in SUFFIXES:
+            raise ValueError(f"Unknown compression '{compression}', expected one of: {', '.join(SUFFIXES)}")
+        self.directory = directory
+        self.conference = conference
+        self.shard_size = shard_size
+        self.compression = compression
+        self.batch = batch or time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())
+        self.manifest = ShardManifest(directory)
+        self.written_shards = []
+        self.file = None
+        self.shard_records = 0
+        os.makedirs(os.path.join(directory, conference), exist_ok=True)
+
+    def _shard_path(self):
+        # Index within the batch: a resumed or repeated run in the same second never overwrites a shard
+        self.manifest.reload()
+        index = sum(1 for shard in self.manifest.shards if shard['batch'] == self.batch
+                    and shard['conference'] == self.conference)
+        return os.path.join(self.conference, f'{self.batch}-{index:05d}{SUFFIXES[self.compression]}')
+
+    def write_chunk(self, papers):
+        for paper in papers:
+            if self.file is None:
+                self.relative_path = self._shard_path()
+                self.file = open_shard(os.path.join(self.directory, self.relative_path) + '.part', 'w',
+                                       self.compression)
+            self.file.write(json.dumps(paper) + '\n')
+            self.shard_records += 1
+            if self.shard_records == self.shard_size:
+                self.checkpoint()
+
+    def checkpoint(self):
+        '''Completes the current shard, making everything written so far visible to readers.'''
+        if self.file is None:
+            return
+        self.file.close()
+        path = os.path.join(self.directory, self.relative_path)
+        with open(path + '.part', 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(path + '.part', path)
+        shard = {'path': self.relative_path, 'conference': self.conference, 'batch': self.batch,
+                 'records': self.shard_records, 'bytes': os.path.getsize(path), 'sha256': file_sha256(path),
+                 'compression': self.compression}
+        shard = self.manifest.add(shard)
+        self.written_shards.append(shard)
+        metrics.counter('shards_written_total', compression=self.compression).inc()
+        metrics.counter('shard_bytes_total', compression=self.compression).inc(shard['bytes'])
+        logger.debug("Wrote shard %s with %d papers", self.relative_path, self.shard_records)
+        self.file = None
+        self.shard_records = 0
+
+    def position(self):
+        '''Sequence number of the latest shard in the directory (0 if there are none).'''
+        self.manifest.reload()
+        return self.manifest.shards[-1]['sequence'] if self.manifest.shards else 0
+
+    def existing_urls(self, since=None):
+        # Shards are never rewritten, so only those added after ``since`` need reading
+        return {paper.get('url') for paper in read_papers(self.directory, since, conference=self.conference)}
+
+    def close(self):
+        self.checkpoint()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Export the papers of the shards added since the last sync")
+    parser.add_argument("directory", help="Shard directory written by cli.py --output_dir")
+    parser.add_argument("--since", type=str, default=None,
+                        help="Last sequence number already read, or an ISO date (default: everything)")
+    parser.add_argument("--conference", type=str, default=None, help="Only export this conference's shards")
+    parser.add_argument("--output", type=str, default=None, help="JSONL file to write (default: list the shards)")
+    args = parser.parse_args()
+
+    manifest = ShardManifest(args.directory)
+    shards = manifest.since(args.since, args.conference)
+    if args.output:
+        with open(args.output, 'w') as f:
+            for shard in shards:
+                f.writelines(json.dumps(paper) + '\n' for paper in read_shard(args.directory, shard))
+    else:
+        for shard in shards:
+            print(f"{shard['sequence']:>6} {shard['path']} {shard['records']} papers {shard['bytes']} bytes")
+    print(f"{len(shards)} new shards with {sum(shard['records'] for shard in shards)} papers; "
+          f"next sync: --since {manifest.shards[-1]['sequence'] if manifest.shards else 0}")
@@ -0,0 +1,182 @@
+'''Streaming writers for scraped papers.
+
+Every sink consumes an iterable of paper dicts (typically a scraper's
+``iter_publications``) and writes it in chunks of ``chunk_size``, flushing
+after each one. Only one chunk is held in memory at a time, and the first
+papers reach the disk as soon as the first chunk has been fetched.
+'''
+import csv
+import json
+import logging
+import os
+from itertools import islice
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def chunked(iterable, size):
+    '''Yields lists of up to ``size`` consecutive items from ``iterable``.'''
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Sink:
+    '''Base class for sinks. Subclasses implement ``write_chunk``.'''
+
+    def __init__(self, chunk_size=100):
+        self.chunk_size = chunk_size
+
+    def write(self, papers):
+        '''Consumes ``papers`` chunk by chunk and returns how many were written.'''
+        count = 0
+        timer = metrics.histogram('stage_seconds', stage='sink_write', sink=type(self).__name__)
+        for chunk in chunked(papers, self.chunk_size):
+            with timer.time():
+                self.write_chunk(chunk)
+            count += len(chunk)
+            logger.debug("Wrote %d papers so far", count)
+        self.close()
+        metrics.counter('papers_written_total', sink=type(self).__name__).inc(count)
+        return count
+
+    def write_chunk(self, papers):
+        raise NotImplementedError("Subclasses must implement this method!")
+
+    def checkpoint(self):
+        '''Makes every paper written so far durable; called by resumable crawls before they record progress.'''
+
+    def position(self):
+        '''Marker of how far the output goes, recorded by resumable crawls with each batch; None if unknown.'''
+        return None
+
+    def existing_urls(self, since=None):
+        '''URLs of the papers in the output (written after ``position()`` was ``since``, if the sink can tell).
+
+        Resumable crawls do not write these papers again.
+        '''
+        return set()
+
+    def close(self):
+        pass
+
+
+def truncate_partial_line(path, block_size=1 << 16):
+    '''Cuts a file back to its last newline, dropping a line a crash left half-written.
+
+    Returns the number of bytes removed.
+    '''
+    with open(path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - block_size)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b'\n')
+            if newline != -1:
+                position = start + newline + 1
+                break
+            position = start
+        if position < end:
+            f.truncate(position)
+        return end - position
+
+
+class JSONLSink(Sink):
+    '''Writes one JSON object per line.
+
+    With ``append``, a truncated last line left by a crash is removed
+    first, so that new records start on a line of their own.
+    '''
+
+    def __init__(self, path, append=False, chunk_size=100):
+        super().__init__(chunk_size)
+        self.path = path
+        if append and os.path.exists(path):
+            removed = truncate_partial_line(path)
+            if removed:
+                logger.warning("Removed a truncated last line of %d bytes from '%s'", removed, path)
+        self.file = open(path, 'a' if append else 'w')
+
+    def write_chunk(self, papers):
+        self.file.write(''.join(json.dumps(paper) + '\n' for paper in papers))
+        self.file.flush()
+
+    def existing_urls(self, since=None):
+        # The file may have been rewritten (e.g. by dedup.py) since, so it is always read whole
+        urls = set()
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    urls.add(json.loads(line).get('url'))
+                except json.JSONDecodeError:
+                    # A line of a file written without append, truncated by a crash
+                    continue
+        return urls
+
+    def checkpoint(self):
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+
+class JSONSink(Sink):
+    '''Writes a JSON array laid out like ``json.dump(papers, f, indent=4)``.'''
+
+    def __init__(self, path, chunk_size=100):
+        super().__init__(chunk_size)
+        self.file = open(path, 'w')
+        self.empty = True
+
+    def write_chunk(self, papers):
+        for paper in papers:
+            body = json.dumps(paper, indent=4).replace('\n', '\n    ')
+            self.file.write(('[\n    ' if self.empty else ',\n    ') + body)
+            self.empty = False
+        self.file.flush()
+
+    def close(self):
+        self.file.write('[]' if self.empty else '\n]')
+        self.file.close()
+
+
+class CSVSink(Sink):
+    '''Writes a CSV file whose columns come from the first paper.
+
+    List values such as authors are stored the way pandas would write them.
+    '''
+
+    def __init__(self, path, append=False, chunk_size=100):
+        super().__init__(chunk_size)
+        self.write_header = not (append and os.path.exists(path))
+        self.file = open(path, 'a' if append else 'w', newline='')
+        self.writer = None
+
+    def write_chunk(self, papers):
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.file, fieldnames=list(papers[0]), extrasaction='ignore')
+            if self.write_header:
+                self.writer.writeheader()
+        self.writer.writerows({key: str(value) if isinstance(value, list) else value
+                               for key, value in paper.items()} for paper in papers)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class DALSink(Sink):
+    '''Hands each chunk to a storage backend's ``store_papers``, e.g. a FirebaseDAL.'''
+
+    def __init__(self, dal, chunk_size=500):
+        super().__init__(chunk_size)
+        self.dal = dal
+
+    def write_chunk(self, papers):
+        self.dal.store_papers(papers)
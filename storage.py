@@ -1,10 +1,20 @@
 import os
 import abc
-from typing import List, Dict
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
 
-import pandas as pd
-import firebase_admin
-from firebase_admin import credentials, firestore
+import numpy as np
+
+import metrics
+from vector_index import IVFIndex, normalize, top_k
+
+logger = logging.getLogger(__name__)
+
+# Firestore rejects write batches with more than 500 operations
+FIRESTORE_MAX_BATCH_SIZE = 500
 
 class LocalFileStorage:
     """
@@ -18,6 +28,8 @@ class LocalFileStorage:
         """
         Read existing papers from the CSV file.
         """
+        import pandas as pd
+
         if os.path.exists(self.file_path):
             return pd.read_csv(self.file_path)
         return pd.DataFrame()
@@ -62,6 +74,10 @@ class FirebaseDAL(BaseDAL):
     """
 
     def __init__(self):
+        # The Firebase SDK is only imported by the backend that needs it
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+
         # Check if Firebase has already been initialized
         if not firebase_admin._apps:
             cred_path = os.path.join(os.path.dirname(__file__), 'firebasecreds.json')
@@ -70,10 +86,48 @@ class FirebaseDAL(BaseDAL):
 
         self.db = firestore.client()
 
-    def store_papers(self, papers: List[Dict]):
+    def store_papers(self, papers: List[Dict], batch_size: int = FIRESTORE_MAX_BATCH_SIZE, max_workers: int = 4,
+                     max_retries: int = 3):
+        """
+        Write papers with Firestore WriteBatches, committing several batches in parallel.
+
+        A batch that keeps failing is split in half until the failing papers
+        are isolated, so only they are retried. Returns (paper, error) pairs
+        for the papers that could not be written.
+        """
+        if max_retries < 1:
+            raise ValueError(f"max_retries must be at least 1, got {max_retries}")
+        batch_size = min(batch_size, FIRESTORE_MAX_BATCH_SIZE)
+        chunks = [papers[start:start + batch_size] for start in range(0, len(papers), batch_size)]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(lambda chunk: self._commit_batch(chunk, max_retries), chunks)
+            return [failure for failures in results for failure in failures]
+
+    def _commit_batch(self, papers: List[Dict], attempts: int):
+        from google.api_core.exceptions import GoogleAPIError
+
         papers_collection = self.db.collection('papers')
-        for paper in papers:
-            papers_collection.document(paper['arxiv_id']).set(paper)
+        retry_delay = 0.5
+        for attempt in range(attempts):
+            batch = self.db.batch()
+            for paper in papers:
+                batch.set(papers_collection.document(paper['arxiv_id']), paper)
+            try:
+                with metrics.timer('stage_seconds', stage='firestore_commit'):
+                    batch.commit()
+                metrics.counter('papers_stored_total', backend='firestore').inc(len(papers))
+                return []
+            except GoogleAPIError as e:
+                error = e
+                logger.warning("Attempt #%d to write %d papers failed: %s", attempt + 1, len(papers), e)
+                if attempt + 1 < attempts:
+                    time.sleep(retry_delay)
+                    retry_delay *= 2
+        if len(papers) == 1:
+            return [(papers[0], error)]
+        # The batch keeps failing: split it once per level to find the offending papers
+        middle = len(papers) // 2
+        return self._commit_batch(papers[:middle], 1) + self._commit_batch(papers[middle:], 1)
 
     def get_papers(self):
         papers_collection = self.db.collection('papers')
@@ -108,6 +162,121 @@ class WeaviateDAL(BaseDAL):
         pass
 
 
+class LocalVectorDAL(BaseDAL):
+    """
+    Local data access layer that keeps paper embeddings on disk.
+
+    The directory holds papers.jsonl (one metadata row per paper) and
+    embeddings.f32, a contiguous float32 matrix with one unit-length row
+    per paper that is memory-mapped for search. Papers may carry an
+    'embedding' key, or their vectors can be added afterwards with
+    store_embeddings in the same order. An optional IVF index (ivf.npz)
+    serves approximate queries on large corpora.
+    """
+
+    def __init__(self, directory: str, embeddings=None, n_probe: int = 8):
+        self.directory = directory
+        self.embeddings = embeddings  # Anything with embed_query(text), e.g. OpenAIEmbeddings
+        self.n_probe = n_probe
+        os.makedirs(directory, exist_ok=True)
+        self.papers_path = os.path.join(directory, 'papers.jsonl')
+        self.vectors_path = os.path.join(directory, 'embeddings.f32')
+        self.meta_path = os.path.join(directory, 'meta.json')
+        self.index_path = os.path.join(directory, 'ivf.npz')
+
+        self.papers = []
+        if os.path.exists(self.papers_path):
+            with open(self.papers_path) as f:
+                self.papers = [json.loads(line) for line in f]
+        self.dim = None
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.dim = json.load(f)['dim']
+        self.conferences = np.array([paper.get('conference') for paper in self.papers], dtype=object)
+        self.years = np.array([paper.get('year') or -1 for paper in self.papers], dtype=np.int32)
+        self.index = IVFIndex.load(self.index_path) if os.path.exists(self.index_path) else None
+        self._open_matrix()
+
+    def _open_matrix(self):
+        rows = os.path.getsize(self.vectors_path) // (4 * self.dim) if self.dim else 0
+        if rows:
+            self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(rows, self.dim))
+        else:
+            self.matrix = np.empty((0, self.dim or 0), dtype=np.float32)
+
+    def store_papers(self, papers: List[Dict]):
+        embeddings = [paper['embedding'] for paper in papers if 'embedding' in paper]
+        if embeddings and len(embeddings) != len(papers):
+            raise ValueError("Either all or none of the papers must have an 'embedding'")
+        rows = [{key: value for key, value in paper.items() if key != 'embedding'} for paper in papers]
+        with open(self.papers_path, 'a') as f:
+            for row in rows:
+                f.write(json.dumps(row) + '\n')
+        self.papers.extend(rows)
+        self.conferences = np.append(self.conferences, np.array([row.get('conference') for row in rows], dtype=object))
+        self.years = np.append(self.years, np.array([row.get('year') or -1 for row in rows], dtype=np.int32))
+        if embeddings:
+            self.store_embeddings(embeddings)
+
+    def store_embeddings(self, embeddings: List):
+        """
+        Append vectors for the stored papers that do not have one yet, in order.
+        """
+        vectors = normalize(embeddings)
+        if len(self.matrix) + len(vectors) > len(self.papers):
+            raise ValueError(f"Got {len(vectors)} embeddings but only {len(self.papers) - len(self.matrix)} "
+                             "papers are waiting for one")
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            with open(self.meta_path, 'w') as f:
+                json.dump({'dim': self.dim}, f)
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-dimensional embeddings, got {vectors.shape[1]}")
+        start = len(self.matrix)
+        with open(self.vectors_path, 'ab') as f:
+            f.write(vectors.tobytes())
+        self._open_matrix()
+        if self.index is not None:
+            self.index.add(self.matrix, start)
+            self.index.save(self.index_path)
+
+    def build_index(self, n_lists: Optional[int] = None):
+        """
+        Build (or rebuild) the approximate IVF index over all stored vectors.
+        """
+        self.index = IVFIndex.build(self.matrix, n_lists)
+        self.index.save(self.index_path)
+
+    def _mask(self, conference: Optional[str], year: Optional[int]):
+        if conference is None and year is None:
+            return None
+        n = len(self.matrix)
+        mask = np.ones(n, dtype=bool)
+        if conference is not None:
+            mask &= self.conferences[:n] == conference
+        if year is not None:
+            mask &= self.years[:n] == year
+        return mask
+
+    def search_vector(self, vector, k: int = 10, conference: Optional[str] = None, year: Optional[int] = None,
+                      approximate: bool = False) -> List[Dict]:
+        """
+        Return the k papers closest to vector, each with its cosine 'score'.
+        """
+        query = normalize(vector)
+        mask = self._mask(conference, year)
+        if approximate and self.index is not None:
+            rows, scores = self.index.search(self.matrix, query, k, self.n_probe, mask)
+        else:
+            rows, scores = top_k(self.matrix, query, k, None if mask is None else np.flatnonzero(mask))
+        return [dict(self.papers[row], score=float(score)) for row, score in zip(rows, scores)]
+
+    def search_papers(self, query: str, k: int = 10, **filters):
+        if self.embeddings is None:
+            raise ValueError("LocalVectorDAL needs an embeddings model to search by text")
+        return self.search_vector(self.embeddings.embed_query(query), k, **filters)
+
+
 
 if __name__ == "__main__":
     # Test Store Papers
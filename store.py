@@ -1,19 +1,22 @@
 import logging
 import os
 
-import weaviate
-from langchain.embeddings.openai import OpenAIEmbeddings
-from dotenv import load_dotenv
+import metrics
+from embeddings import EmbeddingCache, EmbeddingPipeline
 
 logger = logging.getLogger('papers')
 
-load_dotenv()
-
 
 class EmbeddingStorage:
-    def __init__(self, weaviate_url, weaviate_api_key, openai_api_key):
+    def __init__(self, weaviate_url, weaviate_api_key, openai_api_key, embedding_cache_path='embeddings_cache.sqlite'):
+        # weaviate and langchain are heavy imports, only needed once a client is created
+        import weaviate
+        from langchain.embeddings.openai import OpenAIEmbeddings
+
         self.client = weaviate.Client(url=weaviate_url, auth_client_secret=weaviate.AuthApiKey(weaviate_api_key))
         self.embeddings = OpenAIEmbeddings(api_key=openai_api_key)
+        # Abstracts that were embedded before are served from the on-disk cache
+        self.embedding_pipeline = EmbeddingPipeline(self.embeddings, EmbeddingCache(embedding_cache_path))
         self._create_schema()
 
     def _create_schema(self):
@@ -41,18 +44,53 @@ class EmbeddingStorage:
             self.client.schema.create_class(paper_schema)
 
     def generate_embeddings(self, abstracts):
-        # Embedding a list of abstracts (documents)
-        return self.embeddings.embed_documents(abstracts)
-
-    def store_papers(self, papers, embeddings):
-        for paper, embedding in zip(papers, embeddings):
-            paper_object = {
-                "title": paper['title'],
-                "url": paper['url'],
-                "abstract": paper['abstract'],
-                "embedding": embedding
-            }
-            self.client.data_object.create(paper_object, class_name="Paper")
+        # Embedding a list of abstracts (documents), only sending cache misses to OpenAI
+        return self.embedding_pipeline.embed(abstracts)
+
+    def store_papers(self, papers, embeddings, batch_size=100, num_workers=4, max_retries=3):
+        """Imports papers with Weaviate's batch API.
+
+        Objects get deterministic UUIDs derived from the paper URL, so
+        re-imports overwrite instead of duplicating. Objects that Weaviate
+        rejects are retried on their own up to max_retries times; the ones
+        still failing are returned as (paper, errors) pairs.
+        """
+        from weaviate.util import generate_uuid5
+
+        pending = {generate_uuid5(paper['url']): (paper, embedding) for paper, embedding in zip(papers, embeddings)}
+        errors = {}
+        for attempt in range(max_retries):
+            with metrics.timer('stage_seconds', stage='weaviate_import'):
+                errors = self._import_batch(pending, batch_size, num_workers)
+            if not errors:
+                break
+            logger.warning("Attempt #%d: %d of %d papers failed to import", attempt + 1, len(errors), len(pending))
+            pending = {uuid: pending[uuid] for uuid in errors}
+        metrics.counter('papers_stored_total', backend='weaviate').inc(len(papers) - len(errors))
+        return [(pending[uuid][0], item_errors) for uuid, item_errors in errors.items()]
+
+    def _import_batch(self, objects, batch_size, num_workers):
+        """Sends objects in batches of batch_size, num_workers flushes at a time; returns errors by UUID."""
+        errors = {}
+
+        def collect_errors(results):
+            for result in results or []:
+                item_errors = result.get('result', {}).get('errors')
+                if item_errors:
+                    errors[result['id']] = item_errors
+
+        self.client.batch.configure(batch_size=batch_size, num_workers=num_workers, dynamic=False,
+                                    callback=collect_errors)
+        with self.client.batch as batch:
+            for uuid, (paper, embedding) in objects.items():
+                paper_object = {
+                    "title": paper['title'],
+                    "url": paper['url'],
+                    "abstract": paper['abstract'],
+                    "embedding": embedding
+                }
+                batch.add_data_object(paper_object, "Paper", uuid=uuid, vector=embedding)
+        return errors
 
     def clear_database(self):
         schema = self.client.schema.get()
@@ -61,30 +99,34 @@ class EmbeddingStorage:
             class_name = class_info['class']
             self.client.schema.delete_class(class_name)
 
-    def semantic_search(self, query_text, limit=1):
+    def semantic_search(self, query_text, limit=10, certainty=None):
         # Convert the query text into an embedding
         query_embedding = self.embeddings.embed_query(query_text)
 
-        # Perform a semantic search in Weaviate using nearVector
+        # Perform a semantic search in Weaviate using nearVector; the top `limit`
+        # hits are returned, cut off below `certainty` only if one is given
+        near_vector = {"vector": query_embedding}
+        if certainty is not None:
+            near_vector["certainty"] = certainty
         results = self.client.query.get(
             "Paper",
             ["title", "url", "abstract"]
-        ).with_near_vector({
-            "vector": query_embedding,
-            "certainty": 0.7  # You can adjust the certainty as needed
-        }).with_limit(limit).do()
+        ).with_near_vector(near_vector).with_limit(limit).do()
 
         return results
 
 # Example Usage
-load_dotenv()
-embedding_storage = EmbeddingStorage(
-    os.environ.get("WEAVIATE_CLUSTER_URL"),
-    os.environ.get("WEAVIATE_API_KEY"),
-    os.environ.get("OPENAI_API_KEY")
-)
-
-# papers = <result from your scraping logic>
-# abstracts = [paper['abstract'] for paper in papers]
-# paper_embeddings = embedding_storage.generate_embeddings(abstracts)
-# embedding_storage.store_papers(papers, paper_embeddings)
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    embedding_storage = EmbeddingStorage(
+        os.environ.get("WEAVIATE_CLUSTER_URL"),
+        os.environ.get("WEAVIATE_API_KEY"),
+        os.environ.get("OPENAI_API_KEY")
+    )
+
+    # papers = <result from your scraping logic>
+    # abstracts = [paper['abstract'] for paper in papers]
+    # paper_embeddings = embedding_storage.generate_embeddings(abstracts)
+    # embedding_storage.store_papers(papers, paper_embeddings)
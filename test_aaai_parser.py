@@ -1,11 +1,82 @@
-from aaai_parser import AAAIParser
+import time
+
+import pytest
+
+from aaai_parser import AAAIParser, PageTextCache, extract_page_texts
 
 # Path to the AAAI PDF file
 pdf_path = './AAAI_Main-Track_2024-01-04.pdf'
 
-# Create an instance of AAAIParser and parse the PDF
-parser = AAAIParser()
-publications = parser.get_publications(pdf_path)
+# Entries in the bundled PDF, including those at the top of every page
+EXPECTED_ENTRIES = 2334
+# End-to-end budget for a cold parse (text extraction dominates)
+PARSE_BUDGET_SECONDS = 120
+
+
+@pytest.fixture(scope='module')
+def page_cache(tmp_path_factory):
+    return PageTextCache(str(tmp_path_factory.mktemp('aaai') / 'pages.sqlite'))
+
+
+@pytest.fixture(scope='module')
+def parse_run(page_cache):
+    # Create an instance of AAAIParser and parse the PDF
+    parser = AAAIParser(workers=2, cache=page_cache)
+    start = time.perf_counter()
+    publications = parser.get_publications(pdf_path)
+    return publications, time.perf_counter() - start
+
+
+@pytest.fixture(scope='module')
+def publications(parse_run):
+    return parse_run[0]
+
+
+def test_get_publications(publications, parse_run):
+    assert publications[0]['id'] == '716'
+    assert len(publications) == EXPECTED_ENTRIES
+    assert len({publication['id'] for publication in publications}) == EXPECTED_ENTRIES
+    assert all(publication['title'] and publication['authors'] for publication in publications)
+    assert parse_run[1] < PARSE_BUDGET_SECONDS
+
+
+def test_page_starts_and_footers_are_handled(publications):
+    ids = [publication['id'] for publication in publications]
+    # First entry of page 2, which used to be skipped as a "header"
+    assert '794' in ids
+    # Page numbers are not glued onto the last authors of a page
+    assert publications[-1]['authors'][-1] == 'Xiaohong Guan'
+
+
+def test_entries_spanning_page_breaks_are_joined():
+    pages = [
+        'AAAI-24: Main Track\nID Title Authors\n1 First Paper Ann A; Bob B\n2 Second Paper Cid C;\n1',
+        'Dee D\n3 Third Paper Eve E\n2',
+    ]
+    entries = list(AAAIParser().iter_entries(pages))
+
+    assert [entry['id'] for entry in entries] == ['1', '2', '3']
+    assert entries[1]['authors'] == ['Dee D']
+
+
+def test_iter_publications_is_lazy(page_cache, publications):
+    stream = AAAIParser(cache=page_cache).iter_publications(pdf_path)
+    assert next(stream) == publications[0]
+
+
+def test_parallel_extraction_matches_serial_page_order(page_cache, publications):
+    serial = extract_page_texts(pdf_path, [0, 1, 42, 85])
+    cached = AAAIParser(workers=1, cache=page_cache).get_page_texts(pdf_path)
+
+    assert len(cached) == 86
+    assert [cached[page] for page in (0, 1, 42, 85)] == serial
+
+
+def test_cached_rerun_skips_extraction_and_matches(page_cache, publications, monkeypatch):
+    def fail(*args):
+        raise AssertionError('pages should come from the cache')
+    monkeypatch.setattr('aaai_parser.extract_page_texts', fail)
 
-# Quick check
-print(publications[:10])  
+    start = time.perf_counter()
+    assert AAAIParser(cache=page_cache).get_publications(pdf_path) == publications
+    assert time.perf_counter() - start < 5
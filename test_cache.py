@@ -0,0 +1,116 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from cache import ResponseCache
+from scheduler import FetchScheduler
+
+
+class EtagHandler(BaseHTTPRequestHandler):
+    '''Serves a fixed body per path with an ETag and honours If-None-Match.'''
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        etag = f'"{self.path}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = (self.path * 100).encode()
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = HTTPServer(('127.0.0.1', 0), EtagHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_fresh_entries_skip_the_network(server, tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'))
+    url = f'http://127.0.0.1:{server.server_port}/page'
+
+    first = FetchScheduler(cache=cache).get(url, params={'q': 1})
+    # A new scheduler over the same file behaves like a second CLI run
+    second = FetchScheduler(cache=ResponseCache(cache.path)).get(url, params={'q': 1})
+
+    assert server.requests == ['/page?q=1']
+    assert second.content == first.content
+    assert second.headers['X-Cache'] == 'HIT'
+    assert cache.stats()['misses'] == 1
+
+
+def test_stale_entries_are_revalidated(server, tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), default_ttl=0)
+    scheduler = FetchScheduler(cache=cache)
+    url = f'http://127.0.0.1:{server.server_port}/page'
+
+    scheduler.get(url)
+    response = scheduler.get(url)
+
+    assert len(server.requests) == 2
+    assert response.content == b'/page' * 100
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['revalidations']) == (1, 1, 1)
+
+
+def test_least_recently_used_entries_are_evicted(server, tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), max_bytes=30)  # Room for two compressed bodies
+    scheduler = FetchScheduler(cache=cache)
+    base = f'http://127.0.0.1:{server.server_port}'
+
+    scheduler.get(f'{base}/a')
+    scheduler.get(f'{base}/b')
+    scheduler.get(f'{base}/a')  # Hit, makes /b the least recently used entry
+    scheduler.get(f'{base}/c')
+
+    assert cache.stats()['entries'] == 2
+    scheduler.get(f'{base}/a')
+    scheduler.get(f'{base}/b')
+    assert server.requests == ['/a', '/b', '/c', '/b']
+
+
+def test_stale_entry_is_served_when_the_network_fails(server, tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), default_ttl=0)
+    url = f'http://127.0.0.1:{server.server_port}/page'
+    FetchScheduler(cache=cache).get(url)
+
+    response = cache.get(url, lambda url, headers: None)
+
+    assert response.content == b'/page' * 100
+    assert response.headers['X-Cache'] == 'STALE'
+    assert cache.get(f'{url}/other', lambda url, headers: None) is None
+
+
+def test_hits_are_not_written_one_by_one(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = ResponseCache(path, max_bytes=10 ** 6)
+    cache.put('http://example.org/a', b'a' * 1000)
+    cache.put('http://example.org/b', b'b' * 1000)
+    cache.put('http://example.org/a', b'aa' * 1000)  # Replacing an entry updates the running size
+
+    changes = cache.db.total_changes
+    for _ in range(10):
+        assert cache.lookup('http://example.org/b') == b'b' * 1000
+    assert cache.db.total_changes == changes
+    assert cache.stats()['stored_bytes'] == cache.db.execute('SELECT SUM(size) FROM responses').fetchone()[0]
+
+    cache.close()
+    reopened = ResponseCache(path)
+    accessed = dict(reopened.db.execute('SELECT url, accessed_at FROM responses'))
+    assert accessed['http://example.org/b'] > accessed['http://example.org/a']
+    assert reopened.stats()['stored_bytes'] == cache.stored_bytes
@@ -0,0 +1,125 @@
+import json
+
+from crawl import FAILED, MISSING, OK, CrawlManifest, crawl_incremental
+from paper_store import read_legacy_papers
+from scrapers import Scraper
+from sinks import JSONLSink
+
+
+class FakeFetcher:
+    def __init__(self, records, unreachable=()):
+        self.records = records
+        self.unreachable = set(unreachable)
+        self.requested = []
+
+    def fetch_many(self, ids):
+        self.requested.append(list(ids))
+        results = {i: self.records[i] for i in ids if i in self.records and i not in self.unreachable}
+        missing = [i for i in ids if i not in self.records]
+        failed = [i for i in ids if i in self.unreachable]
+        return results, missing, failed
+
+
+class FakeScraper(Scraper):
+    def __init__(self, fetcher, ids):
+        self.fetcher = fetcher
+        self.ids = ids
+
+    def list_publications(self, url):
+        return [(f'Title {i}', f'http://arxiv.org/abs/{i}', i) for i in self.ids]
+
+
+RECORDS = {str(n): (f'Abstract {n}', [f'Author {n}']) for n in range(5)}
+
+
+def read_ids(path):
+    with open(path) as f:
+        return [json.loads(line)['url'].split('/')[-1] for line in f]
+
+
+def test_resumed_crawl_only_fetches_new_and_failed_ids(tmp_path):
+    output = tmp_path / 'papers.jsonl'
+    manifest_path = tmp_path / 'manifest.jsonl'
+
+    fetcher = FakeFetcher(RECORDS, unreachable={'3'})
+    scraper = FakeScraper(fetcher, ['0', '1', '2', '3', 'x'])
+    assert crawl_incremental(scraper, 'url', output, CrawlManifest(manifest_path), batch_size=2) == 3
+    assert fetcher.requested == [['0', '1'], ['2', '3'], ['x']]
+
+    manifest = CrawlManifest(manifest_path)
+    assert manifest.statuses == {'0': OK, '1': OK, '2': OK, '3': FAILED, 'x': MISSING}
+
+    # The next run lists one more paper and the failed id is reachable again
+    fetcher = FakeFetcher(RECORDS)
+    scraper = FakeScraper(fetcher, ['0', '1', '2', '3', 'x', '4'])
+    assert crawl_incremental(scraper, 'url', output, manifest, batch_size=2) == 2
+    assert fetcher.requested == [['3', '4']]
+    assert read_ids(output) == ['0', '1', '2', '3', '4']
+
+
+def test_crash_before_recording_a_batch_does_not_duplicate_it(tmp_path, monkeypatch):
+    output = tmp_path / 'papers.jsonl'
+    manifest_path = tmp_path / 'manifest.jsonl'
+    scraper = FakeScraper(FakeFetcher(RECORDS), ['0', '1', '2'])
+
+    def crash(self, statuses, position=None):
+        raise KeyboardInterrupt
+    # The first batch reaches the output, then the process dies before the manifest records it
+    with monkeypatch.context() as patch:
+        patch.setattr(CrawlManifest, 'record', crash)
+        try:
+            crawl_incremental(scraper, 'url', output, CrawlManifest(manifest_path), batch_size=2)
+        except KeyboardInterrupt:
+            pass
+    assert read_ids(output) == ['0', '1']
+
+    fetcher = FakeFetcher(RECORDS)
+    manifest = CrawlManifest(manifest_path)
+    assert crawl_incremental(FakeScraper(fetcher, ['0', '1', '2']), 'url', output, manifest, batch_size=2) == 1
+    assert fetcher.requested == [['2']]
+    assert read_ids(output) == ['0', '1', '2']
+    assert manifest.statuses == {'0': OK, '1': OK, '2': OK}
+
+
+def test_manifest_ignores_truncated_last_line(tmp_path):
+    manifest_path = tmp_path / 'manifest.jsonl'
+    CrawlManifest(manifest_path).record({'1': OK})
+    with open(manifest_path, 'a') as f:
+        f.write('{"arxiv_id": "2", "sta')
+
+    manifest = CrawlManifest(manifest_path)
+    assert manifest.statuses == {'1': OK}
+    manifest.record({'2': OK})
+    assert CrawlManifest(manifest_path).statuses == {'1': OK, '2': OK}
+
+
+def test_crash_in_the_middle_of_a_write_leaves_a_readable_output(tmp_path, monkeypatch):
+    output = tmp_path / 'papers.jsonl'
+    manifest_path = tmp_path / 'manifest.jsonl'
+    scraper = FakeScraper(FakeFetcher(RECORDS), ['0', '1', '2', '3'])
+
+    def crash(self, papers):
+        # Half of the second batch reaches the disk before the process dies
+        lines = ''.join(json.dumps(paper) + '\n' for paper in papers)
+        self.file.write(lines[:len(lines) // 2])
+        self.file.flush()
+        raise KeyboardInterrupt
+    try:
+        crawl_incremental(scraper, 'url', output, CrawlManifest(manifest_path), batch_size=2)
+    except KeyboardInterrupt:
+        pass
+    with monkeypatch.context() as patch:
+        patch.setattr(JSONLSink, 'write_chunk', crash)
+        try:
+            crawl_incremental(FakeScraper(FakeFetcher(RECORDS), ['0', '1', '2', '3', '4']), 'url', output,
+                              CrawlManifest(manifest_path), batch_size=2)
+        except KeyboardInterrupt:
+            pass
+    assert not output.read_text().endswith('\n')
+
+    fetcher = FakeFetcher(RECORDS)
+    manifest = CrawlManifest(manifest_path)
+    assert crawl_incremental(FakeScraper(fetcher, ['0', '1', '2', '3', '4']), 'url', output, manifest) == 1
+    assert fetcher.requested == [['4']]
+    assert read_ids(output) == ['0', '1', '2', '3', '4']
+    assert [paper['url'] for paper in read_legacy_papers(str(output))][-1] == 'http://arxiv.org/abs/4'
@@ -0,0 +1,99 @@
+import json
+
+from dedup import Deduplicator, canonical_arxiv_id, dedup_file
+from paper_store import read_legacy_papers
+from scrapers import get_scraper
+from sinks import JSONLSink
+from test_scrapers import FakeFetcher, fixture_bytes
+
+ABSTRACT = ('We propose a federated learning defense that analyses critical parameters of local updates '
+            'to detect and exclude malicious clients, and show it is robust to a range of attacks.')
+
+
+def test_arxiv_versions_are_the_same_paper():
+    assert canonical_arxiv_id({'url': 'http://arxiv.org/abs/2308.09318v2'}) == '2308.09318'
+    assert canonical_arxiv_id({'url': 'https://arxiv.org/pdf/2308.09318v1.pdf'}) == '2308.09318'
+    assert canonical_arxiv_id({'arxiv_id': '2308.09318v3', 'url': 'https://openreview.net/forum?id=x'}) == '2308.09318'
+    assert canonical_arxiv_id({'url': 'https://openreview.net/forum?id=x'}) is None
+
+    papers = Deduplicator().dedup([
+        {'title': 'Attack-tolerant FL', 'url': 'http://arxiv.org/abs/2308.09318v1', 'abstract': 'Short.'},
+        {'title': 'Towards Attack-tolerant Federated Learning', 'url': 'http://arxiv.org/abs/2308.09318v2',
+         'abstract': ABSTRACT},
+    ])
+    assert len(papers) == 1
+    assert papers[0]['arxiv_id'] == '2308.09318'
+    assert papers[0]['abstract'] == ABSTRACT
+
+
+def test_near_duplicates_across_venues_are_merged():
+    main_track = {'title': 'Towards Attack-tolerant Federated Learning via Critical Parameter Analysis',
+                  'abstract': ABSTRACT, 'authors': ['Sungwon Han'], 'conference': 'ICCV', 'year': 2023}
+    workshop = {'title': 'Towards attack-tolerant federated learning via critical parameter analysis.',
+                'abstract': ABSTRACT.replace('a range of', 'many'), 'authors': [],
+                'url': 'https://openreview.net/forum?id=abc', 'conference': 'FL-ICML Workshop', 'year': 2023}
+    other = {'title': 'Diffusion Models Beat GANs', 'abstract': 'Diffusion models for image synthesis.',
+             'conference': 'NeurIPS', 'year': 2021}
+
+    papers = Deduplicator().dedup([main_track, other, workshop])
+
+    assert [paper['title'] for paper in papers] == [main_track['title'], other['title']]
+    assert papers[0]['venues'] == ['ICCV 2023', 'FL-ICML Workshop 2023']
+    assert papers[0]['authors'] == ['Sungwon Han']
+    assert papers[0]['url'] == 'https://openreview.net/forum?id=abc'
+    assert papers[1]['venues'] == ['NeurIPS 2021']
+
+
+def test_bundled_repository_with_reposted_copies():
+    with open('papers_repository.json') as f:
+        papers = json.load(f)
+    # Re-listed copies: new arXiv version, or a retyped title without the url
+    copies = [dict(paper, url=paper['url'] + 'v2') for paper in papers[:100]]
+    copies += [{'title': paper['title'].lower(), 'abstract': paper['abstract']} for paper in papers[100:200]]
+
+    deduplicated = Deduplicator().dedup(papers + copies)
+
+    assert len(deduplicated) == len(papers)
+
+
+def test_papers_with_different_arxiv_ids_are_never_merged():
+    paper = {'title': 'Towards Attack-tolerant Federated Learning', 'abstract': ABSTRACT,
+             'url': 'http://arxiv.org/abs/2308.09318'}
+    follow_up = dict(paper, url='http://arxiv.org/abs/2401.00001v1')
+    # Without an id, the copy could join either: it must not bridge the two
+    copy = {'title': paper['title'], 'abstract': ABSTRACT}
+
+    papers = Deduplicator().dedup([paper, follow_up, copy])
+
+    assert sorted(merged['arxiv_id'] for merged in papers) == ['2308.09318', '2401.00001']
+
+
+def test_dedup_file_rewrites_the_repository_in_place(tmp_path):
+    with open('papers_repository.json') as f:
+        papers = json.load(f)[:50]
+    path = tmp_path / 'papers_repository.jsonl'
+    with open(path, 'w') as f:
+        f.writelines(json.dumps(paper) + '\n' for paper in papers + [dict(papers[0], url=papers[0]['url'] + 'v2')])
+
+    assert dedup_file(str(path)) == (51, 50)
+    with open(path) as f:
+        assert [json.loads(line)['title'] for line in f] == [paper['title'] for paper in papers]
+    assert not (tmp_path / 'papers_repository.jsonl.part').exists()
+
+
+def test_scraped_papers_carry_what_dedup_needs(tmp_path):
+    iccv, cvpr = 'https://openaccess.thecvf.com/ICCV2023?day=all', 'https://openaccess.thecvf.com/CVPR2024?day=all'
+    records = {'2308.09160': ('FedPerfix abstract.', ['Guangyu Sun']),
+               '2308.09318': ('Attack-tolerant abstract.', ['Sungwon Han'])}
+    # The same arXiv papers are listed at two conferences
+    fetcher = FakeFetcher({iccv: fixture_bytes('cvf_iccv2023.html'), cvpr: fixture_bytes('cvf_iccv2023.html')},
+                          records)
+    repository = str(tmp_path / 'papers.jsonl')
+    sink = JSONLSink(repository)
+    sink.write([*get_scraper('iccv', fetcher).iter_publications(iccv),
+                *get_scraper('cvpr', fetcher).iter_publications(cvpr)])
+
+    assert dedup_file(repository) == (4, 2)
+    papers = read_legacy_papers(repository)
+    assert [paper['arxiv_id'] for paper in papers] == ['2308.09160', '2308.09318']
+    assert [paper['venues'] for paper in papers] == [['ICCV 2023', 'CVPR 2024']] * 2
@@ -0,0 +1,45 @@
+import numpy as np
+
+from embeddings import EmbeddingCache, EmbeddingPipeline, HashingEmbedder
+
+
+class CountingEmbedder(HashingEmbedder):
+    def __init__(self):
+        super().__init__(dim=32)
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        return super().embed_documents(texts)
+
+
+def test_hashing_embedder_is_deterministic():
+    a = HashingEmbedder().embed_query('Federated learning under attack')
+    b = HashingEmbedder().embed_query('federated   learning under attack')
+    assert a == b
+    assert abs(np.linalg.norm(a) - 1) < 1e-6
+
+
+def test_only_misses_are_sent_and_duplicates_are_embedded_once(tmp_path):
+    cache_path = str(tmp_path / 'embeddings.sqlite')
+    provider = CountingEmbedder()
+    pipeline = EmbeddingPipeline(provider, EmbeddingCache(cache_path))
+
+    first = pipeline.embed(['alpha beta', 'gamma', 'alpha\n beta'])
+    assert provider.batches == [['alpha beta', 'gamma']]
+    assert first[0] == first[2]
+
+    # A later run over the same cache file only pays for the new text
+    provider = CountingEmbedder()
+    pipeline = EmbeddingPipeline(provider, EmbeddingCache(cache_path))
+    second = pipeline.embed(['gamma', 'delta', 'alpha beta'])
+    assert provider.batches == [['delta']]
+    assert second[0] == first[1] and second[2] == first[0]
+    assert (pipeline.hits, pipeline.misses) == (2, 1)
+
+
+def test_batches_respect_token_budget_and_size():
+    pipeline = EmbeddingPipeline(HashingEmbedder(), max_batch_tokens=10, max_batch_size=3)
+    texts = ['x' * 16] * 2 + ['y'] * 5  # 5 tokens each, then 1 token each
+
+    assert [len(batch) for batch in pipeline.batches(texts)] == [2, 3, 2]
@@ -0,0 +1,119 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from cache import ResponseCache
+from fetchers import ArxivFetcher
+from scheduler import FetchScheduler
+
+# Canned arXiv records served by the stub API, keyed by unversioned id
+RECORDS = {
+    '2308.09318': ('Federated learning abstract.', ['Sungwon Han', 'Sungwon Park']),
+    '2308.00001': ('Second abstract.', ['Ada Lovelace']),
+    '2308.00002': ('Third abstract.', ['Alan Turing', 'Grace Hopper']),
+}
+
+
+def atom_feed(ids):
+    entries = []
+    for arxiv_id in ids:
+        base_id = ArxivFetcher.canonical_id(arxiv_id)
+        if base_id not in RECORDS:
+            continue
+        abstract, authors = RECORDS[base_id]
+        names = ''.join(f'<author><name>{name}</name></author>' for name in authors)
+        entries.append(f'<entry><id>http://arxiv.org/abs/{base_id}v1</id>'
+                       f'<summary>\n  {abstract}\n</summary>{names}</entry>')
+    return ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<feed xmlns="http://www.w3.org/2005/Atom">' + ''.join(entries) + '</feed>')
+
+
+class StubArxivHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        ids = query['id_list'][0].split(',')
+        self.server.requests.append(ids)
+        if self.server.down:
+            self.send_response(503)
+            self.end_headers()
+            return
+        body = atom_feed(ids).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/atom+xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = HTTPServer(('127.0.0.1', 0), StubArxivHandler)
+    server.requests = []
+    server.down = False
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_many_batches_ids(stub_server):
+    fetcher = ArxivFetcher(api_url=f'http://127.0.0.1:{stub_server.server_port}/api/query', batch_size=2)
+    ids = ['2308.09318v2', '2308.00001', '2308.00002']
+
+    results, missing, failed = fetcher.fetch_many(ids)
+
+    assert sorted(stub_server.requests) == [['2308.00002'], ['2308.09318v2', '2308.00001']]
+    assert missing == failed == []
+    assert results['2308.09318v2'] == RECORDS['2308.09318']
+    assert results['2308.00002'] == RECORDS['2308.00002']
+
+
+def test_fetch_many_reports_missing_ids(stub_server):
+    fetcher = ArxivFetcher(api_url=f'http://127.0.0.1:{stub_server.server_port}/api/query')
+
+    results, missing, failed = fetcher.fetch_many(['2308.00001', '9999.99999'])
+
+    assert len(stub_server.requests) == 1
+    assert list(results) == ['2308.00001']
+    assert missing == ['9999.99999']
+    assert failed == []
+
+
+def cached_fetcher(server, cache, batch_size):
+    scheduler = FetchScheduler(host_rates={}, max_retries=1, retry_delay=0, cache=cache)
+    return ArxivFetcher(api_url=f'http://127.0.0.1:{server.server_port}/api/query', batch_size=batch_size,
+                        scheduler=scheduler)
+
+
+def test_cached_ids_are_not_refetched_in_another_batching(stub_server, tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'))
+    cached_fetcher(stub_server, cache, batch_size=2).fetch_many(['2308.09318', '2308.00001'])
+
+    fetcher = cached_fetcher(stub_server, cache, batch_size=3)
+    results, missing, failed = fetcher.fetch_many(['2308.00002', '2308.00001v1', '2308.09318'])
+
+    assert stub_server.requests == [['2308.09318', '2308.00001'], ['2308.00002']]
+    assert list(results) == ['2308.00002', '2308.00001v1', '2308.09318']
+    assert results['2308.09318'] == RECORDS['2308.09318']
+    # A single-id query reads the same per-id entry
+    assert fetcher.fetch('2308.00002') == RECORDS['2308.00002']
+    assert len(stub_server.requests) == 2
+
+
+def test_failed_batch_falls_back_to_stale_entries(stub_server, tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), default_ttl=0)
+    cached_fetcher(stub_server, cache, batch_size=10).fetch_many(['2308.09318'])
+
+    stub_server.down = True
+    results, missing, failed = cached_fetcher(stub_server, cache, batch_size=10).fetch_many(
+        ['2308.09318', '2308.00001'])
+
+    assert len(stub_server.requests) == 2
+    assert results == {'2308.09318': RECORDS['2308.09318']}
+    assert failed == ['2308.00001']
@@ -0,0 +1,156 @@
+import asyncio
+import os
+import shutil
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from embeddings import HashingEmbedder
+from fetchers import ArxivFetcher
+from fulltext import ChunkStore, FullTextIngester, FullTextSearcher, chunk_words, extract_chunks, split_sections
+from scheduler import FetchScheduler
+from search_index import SearchIndex
+from service import QueryService
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PAPER_PDF = os.path.join(HERE, 'fixtures', 'sparse_attention_paper.pdf')
+AAAI_PDF = os.path.join(HERE, 'AAAI_Main-Track_2024-01-04.pdf')
+
+
+class LocalPDFFetcher:
+    '''Serves fixture PDFs by arXiv id, copying them into the download directory like fetch_pdf.'''
+
+    def __init__(self, pdfs):
+        self.pdfs = pdfs
+        self.scheduler = FetchScheduler(concurrency=2)
+        self.requested = []
+
+    def fetch_pdf(self, arxiv_id, directory):
+        self.requested.append(arxiv_id)
+        if arxiv_id not in self.pdfs:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        return shutil.copy(self.pdfs[arxiv_id], os.path.join(directory, arxiv_id + '.pdf'))
+
+
+def test_split_sections_follows_headings_and_drops_references():
+    text = ("Title\nAbstract\nWe study retrieval over long scientific docu-\nments.\n1 Introduction\nFirst.\n"
+            "3.1 Chunking Details\nSecond line.\nWe use 3 layers. This is body text.\nReferences\n[1] A. Author. 2009.")
+    assert split_sections(text) == [
+        ('Front matter', 'Title'),
+        ('Abstract', 'We study retrieval over long scientific documents.'),
+        ('1 Introduction', 'First.'),
+        ('3.1 Chunking Details', 'Second line. We use 3 layers. This is body text.'),
+    ]
+
+
+def test_chunk_words_overlaps_windows():
+    words = [f'w{i}' for i in range(25)]
+    chunks = [chunk.split() for chunk in chunk_words(' '.join(words), size=10, overlap=3)]
+    assert chunks[0] == words[:10]
+    assert chunks[1][:3] == words[7:10]
+    assert chunks[-1][-1] == 'w24'
+    assert list(chunk_words('a few words', size=10, overlap=3)) == ['a few words']
+
+
+def test_extract_chunks_from_fixture_pdfs():
+    chunks, seconds = extract_chunks(PAPER_PDF)
+    sections = [section for section, _ in chunks]
+    assert sections == ['Front matter', 'Abstract', '1 Introduction', '2 Related Work', '3 Method',
+                        '3.1 Chunking', '4 Experiments', '5 Conclusion']
+    assert 'long scientific documents' in chunks[1][1]
+    assert not any('Robertson' in text for _, text in chunks)
+    assert seconds > 0
+
+    # The AAAI track listing has no section headings: its pages come out as front matter chunks
+    chunks, _ = extract_chunks(AAAI_PDF, max_pages=2, size=100, overlap=20)
+    assert len(chunks) > 5
+    assert 'Occluded Person Re-identification' in ' '.join(text for _, text in chunks)
+
+
+def test_ingest_stores_embedded_chunks_and_resumes(tmp_path):
+    fetcher = LocalPDFFetcher({'2401.00001': PAPER_PDF, '2401.00002': AAAI_PDF})
+    store = ChunkStore(str(tmp_path / 'papers_store.fulltext'))
+    ingester = FullTextIngester(fetcher, str(tmp_path / 'pdfs'), store, HashingEmbedder(dim=64), workers=2,
+                                max_pages=2, write_batch=4)
+
+    written = ingester.ingest(['2401.00001v2', '2401.00002', '2401.00003'])
+
+    assert written == len(store) > 8
+    assert store.arxiv_ids() == {'2401.00001', '2401.00002'}
+    assert store.dim() == 64
+    # Streaming writes: several part files rather than one at the end
+    assert len(store.parts()) > 1
+
+    fetcher.requested.clear()
+    assert ingester.ingest(['2401.00001', '2401.00002', '2401.00003']) == 0
+    assert fetcher.requested == ['2401.00003']
+
+
+def test_searcher_returns_best_chunk_per_paper(tmp_path):
+    store = ChunkStore(str(tmp_path / 'papers_store.fulltext'))
+    FullTextIngester(LocalPDFFetcher({'2401.00001': PAPER_PDF, '2401.00002': AAAI_PDF}), str(tmp_path / 'pdfs'),
+                     store, HashingEmbedder(dim=64), workers=1, max_pages=2).ingest(['2401.00001', '2401.00002'])
+
+    searcher = FullTextSearcher.load(store.directory)
+    hits = searcher.search('optimizer settings', k=5, query_vector=HashingEmbedder(dim=64).embed_query('optimizer'))
+    assert hits[0]['arxiv_id'] == '2401.00001'
+    assert hits[0]['section'] == '1 Introduction'
+    assert len({hit['arxiv_id'] for hit in hits}) == len(hits)
+
+    hits = searcher.search('occluded person re-identification')
+    assert hits[0]['arxiv_id'] == '2401.00002'
+    # Keyword-only search still ranks chunks that miss a query term
+    hits = searcher.search('occluded person re-identification quasicrystals')
+    assert hits[0]['arxiv_id'] == '2401.00002'
+
+
+def test_query_service_fulltext_results_carry_paper_fields(tmp_path):
+    store = ChunkStore(str(tmp_path / 'chunks'))
+    FullTextIngester(LocalPDFFetcher({'2401.00001': PAPER_PDF}), str(tmp_path / 'pdfs'), store,
+                     workers=1).ingest(['2401.00001'])
+    papers = [{'title': 'Sparse Attention for Long Document Retrieval', 'authors': ['Ada Lovelace'],
+               'url': 'http://arxiv.org/abs/2401.00001', 'abstract': 'Retrieval over long documents.'}]
+    service = QueryService(papers, SearchIndex.build(papers), fulltext=FullTextSearcher.load(store.directory))
+
+    results = asyncio.run(service.fulltext_search('hashing vectorizer', 3))
+    assert results[0]['title'] == 'Sparse Attention for Long Document Retrieval'
+    assert results[0]['section'] == '3 Method'
+
+
+class PDFHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        with open(PAPER_PDF, 'rb') as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/pdf')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def pdf_server():
+    server = HTTPServer(('127.0.0.1', 0), PDFHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_pdf_downloads_once(pdf_server, tmp_path):
+    fetcher = ArxivFetcher(scheduler=FetchScheduler(host_rates={}))
+    fetcher.PDF_URL = f'http://127.0.0.1:{pdf_server.server_port}/pdf/{{}}'
+
+    path = fetcher.fetch_pdf('2401.00001v3', str(tmp_path))
+    assert path == str(tmp_path / '2401.00001.pdf')
+    assert fetcher.fetch_pdf('2401.00001', str(tmp_path)) == path
+    assert pdf_server.requests == ['/pdf/2401.00001']
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.part')]
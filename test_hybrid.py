@@ -0,0 +1,68 @@
+import numpy as np
+
+from embeddings import HashingEmbedder
+from hybrid import HybridSearcher, TitleReranker, reciprocal_rank_fusion
+from search_index import SearchIndex
+from vector_index import normalize
+
+PAPERS = [
+    {'title': 'Neural Radiance Fields for Scenes', 'abstract': 'We render scenes with radiance fields.',
+     'authors': ['Ben Mildenhall']},
+    {'title': 'Diffusion Models Beat GANs', 'abstract': 'Diffusion models for image synthesis.',
+     'authors': ['Prafulla Dhariwal']},
+    {'title': 'Denoising Diffusion Probabilistic Models', 'abstract': 'Image synthesis with diffusion models.',
+     'authors': ['Jonathan Ho']},
+    {'title': 'Attention Is All You Need', 'abstract': 'Transformers replace recurrence with attention.',
+     'authors': ['Ashish Vaswani']},
+]
+
+
+def test_reciprocal_rank_fusion():
+    ids, scores = reciprocal_rank_fusion([[3, 1, 2], [1, 0]], k=1)
+    # 1 is ranked second and first: 1/3 + 1/2; 3 only first: 1/2
+    assert ids.tolist() == [1, 3, 0, 2]
+    assert np.allclose(scores, [1 / 3 + 1 / 2, 1 / 2, 1 / 3, 1 / 4])
+    assert len(reciprocal_rank_fusion([[], []])[0]) == 0
+
+
+def test_hybrid_recovers_what_keyword_search_misses():
+    embedder = HashingEmbedder(dim=256)
+    vectors = normalize(embedder.embed_documents([f"{p['title']}\n{p['abstract']}" for p in PAPERS]))
+    index = SearchIndex.build(PAPERS)
+    searcher = HybridSearcher(index, vectors, embedder.embed_query, reranker=TitleReranker(PAPERS))
+
+    # "transformers" is not in any title, and "recurrent" matches nothing, so BM25 finds nothing
+    query = 'attention transformers recurrent'
+    assert len(index.search(query)[0]) == 0
+    ids, scores, timings = searcher.search(query, k=2)
+
+    assert ids[0] == 3
+    assert np.all(np.diff(scores) <= 0)
+    assert {'keyword_ms', 'embed_ms', 'vector_ms', 'fusion_ms', 'rerank_ms', 'total_ms'} <= set(timings)
+
+
+def test_keyword_side_ranks_papers_missing_a_query_term():
+    vectors = normalize(np.random.default_rng(0).normal(size=(len(PAPERS), 8)))
+    searcher = HybridSearcher(SearchIndex.build(PAPERS), vectors, lambda text: vectors[0])
+
+    # No paper has every term, so conjunctive BM25 would leave the fusion with the vector ranking only
+    query = 'diffusion models transformers'
+    assert len(searcher.keyword_index.search(query)[0]) == 0
+    assert set(searcher.keyword_ranking(query, {}).tolist()) == {1, 2, 3}
+
+
+def test_reranker_only_sees_the_head_of_the_fused_list():
+    seen = []
+
+    def reranker(query, ids, fused_scores):
+        seen.append(len(ids))
+        return fused_scores
+
+    vectors = normalize(np.random.default_rng(0).normal(size=(len(PAPERS), 8)))
+    searcher = HybridSearcher(SearchIndex.build(PAPERS), vectors, lambda text: vectors[0], depth=4,
+                              rerank_depth=2, reranker=reranker)
+    ids, _, _ = searcher.search('diffusion', k=10)
+
+    assert seen == [2]
+    assert len(ids) == 2
+    assert len(searcher.search('diffusion', k=10, rerank=False)[0]) == 4
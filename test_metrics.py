@@ -0,0 +1,95 @@
+import json
+import threading
+import time
+
+import pytest
+
+from metrics import Histogram, MetricsRegistry, profile
+
+
+def test_histogram_estimates_quantiles_from_buckets():
+    histogram = Histogram(buckets=(0.01, 0.1, 1))
+    for seconds in [0.005] * 90 + [0.5] * 10:
+        histogram.observe(seconds)
+
+    assert histogram.count == 100
+    assert histogram.quantile(0.5) <= 0.01
+    assert 0.1 < histogram.quantile(0.99) <= 0.5
+    assert histogram.summary()['max_ms'] == 500.0
+
+
+def test_report_groups_series_and_derives_hit_rates():
+    registry = MetricsRegistry()
+    registry.counter('http_requests_total', host='a').inc(3)
+    registry.counter('http_cache_hits_total').inc(3)
+    registry.counter('http_cache_misses_total').inc(1)
+    registry.gauge('fetch_queue_depth').inc(5)
+    registry.gauge('fetch_queue_depth').dec(5)
+    with registry.timer('stage_seconds', stage='parse'):
+        pass
+
+    report = json.loads(json.dumps(registry.report()))
+    assert report['counters']['http_requests_total{host="a"}'] == 3
+    assert report['cache_hit_rates'] == {'http_cache_hit_rate': 0.75}
+    assert report['gauges']['fetch_queue_depth'] == {'value': 0, 'max': 5}
+    assert report['histograms']['stage_seconds{stage="parse"}']['count'] == 1
+
+    with pytest.raises(ValueError):
+        registry.gauge('http_requests_total')
+
+
+def test_prometheus_exposition():
+    registry = MetricsRegistry()
+    registry.describe('stage_seconds', 'Time per stage')
+    registry.counter('papers_written_total', sink='JSONLSink').inc(7)
+    histogram = registry.histogram('stage_seconds', buckets=(0.1, 1), stage='say "hi"')
+    histogram.observe(0.05)
+    histogram.observe(2)
+
+    lines = registry.prometheus().splitlines()
+    assert 'papers_written_total{sink="JSONLSink"} 7' in lines
+    assert '# HELP stage_seconds Time per stage' in lines
+    assert 'stage_seconds_bucket{stage="say \\"hi\\"",le="0.1"} 1' in lines
+    assert 'stage_seconds_bucket{stage="say \\"hi\\"",le="+Inf"} 2' in lines
+    assert 'stage_seconds_count{stage="say \\"hi\\""} 2' in lines
+
+
+def test_counters_are_thread_safe():
+    registry = MetricsRegistry()
+
+    def work():
+        for _ in range(10000):
+            registry.counter('events_total').inc()
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert registry.counter('events_total').value == 40000
+
+
+def busy_wait(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_sampling_profiler_sees_worker_threads(tmp_path):
+    path = tmp_path / 'run.stacks'
+    with profile('sample', str(path)):
+        worker = threading.Thread(target=busy_wait, args=(0.2,))
+        worker.start()
+        worker.join()
+
+    stacks = path.read_text()
+    assert 'busy_wait (test_metrics.py' in stacks
+
+
+def test_cprofile_writes_stats(tmp_path):
+    import pstats
+
+    path = tmp_path / 'run.prof'
+    with profile('cprofile', str(path)):
+        busy_wait(0.01)
+    assert any(name == 'busy_wait' for _, _, name in pstats.Stats(str(path)).stats)
@@ -0,0 +1,58 @@
+import json
+
+import numpy as np
+import pytest
+
+from paper_store import PaperStore, convert
+
+
+def test_convert_bundled_repository(tmp_path):
+    with open('papers_repository.json') as f:
+        papers = json.load(f)
+
+    store = convert('papers_repository.json', str(tmp_path / 'store'), conference='ICCV', year=2023)
+
+    assert len(store) == len(papers)
+    records = store.records(['title', 'authors'])
+    assert records[0] == {'title': papers[0]['title'], 'authors': papers[0]['authors']}
+    first = store.records()[0]
+    assert first['arxiv_id'] == papers[0]['url'].split('/')[-1]
+    assert (first['conference'], first['year']) == ('ICCV', 2023)
+
+
+def test_append_with_embeddings_and_projection(tmp_path):
+    store = PaperStore(str(tmp_path))
+    vectors = np.arange(12, dtype=np.float32).reshape(3, 4)
+    papers = [{'arxiv_id': str(i), 'title': f'Paper {i}', 'authors': ['A'], 'abstract': 'x'} for i in range(3)]
+
+    store.append(papers[:2], vectors[:2])
+    store.store_papers([dict(papers[2], embedding=vectors[2])])
+
+    assert len(store.parts()) == 2
+    assert store.dim() == 4
+    assert store.read(['arxiv_id']).column_names == ['arxiv_id']
+    np.testing.assert_array_equal(store.embeddings(), vectors)
+    with pytest.raises(ValueError):
+        store.append(papers[:1], np.zeros((1, 5)))
+
+
+def test_records_the_embedding_model(tmp_path):
+    store = PaperStore(str(tmp_path))
+    papers = [{'arxiv_id': str(i), 'title': f'Paper {i}', 'authors': ['A'], 'abstract': 'x'} for i in range(2)]
+
+    store.append(papers[:1], np.ones((1, 4)), model='hashing-4')
+    store.append(papers[1:], np.ones((1, 4)))
+
+    assert PaperStore(str(tmp_path)).embedding_model() == 'hashing-4'
+    with pytest.raises(ValueError):
+        store.append(papers[:1], np.ones((1, 4)), model='text-embedding-3-small')
+
+
+def test_arxiv_ids_come_from_arxiv_urls_only(tmp_path):
+    store = PaperStore(str(tmp_path))
+    store.append([{'title': 'On arXiv', 'url': 'http://arxiv.org/abs/2308.09318v2'},
+                  {'title': 'On OpenReview', 'url': 'https://openreview.net/forum?id=abc123'},
+                  {'title': 'In PMLR', 'url': 'https://proceedings.mlr.press/v202/luo23a.html'},
+                  {'title': 'Resolved', 'url': 'https://openreview.net/forum?id=def', 'arxiv_id': '2105.05233v4'}])
+
+    assert [paper['arxiv_id'] for paper in store.records(['arxiv_id'])] == ['2308.09318', None, None, '2105.05233']
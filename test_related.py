@@ -0,0 +1,67 @@
+import json
+import os
+
+import numpy as np
+
+from embeddings import HashingEmbedder
+from paper_store import PaperStore
+from related import RelatedPapers, build, knn_graph, related_directory
+from vector_index import normalize
+
+
+def brute_force(matrix, k):
+    scores = matrix @ matrix.T
+    np.fill_diagonal(scores, -np.inf)
+    return np.argsort(-scores, axis=1, kind='stable')[:, :k]
+
+
+def test_blocked_graph_matches_brute_force_and_extends_incrementally():
+    matrix = normalize(np.random.default_rng(0).normal(size=(300, 16)))
+    expected = brute_force(matrix, 5)
+
+    neighbors, scores = knn_graph(matrix, 5, block_size=64)
+    assert neighbors.dtype == np.int32 and scores.dtype == np.float16
+    assert np.array_equal(neighbors, expected)
+
+    first, first_scores = knn_graph(matrix[:200], 5, block_size=64)
+    extended, _ = knn_graph(matrix, 5, 200, first, first_scores.astype(np.float32), block_size=64)
+    # float16 scores of the reused lists can only reorder or swap near-ties
+    overlap = np.mean([len(set(a) & set(b)) / 5 for a, b in zip(extended, expected)])
+    assert overlap > 0.99
+
+
+def test_tiny_corpus_pads_missing_neighbours():
+    neighbors, _ = knn_graph(normalize(np.eye(3)), 5)
+    assert (neighbors[:, 2:] == -1).all()
+    assert sorted(neighbors[0, :2]) == [1, 2]
+
+
+def test_build_store_related_papers_and_topics(tmp_path):
+    with open('papers_repository.json') as f:
+        papers = json.load(f)
+    vectors = HashingEmbedder(dim=128).embed_documents([f"{p['title']}\n{p['abstract']}" for p in papers])
+    directory = str(tmp_path / 'papers_store')
+    store = PaperStore(directory)
+    store.append(papers[:1000], vectors[:1000])
+
+    related = build(directory, k=8, n_topics=20)
+    assert len(related) == 1000 and len(related.labels) == 20
+    assert related.topic_sizes().sum() == 1000
+    # A reader holding the memory-mapped lists while they are rebuilt keeps seeing the old ones
+    serving = RelatedPapers.load(related_directory(directory))
+    served = np.array(serving.neighbors)
+
+    store.append(papers[1000:], vectors[1000:])
+    build(directory, k=8)
+    related = RelatedPapers.load(related_directory(directory))
+    assert np.array_equal(serving.neighbors, served)
+    assert not [name for name in os.listdir(related_directory(directory)) if name.endswith('.part')]
+
+    assert len(related) == len(papers)
+    assert len(related.labels) == 20
+    rows, scores = related.related(1200, k=3)
+    expected = brute_force(normalize(vectors), 3)[1200]
+    assert rows.tolist() == expected.tolist()
+    assert np.all(np.diff(scores) <= 0)
+    topic = related.topic_of(1200)
+    assert 1200 in related.members(topic)
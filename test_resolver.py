@@ -0,0 +1,75 @@
+import json
+import time
+
+from resolver import ArxivResolver, TitleIndex
+
+
+def arxiv_records():
+    with open('papers_repository.json') as f:
+        papers = json.load(f)
+    return [{'id': paper['url'].split('/')[-1], 'title': paper['title'], 'authors': paper['authors']}
+            for paper in papers]
+
+
+def test_resolves_noisy_titles_with_confidence(tmp_path):
+    records = arxiv_records()
+    resolver = ArxivResolver(TitleIndex.build(records), cache_path=str(tmp_path / 'cache.json'))
+    target = records[10]
+    papers = [
+        # AAAI-style entry: the first author is glued onto the title
+        {'title': target['title'].upper() + ' ' + target['authors'][0], 'authors': target['authors'][1:]},
+        {'title': 'An Entirely Unrelated Study of Medieval Pottery Glazes', 'authors': ['Nobody Known']},
+    ]
+
+    resolver.resolve_papers(papers)
+
+    assert papers[0]['arxiv_id'] == target['id']
+    assert papers[0]['url'] == f"http://arxiv.org/abs/{target['id']}"
+    assert papers[0]['match_confidence'] >= 0.85
+    assert papers[1]['arxiv_id'] is None
+
+    # The cache is persisted and reused without touching the index
+    cached = ArxivResolver(None, cache_path=str(tmp_path / 'cache.json'))
+    assert cached.resolve(papers[0]['title'], papers[0]['authors'])[0] == target['id']
+
+
+def test_threshold_changes_apply_to_cached_results():
+    records = arxiv_records()
+    resolver = ArxivResolver(TitleIndex.build(records), threshold=0.99)
+    target = records[10]
+    title = target['title'] + ' ' + target['authors'][0]
+
+    arxiv_id, confidence = resolver.resolve(title)
+    assert arxiv_id is None and confidence < 0.99
+
+    resolver.threshold = 0.85
+    assert resolver.resolve(title) == (target['id'], confidence)
+    resolver.threshold = 0.99
+    assert resolver.resolve(title)[0] is None
+
+
+def test_authors_are_part_of_the_cache_key():
+    records = arxiv_records()
+    resolver = ArxivResolver(TitleIndex.build(records))
+    target = records[10]
+
+    _, with_authors = resolver.resolve(target['title'], target['authors'])
+    _, with_others = resolver.resolve(target['title'], ['Nobody Known', 'Someone Else'])
+
+    assert with_authors > with_others
+    assert resolver.resolve(target['title'], target['authors'])[1] == with_authors
+
+
+def test_batch_resolution_is_fast(tmp_path):
+    records = arxiv_records()
+    index = TitleIndex.build(records)
+    index.save(str(tmp_path / 'titles.pkl'))
+    resolver = ArxivResolver(TitleIndex.load(str(tmp_path / 'titles.pkl')))
+
+    start = time.perf_counter()
+    results = resolver.resolve_many(records)
+    elapsed = time.perf_counter() - start
+
+    resolved = sum(arxiv_id == record['id'] for (arxiv_id, _), record in zip(results, records))
+    assert resolved / len(records) > 0.99
+    assert elapsed < 10
@@ -0,0 +1,127 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import metrics
+from scheduler import FetchScheduler, TokenBucket
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    '''Fails the first request to every path with a 503, then succeeds.'''
+
+    def do_GET(self):
+        with self.server.lock:
+            first = self.path not in self.server.seen
+            self.server.seen.add(self.path)
+        self.send_response(503 if first else 200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def flaky_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyHandler)
+    server.seen = set()
+    server.lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=50)
+    start = time.monotonic()
+    for _ in range(11):
+        bucket.acquire()
+    # The first token is available immediately, the other ten take 1/50 s each
+    assert time.monotonic() - start >= 0.18
+
+
+def test_map_preserves_order_and_bounds_concurrency():
+    scheduler = FetchScheduler(concurrency=3)
+    lock = threading.Lock()
+    in_flight = []
+    peak = []
+
+    def work(item):
+        with lock:
+            in_flight.append(item)
+            peak.append(len(in_flight))
+        time.sleep(0.01)
+        with lock:
+            in_flight.remove(item)
+        return item * 2
+
+    assert scheduler.map(work, range(12)) == [item * 2 for item in range(12)]
+    assert max(peak) <= 3
+
+
+def test_get_retries_without_blocking_other_requests(flaky_server):
+    scheduler = FetchScheduler(concurrency=4, retry_delay=0.05)
+    base = f'http://127.0.0.1:{flaky_server.server_port}'
+
+    host = f'127.0.0.1:{flaky_server.server_port}'
+    start = time.monotonic()
+    responses = scheduler.map(scheduler.get, [f'{base}/{n}' for n in range(4)])
+
+    assert [response.status_code for response in responses] == [200] * 4
+    # Each request backs off once; run concurrently the backoffs overlap
+    assert time.monotonic() - start < 4 * 0.05
+    assert metrics.counter('http_requests_total', host=host).value == 8
+    assert metrics.counter('http_retries_total', host=host).value == 4
+    assert metrics.counter('http_response_bytes_total', host=host).value == 8
+    assert metrics.histogram('http_request_seconds', host=host).count == 8
+    assert metrics.gauge('fetch_queue_depth').value == 0
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    '''Answers /<status> with that status; 429s ask to retry at once and are answered only once.'''
+
+    def do_GET(self):
+        status = int(self.path.strip('/'))
+        with self.server.lock:
+            self.server.requests.append(status)
+            if status == 429 and self.server.requests.count(429) > 1:
+                status = 200
+        self.send_response(status)
+        if status == 429:
+            self.send_header('Retry-After', '0')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def status_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StatusHandler)
+    server.requests = []
+    server.lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_permanent_client_errors_are_not_retried(status_server):
+    # A long backoff would show up as a slow test: 429 must follow its Retry-After instead
+    scheduler = FetchScheduler(concurrency=1, retry_delay=10)
+    base = f'http://127.0.0.1:{status_server.server_port}'
+    start = time.monotonic()
+
+    assert scheduler.get(f'{base}/404') is None
+    assert scheduler.get(f'{base}/410') is None
+    assert scheduler.get(f'{base}/429').status_code == 200
+    assert time.monotonic() - start < 5
+    assert status_server.requests == [404, 410, 429, 429]
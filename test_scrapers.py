@@ -0,0 +1,111 @@
+import os
+
+import pytest
+
+from scrapers import CVFScraper, OpenReviewScraper, PMLRScraper, get_scraper
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def fixture_bytes(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as f:
+        return f.read()
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeScheduler:
+    '''Serves saved pages by URL; unknown URLs fail like an exhausted retry.'''
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requested = []
+
+    def get(self, url, **kwargs):
+        self.requested.append(url)
+        return FakeResponse(self.pages[url]) if url in self.pages else None
+
+    def map(self, func, items):
+        return [func(item) for item in items]
+
+
+class FakeFetcher:
+    def __init__(self, pages, records=None):
+        self.scheduler = FakeScheduler(pages)
+        self.records = records or {}
+        self.requested = []
+
+    def fetch_many(self, ids):
+        self.requested.append(list(ids))
+        results = {i: self.records[i] for i in ids if i in self.records}
+        return results, [i for i in ids if i not in self.records], []
+
+
+def test_cvf_pairs_titles_with_their_arxiv_links():
+    records = {'2308.09160': ('FedPerfix abstract.', ['Guangyu Sun']),
+               '2308.09318': ('Attack-tolerant abstract.', ['Sungwon Han', 'Sungwon Park'])}
+    fetcher = FakeFetcher({'cvf': fixture_bytes('cvf_iccv2023.html')}, records)
+    scraper = get_scraper('ICCV', fetcher)
+
+    assert isinstance(scraper, CVFScraper)
+    assert scraper.list_publications('cvf') == [
+        ('FedPerfix: Towards Partial Model Personalization of Vision Transformers in Federated Learning',
+         'http://arxiv.org/abs/2308.09160', '2308.09160'),
+        ('Towards Attack-tolerant Federated Learning via Critical Parameter Analysis',
+         'http://arxiv.org/abs/2308.09318', '2308.09318'),
+    ]
+    papers = scraper.get_publications('cvf')
+    assert [paper['abstract'] for paper in papers] == ['FedPerfix abstract.', 'Attack-tolerant abstract.']
+    assert papers[1]['authors'] == ['Sungwon Han', 'Sungwon Park']
+    assert fetcher.requested == [['2308.09160', '2308.09318']]
+
+
+def test_openreview_listing_carries_abstracts_and_authors():
+    fetcher = FakeFetcher({'https://openreview.net/group?id=ICLR.cc/2024/Conference':
+                           fixture_bytes('openreview_iclr2024.html')})
+    scraper = get_scraper('openreview', fetcher)
+    papers = scraper.get_publications('https://openreview.net/group?id=ICLR.cc/2024/Conference')
+
+    assert isinstance(scraper, OpenReviewScraper)
+    assert papers[0] == {'title': 'Sparse Autoencoders Find Interpretable Features',
+                         'url': 'https://openreview.net/forum?id=abc123',
+                         'abstract': 'We train sparse autoencoders on\nmodel activations and find interpretable features.',
+                         'authors': ['Ada Lovelace', 'Alan Turing'], 'arxiv_id': None,
+                         'conference': 'ICLR', 'year': 2024}
+    assert papers[1]['authors'] == ['Jörg Müller']
+    assert fetcher.requested == []
+
+
+def test_pmlr_fetches_abstract_pages():
+    fetcher = FakeFetcher({'https://proceedings.mlr.press/v202/': fixture_bytes('pmlr_v202.html'),
+                           'https://proceedings.mlr.press/v202/luo23a.html': fixture_bytes('pmlr_abs_luo23a.html')})
+    scraper = get_scraper('icml', fetcher, num_papers_to_scrape=None)
+    papers = scraper.get_publications('https://proceedings.mlr.press/v202/')
+
+    assert isinstance(scraper, PMLRScraper)
+    assert (papers[0]['conference'], papers[0]['year']) == ('ICML', None)
+    assert papers[0]['authors'] == ['Yicheng Luo', 'Zhengyao Jiang', 'Samuel Cohen']
+    assert papers[0]['abstract'].startswith('With the advent of large datasets')
+    # Relative abs links resolve against the volume URL; a failed page leaves the abstract empty
+    assert papers[1]['url'] == 'https://proceedings.mlr.press/v202/hopper23a.html'
+    assert papers[1]['abstract'] is None
+
+
+def test_unknown_conference_is_rejected():
+    with pytest.raises(ValueError, match='neurips'):
+        get_scraper('neurips', FakeFetcher({}))
+
+
+def test_legacy_scrape_arxiv_papers_fetches_the_page_through_the_scheduler():
+    from scraper import scrape_arxiv_papers
+
+    records = {'2308.09160': ('FedPerfix abstract.', ['Guangyu Sun'])}
+    fetcher = FakeFetcher({'cvf': fixture_bytes('cvf_iccv2023.html')}, records)
+    papers = scrape_arxiv_papers('cvf', existing_papers={'2308.09318'}, fetcher=fetcher)
+
+    assert fetcher.scheduler.requested == ['cvf']
+    assert [paper['arxiv_id'] for paper in papers] == ['2308.09160']
+    assert scrape_arxiv_papers('missing', fetcher=fetcher) == []
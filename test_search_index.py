@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+from search_index import SearchIndex, load_or_build, normalize_author
+
+PAPERS = [
+    {'title': 'Neural Radiance Fields for Scenes', 'abstract': 'We render scenes with radiance fields.',
+     'authors': ['Ben Mildenhall']},
+    {'title': 'Fields of Neural Experts', 'abstract': 'Radiance is not neural here.',
+     'authors': ['José Müller']},
+    {'title': 'Diffusion Models Beat GANs', 'abstract': 'Diffusion models for image synthesis.',
+     'authors': ['Prafulla Dhariwal', 'Alex Nichol']},
+]
+
+
+def ids(index, query):
+    return index.search(query)[0].tolist()
+
+
+def test_ranked_and_all_terms_required():
+    index = SearchIndex.build(PAPERS)
+    assert ids(index, 'neural radiance ')[0] == 0
+    assert set(ids(index, 'neural radiance ')) == {0, 1}
+    assert ids(index, 'diffusion gans ') == [2]
+
+
+def test_prefix_and_phrase_queries():
+    index = SearchIndex.build(PAPERS)
+    assert ids(index, 'diffus') == [2]          # last word is a prefix while typing
+    assert ids(index, 'diffus ') == []          # a finished word must match exactly
+    assert ids(index, 'synth*  ') == [2]
+    assert ids(index, '"neural radiance"') == [0]
+
+
+def test_any_mode_ranks_documents_matching_some_terms():
+    index = SearchIndex.build(PAPERS)
+    # No paper has all three terms; the one matching two ranks above the ones matching one
+    assert ids(index, 'diffusion gans radiance') == []
+    doc_ids, scores = index.search('diffusion gans radiance', mode='any')
+    assert doc_ids.tolist()[0] == 2
+    assert set(doc_ids.tolist()) == {0, 1, 2}
+    assert list(scores) == sorted(scores, reverse=True)
+    # No typeahead: a last word is a complete term unless it ends in *
+    assert index.search('diffus', mode='any')[0].tolist() == []
+    assert index.search('diffus*', mode='any')[0].tolist() == [2]
+    with pytest.raises(ValueError):
+        index.search('diffusion', mode='most')
+
+
+def test_author_names_are_normalized():
+    index = SearchIndex.build(PAPERS)
+    assert normalize_author('  José  Müller ') == 'jose muller'
+    assert ids(index, 'muller') == [1]
+    assert ids(index, 'Müller') == [1]
+
+
+def test_load_or_build_persists_next_to_source(tmp_path):
+    source = tmp_path / 'papers.json'
+    source.write_text(json.dumps(PAPERS))
+    calls = []
+
+    def load_papers():
+        calls.append(1)
+        return PAPERS
+
+    load_or_build(str(source), load_papers)
+    index = load_or_build(str(source), load_papers)
+
+    assert (tmp_path / 'papers.json.index.pkl').exists()
+    assert len(calls) == 1
+    assert ids(index, 'gans') == [2]
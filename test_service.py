@@ -0,0 +1,128 @@
+import asyncio
+import warnings
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from embeddings import HashingEmbedder
+from search_index import SearchIndex
+from shards import ShardedSink
+from service import LRUCache, QueryService, create_app
+
+PAPERS = [
+    {'title': 'Neural Radiance Fields for Scenes', 'abstract': 'We render scenes with radiance fields.',
+     'authors': ['Ben Mildenhall'], 'url': 'http://arxiv.org/abs/2003.08934'},
+    {'title': 'Diffusion Models Beat GANs', 'abstract': 'Diffusion models for image synthesis.',
+     'authors': ['Prafulla Dhariwal'], 'url': 'http://arxiv.org/abs/2105.05233'},
+    {'title': 'Denoising Diffusion Probabilistic Models', 'abstract': 'Image synthesis with diffusion models.',
+     'authors': ['Jonathan Ho'], 'url': 'http://arxiv.org/abs/2006.11239'},
+]
+
+
+class CountingEmbedder(HashingEmbedder):
+    def __init__(self):
+        super().__init__(dim=64)
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        return super().embed_documents(texts)
+
+
+def make_service(embedder, **kwargs):
+    vectors = HashingEmbedder(dim=64).embed_documents([f"{p['title']}\n{p['abstract']}" for p in PAPERS])
+    return QueryService(PAPERS, SearchIndex.build(PAPERS), vectors, embedder, max_delay=0.05, **kwargs)
+
+
+def run(scenario, service):
+    async def main():
+        async with TestClient(TestServer(create_app(service))) as client:
+            return await scenario(client)
+    return asyncio.run(main())
+
+
+def test_endpoints_and_metrics():
+    async def scenario(client):
+        search = await (await client.get('/search', params={'q': 'radiance'})).json()
+        semantic = await (await client.get('/semantic', params={'q': 'diffusion image synthesis', 'k': 2})).json()
+        similar = await (await client.get('/similar/2105.05233', params={'k': 1})).json()
+        hybrid = await (await client.get('/hybrid', params={'q': 'radiance scenes', 'k': 2})).json()
+        missing = await client.get('/similar/0000.00000')
+        bad = await client.get('/search')
+        metrics = await (await client.get('/metrics')).json()
+        prometheus = await (await client.get('/metrics', params={'format': 'prometheus'})).text()
+        return search, semantic, similar, hybrid, missing.status, bad.status, metrics, prometheus
+
+    search, semantic, similar, hybrid, missing, bad, metrics, prometheus = run(scenario, make_service(CountingEmbedder()))
+
+    assert [hit['arxiv_id'] for hit in search['results']] == ['2003.08934']
+    assert {hit['arxiv_id'] for hit in semantic['results']} == {'2105.05233', '2006.11239'}
+    assert [hit['arxiv_id'] for hit in similar['results']] == ['2006.11239']
+    assert hybrid['results'][0]['arxiv_id'] == '2003.08934'
+    assert hybrid['timings']['total_ms'] > 0
+    assert 'abstract' not in search['results'][0]
+    assert (missing, bad) == (404, 400)
+    assert metrics['latency']['/search']['count'] == 2
+    assert metrics['latency']['/semantic']['p99_ms'] >= metrics['latency']['/semantic']['p50_ms'] > 0
+    assert '# TYPE http_server_seconds histogram' in prometheus
+    assert 'http_server_seconds_count{endpoint="/search"}' in prometheus
+
+
+def test_concurrent_queries_share_embedding_batches_and_caches():
+    embedder = CountingEmbedder()
+    service = make_service(embedder)
+    queries = ['diffusion', 'radiance fields', 'gans', 'image synthesis']
+
+    async def scenario(client):
+        async def semantic(query):
+            response = await client.get('/semantic', params={'q': query})
+            return (await response.json())['results']
+        first = await asyncio.gather(*(semantic(query) for query in queries))
+        again = await asyncio.gather(*(semantic(query) for query in queries))
+        return first, again
+
+    first, again = run(scenario, service)
+
+    assert first == again
+    assert len(embedder.batches) == 1
+    assert sorted(embedder.batches[0]) == sorted(queries)
+    assert service.results.stats()['hits'] == len(queries)
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+
+
+def test_refuses_a_query_embedder_other_than_the_stored_model():
+    make_service(CountingEmbedder(), embedding_model='hashing-64')
+    with pytest.raises(ValueError, match='text-embedding-3-small'):
+        make_service(CountingEmbedder(), embedding_model='text-embedding-3-small')
+    # Without a recorded model, the dimension still has to match
+    with pytest.raises(ValueError, match='dimensions'):
+        make_service(HashingEmbedder(dim=32))
+
+
+def test_app_state_uses_typed_keys():
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        create_app(make_service(CountingEmbedder()))
+
+
+def test_loads_a_shard_directory(tmp_path):
+    sink = ShardedSink(str(tmp_path / 'shards'), 'iccv', shard_size=2)
+    sink.write(PAPERS)
+
+    service = QueryService.load(str(tmp_path / 'shards'), HashingEmbedder(dim=64))
+
+    assert [paper['arxiv_id'] for paper in service.papers] == ['2003.08934', '2105.05233', '2006.11239']
+    assert service.vectors.shape == (3, 64)
+    assert [hit['arxiv_id'] for hit in service.keyword('radiance', 10)] == ['2003.08934']
+    (tmp_path / 'empty').mkdir()
+    with pytest.raises(ValueError, match='neither'):
+        QueryService.load(str(tmp_path / 'empty'))
@@ -0,0 +1,125 @@
+import gzip
+import json
+import os
+
+import pytest
+
+import shards
+from crawl import CrawlManifest, crawl_incremental
+from paper_store import read_legacy_papers
+from shards import ShardedSink, ShardManifest, read_papers, read_shard
+from test_crawl import RECORDS, FakeFetcher, FakeScraper
+
+PAPERS = [{'title': f'Paper {n}', 'url': f'http://arxiv.org/abs/{n}', 'abstract': 'Abstract',
+           'authors': ['A. Author']} for n in range(7)]
+
+
+def test_sink_writes_compressed_shards_with_manifest(tmp_path):
+    sink = ShardedSink(str(tmp_path), 'iccv', shard_size=3, chunk_size=2, batch='20261017T120000Z')
+    assert sink.write(iter(PAPERS)) == 7
+
+    manifest = ShardManifest(str(tmp_path))
+    assert [shard['path'] for shard in manifest.shards] == [
+        'iccv/20261017T120000Z-00000.jsonl.gz', 'iccv/20261017T120000Z-00001.jsonl.gz',
+        'iccv/20261017T120000Z-00002.jsonl.gz']
+    assert [shard['records'] for shard in manifest.shards] == [3, 3, 1]
+    assert [shard['sequence'] for shard in manifest.shards] == [1, 2, 3]
+    assert manifest.records() == 7
+    with gzip.open(tmp_path / 'iccv' / '20261017T120000Z-00000.jsonl.gz', 'rt') as f:
+        assert json.loads(f.readline()) == PAPERS[0]
+    assert list(read_papers(str(tmp_path))) == PAPERS
+    assert not [name for name in os.listdir(tmp_path / 'iccv') if name.endswith('.part')]
+
+
+def test_since_returns_only_new_shards(tmp_path):
+    ShardedSink(str(tmp_path), 'iccv', shard_size=5, batch='20261017T120000Z').write(PAPERS)
+    first_sync = ShardManifest(str(tmp_path)).shards[-1]['sequence']
+    ShardedSink(str(tmp_path), 'iclr', shard_size=5, compression='none', batch='20261018T090000Z').write(PAPERS[:2])
+
+    manifest = ShardManifest(str(tmp_path))
+    assert [shard['path'] for shard in manifest.since(first_sync)] == ['iclr/20261018T090000Z-00000.jsonl']
+    assert list(read_papers(str(tmp_path), since=first_sync)) == PAPERS[:2]
+    assert list(read_papers(str(tmp_path), conference='iccv')) == PAPERS
+    assert manifest.since('2000-01-01') == manifest.shards
+    assert manifest.since('2999-01-01T00:00:00+00:00') == []
+
+
+def test_repeated_batch_id_does_not_overwrite_shards(tmp_path):
+    for _ in range(2):
+        ShardedSink(str(tmp_path), 'iccv', shard_size=5, batch='20261017T120000Z').write(PAPERS[:2])
+    assert len(ShardManifest(str(tmp_path)).shards) == 2
+    assert list(read_papers(str(tmp_path))) == PAPERS[:2] * 2
+
+
+def test_unfinished_shard_stays_invisible_and_checksums_are_verified(tmp_path):
+    sink = ShardedSink(str(tmp_path), 'iccv', shard_size=5)
+    sink.write_chunk(PAPERS[:2])
+    assert ShardManifest(str(tmp_path)).shards == []
+    sink.close()
+
+    shard = ShardManifest(str(tmp_path)).shards[0]
+    with open(tmp_path / shard['path'], 'ab') as f:
+        f.write(b'garbage')
+    with pytest.raises(ValueError, match='Checksum mismatch'):
+        read_shard(str(tmp_path), shard)
+
+
+def test_incremental_crawl_writes_one_shard_per_batch(tmp_path):
+    sink = ShardedSink(str(tmp_path), 'iccv', shard_size=100)
+    scraper = FakeScraper(FakeFetcher(RECORDS), ['0', '1', '2', 'x'])
+    assert crawl_incremental(scraper, 'url', sink, CrawlManifest(tmp_path / 'crawl.jsonl'), batch_size=2) == 3
+
+    assert [shard['records'] for shard in ShardManifest(str(tmp_path)).shards] == [2, 1]
+    assert [paper['url'] for paper in read_legacy_papers(str(tmp_path))] == [
+        'http://arxiv.org/abs/0', 'http://arxiv.org/abs/1', 'http://arxiv.org/abs/2']
+
+
+def test_unknown_compression_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        ShardedSink(str(tmp_path), 'iccv', compression='lzma')
+
+
+def test_sinks_of_two_conferences_share_one_manifest(tmp_path):
+    iccv = ShardedSink(str(tmp_path), 'iccv', shard_size=2)
+    iclr = ShardedSink(str(tmp_path), 'iclr', shard_size=2)
+
+    # Both sinks loaded the manifest before either wrote to it
+    iccv.write_chunk(PAPERS[:2])
+    iclr.write_chunk(PAPERS[2:4])
+    iccv.write_chunk(PAPERS[4:6])
+    iclr.close()
+    iccv.close()
+
+    manifest = ShardManifest(str(tmp_path))
+    assert [(shard['conference'], shard['sequence']) for shard in manifest.shards] == [
+        ('iccv', 1), ('iclr', 2), ('iccv', 3)]
+    assert list(read_papers(str(tmp_path), conference='iccv')) == PAPERS[:2] + PAPERS[4:6]
+    assert list(read_papers(str(tmp_path), since=1)) == PAPERS[2:6]
+
+
+def test_resumed_crawl_reads_only_shards_added_since_the_last_batch(tmp_path, monkeypatch):
+    manifest_path = tmp_path / 'crawl.jsonl'
+    sink = ShardedSink(str(tmp_path), 'iccv', shard_size=100)
+    crawl_incremental(FakeScraper(FakeFetcher(RECORDS), ['0', '1']), 'url', sink, CrawlManifest(manifest_path),
+                      batch_size=1)
+    assert CrawlManifest(manifest_path).position == 2
+
+    def crash(self, statuses, position=None):
+        raise KeyboardInterrupt
+    # The shard of paper 2 is written, then the process dies before the crawl manifest records it
+    with monkeypatch.context() as patch:
+        patch.setattr(CrawlManifest, 'record', crash)
+        with pytest.raises(KeyboardInterrupt):
+            crawl_incremental(FakeScraper(FakeFetcher(RECORDS), ['0', '1', '2', '3']), 'url',
+                              ShardedSink(str(tmp_path), 'iccv'), CrawlManifest(manifest_path), batch_size=1)
+
+    read = []
+    monkeypatch.setattr(shards, 'read_shard', lambda directory, shard, verify=True: read.append(shard['sequence'])
+                        or read_shard(directory, shard, verify))
+    fetcher = FakeFetcher(RECORDS)
+    crawl_incremental(FakeScraper(fetcher, ['0', '1', '2', '3']), 'url', ShardedSink(str(tmp_path), 'iccv'),
+                      CrawlManifest(manifest_path), batch_size=1)
+
+    assert read == [3]
+    assert fetcher.requested == [['3']]
+    assert [paper['url'][-1] for paper in read_papers(str(tmp_path))] == ['0', '1', '2', '3']
@@ -0,0 +1,46 @@
+import csv
+import json
+
+from sinks import CSVSink, JSONLSink, JSONSink
+
+PAPERS = [{'title': f'Paper {n}', 'url': f'http://arxiv.org/abs/{n}', 'abstract': 'Line one\nline two',
+           'authors': ['A. Author', 'B. Author']} for n in range(5)]
+
+
+def test_json_sink_matches_json_dump(tmp_path):
+    path = tmp_path / 'papers.json'
+
+    assert JSONSink(path, chunk_size=2).write(iter(PAPERS)) == 5
+
+    assert path.read_text() == json.dumps(PAPERS, indent=4)
+    JSONSink(path).write([])
+    assert json.loads(path.read_text()) == []
+
+
+def test_jsonl_sink_writes_chunks_while_stream_is_running(tmp_path):
+    path = tmp_path / 'papers.jsonl'
+    lines_seen = []
+
+    def stream():
+        for paper in PAPERS:
+            with open(path) as f:
+                lines_seen.append(len(f.readlines()))
+            yield paper
+
+    JSONLSink(path, chunk_size=2).write(stream())
+
+    # Each chunk of two is on disk before the next paper is produced
+    assert lines_seen == [0, 0, 2, 2, 4]
+    assert [json.loads(line) for line in path.read_text().splitlines()] == PAPERS
+
+
+def test_csv_sink_appends_without_repeating_header(tmp_path):
+    path = tmp_path / 'papers.csv'
+
+    CSVSink(path).write(PAPERS[:2])
+    CSVSink(path, append=True).write(PAPERS[2:])
+
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert [row['title'] for row in rows] == [paper['title'] for paper in PAPERS]
+    assert rows[0]['authors'] == "['A. Author', 'B. Author']"
@@ -0,0 +1,31 @@
+import json
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+HEAVY_MODULES = ['pandas', 'firebase_admin', 'weaviate', 'langchain', 'pdfplumber', 'PyPDF2', 'requests', 'bs4']
+
+
+def loaded_modules(code):
+    result = subprocess.run([sys.executable, '-c', code + '\nimport json, sys; print(json.dumps(sorted(sys.modules)))'],
+                            cwd=HERE, capture_output=True, text=True, check=True)
+    return set(json.loads(result.stdout.splitlines()[-1]))
+
+
+def test_cli_import_skips_heavy_dependencies():
+    modules = loaded_modules('import cli')
+    assert not [name for name in HEAVY_MODULES if name in modules]
+
+
+def test_storage_modules_import_lazily():
+    modules = loaded_modules('import storage, store, aaai_parser, scraper, fetchers')
+    assert not [name for name in ['pandas', 'firebase_admin', 'weaviate', 'langchain', 'pdfplumber', 'PyPDF2']
+                if name in modules]
+
+
+def test_cli_help_runs():
+    result = subprocess.run([sys.executable, 'cli.py', '--help'], cwd=HERE, capture_output=True, text=True)
+    assert result.returncode == 0
+    assert '--conference' in result.stdout
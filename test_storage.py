@@ -0,0 +1,123 @@
+import threading
+
+import pytest
+
+from google.api_core.exceptions import InvalidArgument
+
+from storage import FirebaseDAL
+from store import EmbeddingStorage
+
+
+class FakeFirestore:
+    '''Just enough of a Firestore client: a batch fails if it holds a 'bad' paper.'''
+
+    def __init__(self):
+        self.documents = {}
+        self.commits = 0
+        self.lock = threading.Lock()
+
+    def collection(self, name):
+        return self
+
+    def document(self, document_id):
+        return document_id
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+
+class FakeWriteBatch:
+    def __init__(self, db):
+        self.db = db
+        self.writes = {}
+
+    def set(self, ref, data):
+        self.writes[ref] = data
+
+    def commit(self):
+        with self.db.lock:
+            self.db.commits += 1
+        if any(paper.get('bad') for paper in self.writes.values()):
+            raise InvalidArgument('invalid document')
+        with self.db.lock:
+            self.db.documents.update(self.writes)
+
+
+class FakeWeaviateBatch:
+    '''Flushes every batch_size objects; objects without a title are rejected.'''
+
+    def __init__(self):
+        self.flushes = []
+        self.objects = {}
+
+    def configure(self, batch_size, num_workers, dynamic, callback):
+        self.batch_size = batch_size
+        self.callback = callback
+
+    def __enter__(self):
+        self.pending = []
+        return self
+
+    def add_data_object(self, data_object, class_name, uuid=None, vector=None):
+        self.pending.append((uuid, data_object, vector))
+        if len(self.pending) == self.batch_size:
+            self.flush()
+
+    def flush(self):
+        results = []
+        for uuid, data_object, vector in self.pending:
+            if data_object['title']:
+                self.objects[uuid] = (data_object, vector)
+                results.append({'id': uuid, 'result': {}})
+            else:
+                results.append({'id': uuid, 'result': {'errors': {'error': [{'message': 'empty title'}]}}})
+        self.flushes.append(len(self.pending))
+        self.pending = []
+        self.callback(results)
+
+    def __exit__(self, *exc_info):
+        if self.pending:
+            self.flush()
+
+
+def make_papers(n):
+    return [{'arxiv_id': str(i), 'title': f'Paper {i}', 'url': f'http://arxiv.org/abs/{i}', 'abstract': 'A'}
+            for i in range(n)]
+
+
+def test_firebase_store_papers_batches_and_isolates_failures():
+    dal = FirebaseDAL.__new__(FirebaseDAL)
+    dal.db = FakeFirestore()
+    papers = make_papers(1200)
+    papers[700]['bad'] = True
+
+    failures = dal.store_papers(papers, max_retries=1)
+
+    assert [paper['arxiv_id'] for paper, _ in failures] == ['700']
+    assert isinstance(failures[0][1], InvalidArgument)
+    assert len(dal.db.documents) == 1199
+    # Three batches of at most 500, plus the bisection of the failing one
+    assert dal.db.commits < 3 + 2 * 10
+
+
+def test_firebase_store_papers_needs_at_least_one_attempt():
+    dal = FirebaseDAL.__new__(FirebaseDAL)
+    dal.db = FakeFirestore()
+    with pytest.raises(ValueError, match='max_retries'):
+        dal.store_papers(make_papers(3), max_retries=0)
+    assert dal.db.commits == 0
+
+
+def test_weaviate_store_papers_uses_batches_and_retries_failures():
+    storage = EmbeddingStorage.__new__(EmbeddingStorage)
+    storage.client = type('FakeClient', (), {})()
+    storage.client.batch = FakeWeaviateBatch()
+    papers = make_papers(250)
+    papers[3]['title'] = ''
+
+    failures = storage.store_papers(papers, [[0.1, 0.2]] * 250, batch_size=100, max_retries=2)
+
+    assert [paper['arxiv_id'] for paper, _ in failures] == ['3']
+    assert len(storage.client.batch.objects) == 249
+    # 250 objects in three requests, then one retry per attempt for the bad one
+    assert storage.client.batch.flushes == [100, 100, 50, 1]
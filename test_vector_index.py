@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from storage import LocalVectorDAL
+from vector_index import IVFIndex, normalize, top_k
+
+
+def make_papers(n, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    papers = [{'arxiv_id': str(i), 'title': f'Paper {i}', 'conference': 'ICCV' if i % 2 else 'CVPR',
+               'year': 2023 if i % 3 else 2022, 'embedding': vectors[i].tolist()} for i in range(n)]
+    return papers, vectors
+
+
+def test_top_k_matches_full_sort():
+    _, vectors = make_papers(500)
+    matrix = normalize(vectors)
+    query = normalize(vectors[7])
+
+    rows, scores = top_k(matrix, query, 10)
+
+    expected = np.argsort(-(matrix @ query))[:10]
+    assert rows.tolist() == expected.tolist()
+    assert rows[0] == 7 and scores[0] == pytest.approx(1.0)
+
+
+def test_store_reopen_and_filter(tmp_path):
+    papers, vectors = make_papers(60)
+    dal = LocalVectorDAL(str(tmp_path))
+    dal.store_papers(papers[:40])
+    # Papers without vectors get them afterwards, in order
+    dal.store_papers([{k: v for k, v in paper.items() if k != 'embedding'} for paper in papers[40:]])
+    dal.store_embeddings(vectors[40:])
+
+    reopened = LocalVectorDAL(str(tmp_path))
+    assert isinstance(reopened.matrix, np.memmap)
+    assert reopened.search_vector(vectors[45], k=1)[0]['arxiv_id'] == '45'
+
+    results = reopened.search_vector(vectors[45], k=5, conference='CVPR', year=2022)
+    assert results and all(r['conference'] == 'CVPR' and r['year'] == 2022 for r in results)
+    assert [r['score'] for r in results] == sorted((r['score'] for r in results), reverse=True)
+
+
+def test_store_embeddings_rejects_extra_vectors(tmp_path):
+    papers, vectors = make_papers(3)
+    dal = LocalVectorDAL(str(tmp_path))
+    dal.store_papers(papers)
+
+    with pytest.raises(ValueError):
+        dal.store_embeddings(vectors[:1])
+
+
+def test_ivf_index_recall_and_appends(tmp_path):
+    papers, vectors = make_papers(2000)
+    dal = LocalVectorDAL(str(tmp_path), n_probe=8)
+    dal.store_papers(papers[:1500])
+    dal.build_index(n_lists=20)
+    dal.store_papers(papers[1500:])  # Appended rows join the existing lists
+    assert isinstance(IVFIndex.load(dal.index_path), IVFIndex)
+    assert len(dal.index.assignments) == 2000
+
+    hits = 0
+    for query in vectors[:50]:
+        exact = {r['arxiv_id'] for r in dal.search_vector(query, k=10)}
+        approx = {r['arxiv_id'] for r in dal.search_vector(query, k=10, approximate=True)}
+        hits += len(exact & approx)
+    assert hits / 500 > 0.5
@@ -0,0 +1,99 @@
+'''Nearest-neighbour search over float32 embedding matrices with NumPy.
+
+Vectors are expected to be L2-normalised so that the dot product is the
+cosine similarity. ``top_k`` does exact search with one matrix-vector
+product and ``argpartition``; ``IVFIndex`` is an inverted-file index that
+only scores the vectors in the clusters closest to the query, trading a
+little recall for speed on large corpora.
+'''
+import numpy as np
+
+
+def normalize(vectors):
+    '''Returns float32 copies of ``vectors`` scaled to unit length.'''
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def top_k(matrix, query, k, rows=None):
+    '''Exact top-k by cosine similarity.
+
+    ``rows`` optionally restricts the search to those row numbers. Returns
+    ``(row numbers, scores)`` sorted by decreasing score.
+    '''
+    candidates = matrix if rows is None else matrix[rows]
+    if len(candidates) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    scores = candidates @ query
+    k = min(k, len(scores))
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best])]
+    ids = best if rows is None else np.asarray(rows)[best]
+    return ids, scores[best]
+
+
+def kmeans(vectors, n_clusters, iterations=10, seed=0):
+    '''Spherical k-means; returns unit-length centroids.'''
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        for cluster in range(n_clusters):
+            members = vectors[assignments == cluster]
+            if len(members):
+                centroids[cluster] = members.sum(axis=0)
+        centroids = normalize(centroids)
+    return centroids
+
+
+class IVFIndex:
+    '''Inverted-file index: vectors are bucketed by their nearest centroid.'''
+
+    def __init__(self, centroids, assignments):
+        self.centroids = centroids
+        self._set_assignments(assignments)
+
+    def _set_assignments(self, assignments):
+        self.assignments = assignments
+        order = np.argsort(assignments, kind='stable')
+        bounds = np.searchsorted(assignments[order], np.arange(len(self.centroids) + 1))
+        self.lists = [order[bounds[c]:bounds[c + 1]] for c in range(len(self.centroids))]
+
+    @classmethod
+    def build(cls, matrix, n_lists=None, sample_size=50000, seed=0):
+        '''Trains centroids on a sample of ``matrix`` and assigns every row.'''
+        n_lists = n_lists or max(1, int(np.sqrt(len(matrix))))
+        rng = np.random.default_rng(seed)
+        sample = matrix if len(matrix) <= sample_size else matrix[rng.choice(len(matrix), sample_size, replace=False)]
+        centroids = kmeans(np.asarray(sample), n_lists, seed=seed)
+        return cls(centroids, cls.assign(matrix, centroids))
+
+    @staticmethod
+    def assign(matrix, centroids, block_size=65536):
+        '''Nearest centroid per row, computed block by block to bound memory.'''
+        return np.concatenate([np.argmax(matrix[start:start + block_size] @ centroids.T, axis=1)
+                               for start in range(0, len(matrix), block_size)] or [np.empty(0, dtype=np.int64)])
+
+    def add(self, matrix, start):
+        '''Assigns rows ``start:`` of ``matrix`` that were appended after the build.'''
+        new = self.assign(matrix[start:], self.centroids)
+        self._set_assignments(np.concatenate([self.assignments, new]))
+
+    def search(self, matrix, query, k, n_probe=8, mask=None):
+        '''Approximate top-k over the ``n_probe`` lists closest to ``query``.'''
+        n_probe = min(n_probe, len(self.centroids))
+        probed = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+        rows = np.sort(np.concatenate([self.lists[c] for c in probed]))
+        if mask is not None:
+            rows = rows[mask[rows]]
+        return top_k(matrix, query, k, rows)
+
+    def save(self, path):
+        np.savez(path, centroids=self.centroids, assignments=self.assignments)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data['centroids'], data['assignments'])